@@ -63,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'sales.profiling.QueryProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'ecommerce_dashboard.urls'
@@ -144,6 +145,55 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'purge-export-jobs': {
+        'task': 'sales.tasks.purge_export_jobs_task',
+        'schedule': 60 * 60,
+    },
+    'create-partitions': {
+        'task': 'sales.tasks.create_partitions_task',
+        'schedule': 24 * 60 * 60,
+    },
+}
+
+# Cache (shared by web and worker processes, so imports can invalidate it)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('REDIS_URL', default=CELERY_BROKER_URL),
+    }
+}
+SUMMARY_METRICS_CACHE_TIMEOUT = config('SUMMARY_METRICS_CACHE_TIMEOUT', default=300, cast=int)
+# GET responses of the dashboard endpoints (monthly, summary metrics and the first
+# RESPONSE_CACHE_MAX_PAGE pages of orders) are cached until the next import commits.
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=60 * 60, cast=int)
+RESPONSE_CACHE_MAX_PAGE = config('RESPONSE_CACHE_MAX_PAGE', default=3, cast=int)
+
+# Order export jobs: identical requests within EXPORT_JOB_TTL seconds reuse the same
+# artifact, and jobs are purged after EXPORT_JOB_RETENTION seconds.
+EXPORT_JOB_TTL = config('EXPORT_JOB_TTL', default=15 * 60, cast=int)
+EXPORT_JOB_RETENTION = config('EXPORT_JOB_RETENTION', default=24 * 60 * 60, cast=int)
+
+# orders and order_items are partitioned by month of order_date; partitions are
+# created daily up to PARTITION_MONTHS_AHEAD months ahead.
+PARTITION_MONTHS_AHEAD = config('PARTITION_MONTHS_AHEAD', default=3, cast=int)
+
+# Engine of the monthly, summary metrics and time series endpoints: 'sql' queries
+# PostgreSQL, 'duckdb' (requires the duckdb package) scans a columnar Parquet snapshot
+# of the order lines in ANALYTICS_SNAPSHOT_DIR, refreshed after each import.
+ANALYTICS_ENGINE = config('ANALYTICS_ENGINE', default='sql')
+ANALYTICS_SNAPSHOT_DIR = config('ANALYTICS_SNAPSHOT_DIR', default=os.path.join(BASE_DIR, 'analytics'))
+
+# summary-metrics?approx=true estimates the metrics from a sample of about
+# APPROX_SAMPLE_ROWS order lines, whatever the number of orders matched.
+APPROX_SAMPLE_ROWS = config('APPROX_SAMPLE_ROWS', default=50000, cast=int)
+
+# Query profiling of the sales API (Server-Timing headers and /api/metrics/). Each
+# process keeps the last QUERY_PROFILING_WINDOW requests per view, and requests
+# running more than QUERY_PROFILING_MAX_QUERIES queries are logged.
+QUERY_PROFILING = config('QUERY_PROFILING', default=False, cast=bool)
+QUERY_PROFILING_WINDOW = config('QUERY_PROFILING_WINDOW', default=1000, cast=int)
+QUERY_PROFILING_MAX_QUERIES = config('QUERY_PROFILING_MAX_QUERIES', default=50, cast=int)
 
 # setry
 SENTRY_DSN = config('SENTRY_DSN')
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from sales.models import Order, OrderItem, Delivery, Platform, Customer, Product
+from sales.models import (Order, OrderItem, Delivery, Platform, Customer, Product,
+                          MonthlySalesRollup, ExportJob, ImportCheckpoint)
 
 # Register your models here.
 admin.site.register(Order)
@@ -8,3 +9,6 @@ admin.site.register(Delivery)
 admin.site.register(Platform)
 admin.site.register(Customer)
 admin.site.register(Product)
+admin.site.register(MonthlySalesRollup)
+admin.site.register(ExportJob)
+admin.site.register(ImportCheckpoint)
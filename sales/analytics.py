@@ -0,0 +1,613 @@
+import json
+import logging
+import math
+import os
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from sales.cache import bump_data_version
+from sales.filters import OrderFilter
+from sales.models import MonthlySalesRollup, Order, OrderLine
+from sales.partitions import add_months
+from sales.utils import normalize_state
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Time series buckets and the field of each group_by dimension
+TIMESERIES_GRANULARITIES = ('day', 'week', 'month', 'quarter')
+TIMESERIES_GROUP_BY = {
+    'platform': 'platform__platform_name',
+    'category': 'order_items__product__category',
+    'delivery_status': 'delivery__delivery_status',
+}
+
+# Columns of the order lines snapshot, with their DuckDB types
+SNAPSHOT_COLUMNS = {
+    'order_item_id': 'BIGINT',
+    'order_id': 'VARCHAR',
+    'order_date': 'DATE',
+    'platform_name': 'VARCHAR',
+    'product_id': 'VARCHAR',
+    'category': 'VARCHAR',
+    'quantity_sold': 'INTEGER',
+    'total_sale_value': 'DECIMAL(12, 2)',
+    'delivery_status': 'VARCHAR',
+    'delivery_state': 'VARCHAR',
+}
+
+# Snapshot column of each group_by dimension
+SNAPSHOT_GROUP_BY = {
+    'platform': 'platform_name',
+    'category': 'category',
+    'delivery_status': 'delivery_status',
+}
+
+# One denormalized row per order item, for the order items of a month
+SNAPSHOT_LINES_SQL = """
+    SELECT
+        items.order_item_id, items.order_id, items.order_date, platforms.platform_name,
+        items.product_id, products.category, items.quantity_sold, items.total_sale_value,
+        deliveries.delivery_status, deliveries.delivery_state
+    FROM order_items AS items
+    JOIN orders ON orders.order_id = items.order_id AND orders.order_date = items.order_date
+    JOIN platforms ON platforms.platform_id = orders.platform_id
+    JOIN products ON products.product_id = items.product_id
+    LEFT JOIN deliveries ON deliveries.order_id = items.order_id
+    WHERE items.order_date >= %s AND items.order_date < %s
+    ORDER BY items.order_date, items.order_id
+"""
+
+# What the snapshot of each month was built from; a month whose items changed since is rewritten
+SNAPSHOT_MONTHS_SQL = """
+    SELECT DATE_TRUNC('month', order_date)::date, COUNT(*), MAX(order_item_id)
+    FROM order_items
+    GROUP BY 1
+"""
+
+# Serializes snapshot refreshes
+SNAPSHOT_LOCK_ID = 0x5A1E6
+
+# Per-page sums of the lines sampled by SampledAnalytics, and the sums of their
+# squares and cross products the error bounds are computed from
+SAMPLED_SUMMARY_SQL = """
+    WITH pages AS (
+        SELECT
+            COALESCE(SUM(total_sale_value), 0) AS revenue,
+            COALESCE(SUM(quantity_sold), 0) AS products,
+            COUNT(*) FILTER (WHERE line_number = 1) AS orders,
+            COUNT(*) FILTER (WHERE line_number = 1 AND delivery_status = 'Cancelled') AS canceled
+        FROM {table} AS lines TABLESAMPLE SYSTEM (%s) {repeatable}
+        WHERE {conditions}
+        GROUP BY (lines.ctid::text::point)[0]
+    )
+    SELECT
+        SUM(revenue), SUM(products), SUM(orders), SUM(canceled),
+        SUM(revenue * revenue), SUM(products * products), SUM(orders * orders),
+        SUM(canceled * canceled), SUM(canceled * orders)
+    FROM pages
+"""
+
+# z-score of the confidence level of the error bounds of approximate metrics
+APPROX_CONFIDENCE = 0.95
+APPROX_Z_SCORE = 1.96
+
+# In-memory DuckDB database of this process, opening one costs more than most queries
+duckdb_database = None
+
+
+class SQLAnalytics:
+    """
+    Computes the dashboard aggregates in PostgreSQL, from the monthly rollup and
+    the order tables.
+    """
+    name = 'sql'
+
+    def monthly_totals(self, field):
+        """
+        Returns ``month`` and the sum of the rollup ``field`` of every month.
+        """
+        return list(MonthlySalesRollup.objects.values(
+            'month').annotate(
+            **{field: Sum(field)}).order_by(
+            'month'
+        ))
+
+    def time_series(self, filterset, granularity, group_by=None, category=None):
+        """
+        Returns the sales volume, revenue and order count of the orders of a valid
+        ``OrderFilter`` per ``granularity`` bucket of ``order_date``, and per
+        ``group_by`` dimension if given, counting only the items of ``category`` if given.
+        """
+        # Filtered in one call before aggregating, so the sums join these items only
+        item_filters = filterset.order_item_filters()
+        if category:
+            item_filters['order_items__product__category__iexact'] = category
+        queryset = filterset.qs.filter(**item_filters)
+
+        fields = ['period']
+        if group_by is not None:
+            fields.append(TIMESERIES_GROUP_BY[group_by])
+        series = queryset.annotate(
+            period=Trunc('order_date', granularity)).values(
+            *fields).annotate(
+            total_quantity=Sum('order_items__quantity_sold'),
+            total_revenue=Sum('order_items__total_sale_value'),
+            total_orders=Count('order_id', distinct=True)).order_by(
+            *fields
+        )
+
+        return [
+            {
+                'period': row['period'],
+                **({group_by: row[fields[1]]} if group_by is not None else {}),
+                'total_quantity': row['total_quantity'] or 0,
+                'total_revenue': row['total_revenue'] or 0,
+                'total_orders': row['total_orders'],
+            } for row in series
+        ]
+
+    def summary_metrics(self, filterset):
+        """
+        Returns the revenue, products sold, orders and canceled orders of the orders of a valid ``OrderFilter``.
+        """
+        return filterset.qs.filter(**filterset.order_item_filters()).aggregate(
+            total_revenue=Sum('order_items__total_sale_value'),
+            total_products_sold=Sum('order_items__quantity_sold'),
+            total_orders=Count('order_id', distinct=True),
+            canceled_orders=Count(
+                'order_id', distinct=True,
+                filter=Q(delivery__delivery_status='Cancelled')
+            ),
+        )
+
+
+class SnapshotAnalytics:
+    """
+    Computes the dashboard aggregates with DuckDB over the columnar snapshot of the
+    order lines: one Parquet file per month in ``ANALYTICS_SNAPSHOT_DIR``, with the
+    platform, category and delivery of every order item denormalized, so the scans
+    are vectorized and need no joins. The snapshot is refreshed after each import
+    (see ``refresh_analytics_snapshot``), which lags the database in between. Orders
+    without items, which imports never create, are not in the snapshot.
+    """
+    name = 'duckdb'
+
+    def __init__(self, snapshot_dir=None):
+        self.snapshot_dir = snapshot_dir or settings.ANALYTICS_SNAPSHOT_DIR
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.snapshot_dir, 'manifest.json')
+
+    def month_path(self, month):
+        return os.path.join(self.snapshot_dir, f'order_lines_{month.replace("-", "_")}.parquet')
+
+    def manifest(self):
+        """
+        Returns the manifest of the snapshot, or ``None`` if it was never built.
+        """
+        try:
+            with open(self.manifest_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def available(self):
+        return self.manifest() is not None
+
+    def connect(self):
+        """
+        Returns a new connection to the DuckDB database of the process, with a
+        temporary ``order_lines`` view of the current snapshot files.
+        """
+        manifest = self.manifest() or {'months': {}}
+        files = [self.month_path(month) for month in sorted(manifest['months'])]
+        db = duckdb_cursor()
+        if files:
+            db.execute(
+                f"CREATE TEMP VIEW order_lines AS SELECT * FROM read_parquet([{', '.join(map(sql_string, files))}])"
+            )
+        else:
+            columns = ', '.join(f'{name} {column_type}' for name, column_type in SNAPSHOT_COLUMNS.items())
+            db.execute(f'CREATE TEMP TABLE order_lines ({columns})')
+        return db
+
+    def query(self, sql, params=()):
+        db = self.connect()
+        try:
+            return db.execute(sql, list(params)).fetchall()
+        finally:
+            db.close()
+
+    def order_conditions(self, filterset):
+        """
+        Returns the SQL conditions and parameters selecting the lines of the orders
+        matching a valid ``OrderFilter``, mirroring its filters.
+        """
+        data = filterset.form.cleaned_data
+        conditions = []
+        params = []
+        if data.get('start_date'):
+            conditions.append('order_date >= ?')
+            params.append(data['start_date'])
+        if data.get('end_date'):
+            conditions.append('order_date <= ?')
+            params.append(data['end_date'])
+        if data.get('category'):
+            conditions.append(
+                'order_id IN (SELECT order_id FROM order_lines WHERE upper(category) = upper(?))')
+            params.append(data['category'])
+        if data.get('delivery_status'):
+            conditions.append('delivery_status = ?')
+            params.append(data['delivery_status'])
+        if data.get('platform'):
+            conditions.append('upper(platform_name) = upper(?)')
+            params.append(data['platform'])
+        if data.get('state'):
+            conditions.append('delivery_state = ?')
+            params.append(normalize_state(data['state']))
+        return conditions, params
+
+    def monthly_totals(self, field):
+        column = {'total_quantity': 'quantity_sold', 'total_revenue': 'total_sale_value'}[field]
+        rows = self.query(
+            f"SELECT date_trunc('month', order_date)::DATE, SUM({column}) FROM order_lines GROUP BY 1 ORDER BY 1"
+        )
+        return [{'month': month, field: total} for month, total in rows]
+
+    def time_series(self, filterset, granularity, group_by=None, category=None):
+        conditions, params = self.order_conditions(filterset)
+        if category:
+            conditions.append('upper(category) = upper(?)')
+            params.append(category)
+        columns = [f"date_trunc('{granularity}', order_date)::DATE"]
+        if group_by is not None:
+            columns.append(SNAPSHOT_GROUP_BY[group_by])
+        groups = ', '.join(str(position) for position in range(1, len(columns) + 1))
+
+        rows = self.query(
+            f"""
+            SELECT {', '.join(columns)}, SUM(quantity_sold), SUM(total_sale_value), COUNT(DISTINCT order_id)
+            FROM order_lines
+            WHERE {' AND '.join(conditions) or 'true'}
+            GROUP BY {groups}
+            ORDER BY {groups}
+            """,
+            params
+        )
+        return [
+            {
+                'period': row[0],
+                **({group_by: row[1]} if group_by is not None else {}),
+                'total_quantity': row[-3] or 0,
+                'total_revenue': row[-2] or 0,
+                'total_orders': row[-1],
+            } for row in rows
+        ]
+
+    def summary_metrics(self, filterset):
+        conditions, params = self.order_conditions(filterset)
+        total_revenue, total_products_sold, total_orders, canceled_orders = self.query(
+            f"""
+            SELECT
+                SUM(total_sale_value), SUM(quantity_sold), COUNT(DISTINCT order_id),
+                COUNT(DISTINCT order_id) FILTER (WHERE delivery_status = 'Cancelled')
+            FROM order_lines
+            WHERE {' AND '.join(conditions) or 'true'}
+            """,
+            params
+        )[0]
+        return {
+            'total_revenue': total_revenue,
+            'total_products_sold': total_products_sold,
+            'total_orders': total_orders,
+            'canceled_orders': canceled_orders,
+        }
+
+    def refresh(self, months=(), full=False):
+        """
+        Rewrites the Parquet files of the months whose order items changed since
+        they were written (their count or highest ``order_item_id`` differ), of
+        ``months`` (``YYYY-MM``) and of every month if ``full``, and removes those of
+        months without items anymore. The database is read in one repeatable-read
+        transaction, so all the files are consistent with each other. Returns the
+        months written and removed and the rows written.
+        """
+        require_duckdb()
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        written = []
+        rows_written = 0
+
+        # The isolation level can only be set by the statement starting the transaction
+        repeatable_read = not connection.in_atomic_block
+        with transaction.atomic(), connection.cursor() as cursor:
+            if repeatable_read:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SNAPSHOT_LOCK_ID])
+            manifest = self.manifest() or {'months': {}}
+            cursor.execute(SNAPSHOT_MONTHS_SQL)
+            current = {
+                f'{month:%Y-%m}': {'rows': rows, 'max_order_item_id': max_id}
+                for month, rows, max_id in cursor.fetchall()
+            }
+
+            for month, state in sorted(current.items()):
+                if full or month in months or manifest['months'].get(month) != state:
+                    rows_written += self.write_month(cursor, month)
+                    written.append(month)
+            removed = sorted(set(manifest['months']) - set(current))
+
+            self.write_manifest({'months': current, 'refreshed_at': timezone.now().isoformat()})
+            for month in removed:
+                os.remove(self.month_path(month))
+
+        if written or removed:
+            # Responses computed from the previous snapshot are stale now
+            bump_data_version()
+            logger.info(
+                f"Analytics snapshot refreshed: {rows_written} rows of {len(written)} months written"
+                + (f", {len(removed)} months removed" if removed else '')
+            )
+        return {'months_written': written, 'months_removed': removed, 'rows_written': rows_written}
+
+    def write_month(self, cursor, month):
+        """
+        Exports the order lines of ``month`` (``YYYY-MM``) as CSV with ``COPY`` and
+        converts them to a zstd-compressed Parquet file with DuckDB, replacing the
+        previous one atomically. Returns the rows written.
+        """
+        start = datetime.strptime(month, '%Y-%m').date()
+        end = add_months(start, 1)
+        path = self.month_path(month)
+
+        with tempfile.NamedTemporaryFile('wb+', suffix='.csv') as file:
+            lines_sql = cursor.mogrify(SNAPSHOT_LINES_SQL, [start, end]).decode()
+            cursor.copy_expert(f'COPY ({lines_sql}) TO STDOUT WITH (FORMAT csv)', file)
+            file.flush()
+
+            columns = ', '.join(
+                f'{sql_string(name)}: {sql_string(column_type)}' for name, column_type in SNAPSHOT_COLUMNS.items()
+            )
+            db = duckdb_cursor()
+            try:
+                db.execute(
+                    f"""
+                    COPY (
+                        SELECT * FROM read_csv({sql_string(file.name)}, header = false,
+                                               allow_quoted_nulls = false, columns = {{{columns}}})
+                    ) TO {sql_string(path + '.tmp')} (FORMAT parquet, COMPRESSION zstd)
+                    """
+                )
+                rows = db.execute(f"SELECT COUNT(*) FROM read_parquet({sql_string(path + '.tmp')})").fetchone()[0]
+            finally:
+                db.close()
+        os.replace(path + '.tmp', path)
+        return rows
+
+    def write_manifest(self, manifest):
+        with open(self.manifest_path + '.tmp', 'w') as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+
+class SampledAnalytics:
+    """
+    Estimates the summary metrics from a ``TABLESAMPLE SYSTEM`` sample of the pages
+    of the ``order_lines`` view, sized from its planner statistics to read about
+    ``APPROX_SAMPLE_ROWS`` lines whatever the date range. Every page is sampled with
+    the same probability, so the sums scaled by its inverse are unbiased, and the
+    error bounds follow from the variance between the sampled pages. A fraction of
+    1 reads the whole view and gives exact metrics with no error. Like the order
+    listing, it lags the imports until the view is refreshed.
+    """
+    name = 'sample'
+
+    def __init__(self, sample_rows=None, seed=None):
+        self.sample_rows = sample_rows or settings.APPROX_SAMPLE_ROWS
+        self.seed = seed
+
+    def sample_fraction(self):
+        """
+        Returns the fraction of the pages of ``order_lines`` to sample, 1 if it has
+        no more than ``sample_rows`` lines or was never analyzed.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [OrderLine._meta.db_table])
+            rows = cursor.fetchone()[0]
+        if rows <= 0:
+            return 1.0
+        return min(1.0, self.sample_rows / rows)
+
+    def order_conditions(self, filterset):
+        """
+        Returns the SQL conditions and parameters selecting the lines of the orders
+        matching a valid ``OrderFilter``, like ``OrderLineFilter`` does.
+        """
+        data = filterset.form.cleaned_data
+        conditions = []
+        params = []
+        if data.get('start_date'):
+            conditions.append('lines.order_date >= %s')
+            params.append(data['start_date'])
+        if data.get('end_date'):
+            conditions.append('lines.order_date <= %s')
+            params.append(data['end_date'])
+        if data.get('category'):
+            # Probes order_lines_category_idx for the order of each sampled line
+            conditions.append(
+                f'EXISTS (SELECT 1 FROM {OrderLine._meta.db_table} AS others '
+                f'WHERE UPPER(others.category::text) = UPPER(%s) AND others.order_id = lines.order_id)')
+            params.append(data['category'])
+        if data.get('delivery_status'):
+            conditions.append('lines.delivery_status = %s')
+            params.append(data['delivery_status'])
+        if data.get('platform'):
+            conditions.append('UPPER(lines.platform_name::text) = UPPER(%s)')
+            params.append(data['platform'])
+        if data.get('state'):
+            conditions.append('lines.delivery_state = %s')
+            params.append(normalize_state(data['state']))
+        return conditions, params
+
+    def summary_metrics(self, filterset):
+        """
+        Returns the estimated summary metrics of the orders of a valid ``OrderFilter``
+        like ``SQLAnalytics.summary_metrics``, with the ``sample_fraction`` read and
+        the ``error_bounds`` of the metrics at ``APPROX_CONFIDENCE``.
+        """
+        fraction = self.sample_fraction()
+        conditions, params = self.order_conditions(filterset)
+        sql = SAMPLED_SUMMARY_SQL.format(
+            table=OrderLine._meta.db_table,
+            repeatable='REPEATABLE (%s)' if self.seed is not None else '',
+            conditions=' AND '.join(conditions) or 'true',
+        )
+        sample_params = [fraction * 100] + ([self.seed] if self.seed is not None else [])
+        with connection.cursor() as cursor:
+            cursor.execute(sql, sample_params + params)
+            sums = [float(value or 0) for value in cursor.fetchone()]
+        revenue, products, orders, canceled, revenue_sq, products_sq, orders_sq, canceled_sq, canceled_orders = sums
+
+        # Horvitz-Thompson estimates over pages sampled with probability ``fraction``
+        scale = 1 / fraction
+        variance_scale = (1 - fraction) / fraction ** 2
+
+        def bound(sum_of_squares):
+            return APPROX_Z_SCORE * math.sqrt(max(variance_scale * sum_of_squares, 0))
+
+        # Delta method for the ratio of the canceled orders to the orders
+        ratio = canceled / orders if orders else 0.0
+        ratio_bound = (
+            bound(canceled_sq - 2 * ratio * canceled_orders + ratio ** 2 * orders_sq) / (orders * scale) * 100
+            if orders else 0.0
+        )
+        return {
+            'total_revenue': Decimal(revenue * scale).quantize(Decimal('0.01')),
+            'total_products_sold': round(products * scale),
+            'total_orders': round(orders * scale),
+            'canceled_orders': round(canceled * scale),
+            'sample_fraction': fraction,
+            'error_bounds': {
+                'confidence': APPROX_CONFIDENCE,
+                'total_revenue': Decimal(bound(revenue_sq)).quantize(Decimal('0.01')),
+                'total_products_sold': math.ceil(bound(products_sq)),
+                'total_orders': math.ceil(bound(orders_sq)),
+                'canceled_order_percentage': ratio_bound,
+            },
+        }
+
+
+ANALYTICS_ENGINES = {
+    'sql': SQLAnalytics,
+    'duckdb': SnapshotAnalytics,
+}
+
+
+def require_duckdb():
+    if duckdb is None:
+        raise ImproperlyConfigured('The duckdb analytics engine requires the duckdb package.')
+
+
+def duckdb_cursor():
+    """
+    Returns a new connection to the in-memory DuckDB database of the process.
+    """
+    global duckdb_database
+    require_duckdb()
+    if duckdb_database is None:
+        duckdb_database = duckdb.connect()
+    return duckdb_database.cursor()
+
+
+def sql_string(value):
+    """
+    Quotes a string literal for DuckDB statements that take no parameters.
+    """
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def get_analytics_engine():
+    """
+    Returns the analytics engine selected by ``ANALYTICS_ENGINE``. The SQL engine
+    serves the dashboard until the snapshot is first built.
+    """
+    engine = settings.ANALYTICS_ENGINE
+    if engine not in ANALYTICS_ENGINES:
+        raise ImproperlyConfigured(f"Unknown analytics engine '{engine}'.")
+
+    analytics = ANALYTICS_ENGINES[engine]()
+    if isinstance(analytics, SnapshotAnalytics) and not analytics.available():
+        logger.warning('The analytics snapshot was not built yet, falling back to SQL.')
+        return SQLAnalytics()
+    return analytics
+
+
+def refresh_analytics_snapshot(months=(), full=False):
+    """
+    Refreshes the snapshot of the duckdb analytics engine, see ``SnapshotAnalytics.refresh``.
+    """
+    return SnapshotAnalytics().refresh(months, full)
+
+
+def compare_analytics(scenarios, expected=None, actual=None):
+    """
+    Runs the ``(name, method, args)`` scenarios with both engines (SQL and the
+    snapshot by default) and returns the ones whose results differ, with both
+    results. ``args`` are the arguments of the engine ``method``.
+    """
+    expected = expected or SQLAnalytics()
+    actual = actual or SnapshotAnalytics()
+    mismatches = []
+    for name, method, args in scenarios:
+        expected_result = getattr(expected, method)(*args)
+        actual_result = getattr(actual, method)(*args)
+        if expected_result != actual_result:
+            mismatches.append({'name': name, expected.name: expected_result, actual.name: actual_result})
+    return mismatches
+
+
+def consistency_scenarios(filter_params):
+    """
+    Returns ``compare_analytics`` scenarios covering the monthly endpoints, and the
+    summary metrics and every time series granularity and grouping for each dict of
+    ``OrderFilter`` parameters in ``filter_params``. Time series take the category
+    apart, like ``SalesTimeSeriesAPI`` does.
+    """
+    scenarios = [
+        (f'monthly {field}', 'monthly_totals', (field,)) for field in ('total_quantity', 'total_revenue')
+    ]
+    for params in filter_params:
+        label = urlencode(params) or 'no filters'
+        filterset = order_filterset(params)
+        scenarios.append((f'summary metrics, {label}', 'summary_metrics', (filterset,)))
+
+        series_params = {name: value for name, value in params.items() if name != 'category'}
+        series_filterset = order_filterset(series_params)
+        for granularity in TIMESERIES_GRANULARITIES:
+            for group_by in (None, *TIMESERIES_GROUP_BY):
+                scenarios.append((
+                    f"time series per {granularity}{f' and {group_by}' if group_by else ''}, {label}",
+                    'time_series', (series_filterset, granularity, group_by, params.get('category')),
+                ))
+    return scenarios
+
+
+def order_filterset(params):
+    filterset = OrderFilter(params, queryset=Order.objects.all())
+    if not filterset.is_valid():
+        raise ValueError(f'Invalid filters {params}: {filterset.errors}')
+    return filterset
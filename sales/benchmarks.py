@@ -0,0 +1,243 @@
+import csv
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+from random import Random
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from sales.cache import bump_data_version
+from sales.checkpoints import get_checkpoint
+from sales.profiling import percentile
+from sales.tasks import import_platform_data
+from sales.utils import file_sha256
+from sales.views import (MonthlyRevenue, MonthlySalesVolume, OrderListView, SalesTimeSeriesAPI,
+                         SummaryMetricsAPI)
+
+BENCHMARK_CATEGORIES = ('Electronics', 'Books', 'Home & Kitchen', 'Toys', 'Fashion', 'Beauty')
+BENCHMARK_STATES = (
+    'Maharashtra', 'Karnataka', 'Tamil Nadu', 'Uttar Pradesh', 'Delhi', 'West Bengal', 'Gujarat',
+)
+# Weighted towards delivered orders, like real exports
+BENCHMARK_DELIVERY_STATUSES = ('Delivered', 'Delivered', 'Delivered', 'Shipped', 'Cancelled', 'Returned')
+BENCHMARK_START_DATE = date(2023, 1, 1)
+BENCHMARK_DAYS = 730
+
+# Values of the platform specific columns of the shipped platform configs
+PLATFORM_DATA_VALUES = {
+    'PrimeDelivery': lambda random: random.choice(('Yes', 'No')),
+    'WarehouseLocation': lambda random: f'WH{random.randint(1, 20)}',
+    'CouponUsed': lambda random: random.choice(('Yes', 'No')),
+    'ReturnWindow': lambda random: f'{random.choice((7, 10, 30))} days',
+    'ResellerName': lambda random: f'Reseller {random.randint(1, 500)}',
+    'CommissionPercentage': lambda random: str(random.randint(5, 25)),
+}
+
+
+def benchmark_header(platform_config):
+    """
+    Returns the columns of a CSV export of a platform, from its field mappings.
+    """
+    columns = [
+        *platform_config.get('field_mapping', {}).values(),
+        *platform_config.get('platform_data_field_mapping', {}).values(),
+        *platform_config.get('delivery_data_field_mapping', {}).values(),
+    ]
+    return list(dict.fromkeys(column for column in columns if column))
+
+
+def generate_platform_rows(platform_name, platform_config, rows, seed=0):
+    """
+    Yields ``rows`` synthetic order item rows of a platform as dicts keyed by the
+    mapped column names. The same seed always yields the same rows. Orders have one
+    to three items; customers and products are shared by all platforms, so imports
+    of several platforms overlap on them like real exports do.
+    """
+    random = Random(f'{seed}:{platform_name}')
+    field_mapping = {
+        field: column for field, column in platform_config.get('field_mapping', {}).items() if column
+    }
+    extra_columns = [
+        column for column in (
+            *platform_config.get('platform_data_field_mapping', {}).values(),
+            *platform_config.get('delivery_data_field_mapping', {}).values(),
+        ) if column
+    ]
+    order_date_format = platform_config.get('order_date_format', '%Y-%m-%d')
+    delivery_date_format = platform_config.get('delivery_date_format', '%Y-%m-%d')
+    customers = max(1, rows // 5)
+    products = max(1, min(rows // 20, 100000))
+    prefix = platform_name[:3].upper()
+
+    order_no = produced = 0
+    while produced < rows:
+        order_no += 1
+        customer = random.randint(1, customers)
+        order_date = BENCHMARK_START_DATE + timedelta(days=random.randrange(BENCHMARK_DAYS))
+        order = {
+            'customer_id': f'CUST{customer:08d}',
+            'customer_name': f'Customer {customer}',
+            'contact_email': f'customer{customer}@example.com',
+            'phone_number': f'9{customer:09d}',
+            'order_id': f'{prefix}{order_no:010d}',
+            'order_date': order_date.strftime(order_date_format),
+            'delivery_address': (
+                f'{random.randint(1, 999)} Main Road, City {random.randint(1, 300)}, '
+                f'{random.choice(BENCHMARK_STATES)}'
+            ),
+            'delivery_date': (order_date + timedelta(days=random.randint(1, 7))).strftime(delivery_date_format),
+            'delivery_status': random.choice(BENCHMARK_DELIVERY_STATUSES),
+            'delivery_partner': f'Partner {random.randint(1, 10)}',
+        }
+        extra = {
+            column: PLATFORM_DATA_VALUES.get(column, lambda random: f'{column} {random.randint(1, 100)}')(random)
+            for column in extra_columns
+        }
+
+        items = min(random.randint(1, 3), products, rows - produced)
+        for product in random.sample(range(1, products + 1), items):
+            item = {
+                **order,
+                'product_id': f'PROD{product:07d}',
+                'product_name': f'Product {product}',
+                'product_category': BENCHMARK_CATEGORIES[product % len(BENCHMARK_CATEGORIES)],
+                'item_quantity': str(random.randint(1, 5)),
+                'item_selling_price': f'{(product * 7919 % 50000 + 100) / 100:.2f}',
+            }
+            yield {**{column: item.get(field) for field, column in field_mapping.items()}, **extra}
+        produced += items
+
+
+def write_platform_csv(file, platform_name, platform_config, rows, seed=0):
+    """
+    Writes a synthetic CSV export of a platform (see ``generate_platform_rows``) to a text file.
+    """
+    writer = csv.DictWriter(file, fieldnames=benchmark_header(platform_config))
+    writer.writeheader()
+    writer.writerows(generate_platform_rows(platform_name, platform_config, rows, seed))
+
+
+def benchmark_import(platform, rows, seed=0):
+    """
+    Imports a synthetic export of ``rows`` rows through ``import_platform_data``,
+    as the import task does, and returns its stats.
+    """
+    with tempfile.NamedTemporaryFile('w+', newline='', suffix='.csv') as file:
+        write_platform_csv(file, platform.platform_name, platform.platform_config, rows, seed)
+        file.seek(0)
+        file_path = default_storage.save(f'tmp/benchmark-{platform.platform_name.lower()}.csv', File(file))
+
+    try:
+        checkpoint = get_checkpoint(platform, file_sha256(file_path))
+        if checkpoint.completed_at:
+            raise ValueError(
+                f'This {platform.platform_name} file was already imported, '
+                f'benchmark on an empty database or with another seed.'
+            )
+        stats = import_platform_data(platform, file_path, checkpoint)
+    finally:
+        default_storage.delete(file_path)
+
+    return {
+        'engine': platform.platform_config.get('import_engine', 'orm'),
+        **stats,
+    }
+
+
+def endpoint_scenarios(platform_names):
+    """
+    Returns the ``(name, view, url name, query parameters)`` of the endpoint benchmarks.
+    """
+    date_range = {
+        'start_date': BENCHMARK_START_DATE.isoformat(),
+        'end_date': (BENCHMARK_START_DATE + timedelta(days=89)).isoformat(),
+    }
+    return [
+        ('monthly-sales-volume', MonthlySalesVolume, 'monthly-sales-volume', {}),
+        ('monthly-revenue', MonthlyRevenue, 'monthly-revenue', {}),
+        ('sales-timeseries', SalesTimeSeriesAPI, 'sales-timeseries', {
+            'granularity': 'week', 'group_by': 'platform', **date_range,
+        }),
+        ('summary-metrics', SummaryMetricsAPI, 'summary-metrics', {}),
+        ('summary-metrics-filtered', SummaryMetricsAPI, 'summary-metrics', {
+            'category': 'Electronics', 'state': 'Karnataka', **date_range,
+        }),
+        ('orders', OrderListView, 'orders', {}),
+        ('orders-filtered', OrderListView, 'orders', {
+            'category': 'Electronics', 'state': 'Karnataka', 'delivery_status': 'Delivered',
+        }),
+        ('orders-deep-page', OrderListView, 'orders', {'page': 50}),
+        ('orders-cursor', OrderListView, 'orders', {
+            'pagination': 'cursor', 'ordering': 'order_date', 'count': 'false', **date_range,
+        }),
+        ('orders-large-page', OrderListView, 'orders', {
+            'pagination': 'cursor', 'page_size': 1000, 'count': 'false',
+        }),
+        ('orders-export', OrderListView, 'orders', {'export': 'true', 'platform': platform_names[0]}),
+    ]
+
+
+def benchmark_endpoint(view, url_name, params, repeat):
+    """
+    Calls a view ``repeat`` times and returns its latency percentiles, query count
+    and response size. Summary metrics are computed every time, as the data version
+    is bumped before each call.
+    """
+    factory = APIRequestFactory()
+    view_func = view.as_view()
+    path = reverse(url_name)
+    timings = []
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries[-1] += 1
+        return execute(sql, params, many, context)
+
+    for _ in range(repeat):
+        bump_data_version()
+        queries.append(0)
+        with connection.execute_wrapper(count_query):
+            start = time.perf_counter()
+            response = view_func(factory.get(path, params))
+            if response.streaming:
+                content = b''.join(response.streaming_content)
+            else:
+                content = response.render().content
+            timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        'path': path,
+        'params': params,
+        'status': response.status_code,
+        'queries': max(queries),
+        'response_bytes': len(content),
+        'min_ms': round(timings[0], 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+    }
+
+
+def benchmark_environment():
+    """
+    Describes what the results were measured on, to compare them across commits.
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'started_at': timezone.now().isoformat(),
+        'git_commit': commit,
+        'database': connection.vendor,
+        'database_version': getattr(connection, 'pg_version', None),
+    }
@@ -0,0 +1,105 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+DATA_VERSION_KEY = 'sales:data_version'
+
+
+def get_data_version():
+    """
+    Returns the current version of the sales data, which every committed import bumps.
+    """
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        # Start from the clock so an evicted counter never reuses an old version.
+        cache.add(DATA_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(DATA_VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    """
+    Invalidates every cached result derived from the sales data.
+    """
+    try:
+        cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        cache.add(DATA_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def data_fingerprint(params):
+    """
+    Hashes ``params`` together with the data version, so the fingerprint changes
+    whenever an import commits.
+    """
+    normalized = '&'.join(f'{key}={params[key]}' for key in sorted(params))
+    return hashlib.sha256(f'{get_data_version()}:{normalized}'.encode()).hexdigest()
+
+
+def response_cache_params(request):
+    """
+    Normalizes what a GET response depends on: the query parameters (sorted, with
+    their values sorted), the host used in absolute links and the rendered format.
+    """
+    params = {
+        key: ','.join(sorted(request.query_params.getlist(key)))
+        for key in request.query_params
+    }
+    params.update({
+        '@host': request.get_host(),
+        '@format': request.accepted_renderer.format,
+    })
+    return params
+
+
+def cached_response(prefix, timeout_setting='RESPONSE_CACHE_TIMEOUT', cacheable=None):
+    """
+    Caches the data of the successful responses of a GET handler per normalized
+    request (see ``response_cache_params``) and data version, and answers
+    ``If-None-Match`` with 304 Not Modified. The ETag is the data fingerprint of
+    the request, so both the cache and the ETags change whenever an import commits
+    and nothing stale is served. ``cacheable(request)`` can exclude requests.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            if cacheable is not None and not cacheable(request):
+                return handler(self, request, *args, **kwargs)
+
+            fingerprint = data_fingerprint(response_cache_params(request))
+            etag = f'"{fingerprint}"'
+            if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+            if etag in if_none_match or '*' in if_none_match:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                cache_key = f'sales:response:{prefix}:{fingerprint}'
+                data = cache.get(cache_key)
+                if data is not None:
+                    response = Response(data)
+                    response['X-Cache'] = 'HIT'
+                else:
+                    response = handler(self, request, *args, **kwargs)
+                    data = getattr(response, 'data', None)
+                    # Error responses of the views carry an error key with status 200
+                    if (not isinstance(response, Response) or response.status_code != status.HTTP_200_OK
+                            or isinstance(data, dict) and 'error' in data):
+                        return response
+                    if isinstance(data, QuerySet):
+                        data = list(data)
+                    cache.set(cache_key, data, getattr(settings, timeout_setting))
+                    response['X-Cache'] = 'MISS'
+
+            response['ETag'] = etag
+            # Clients may keep responses but must revalidate them
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,139 @@
+import logging
+import re
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from sales.models import ImportCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# Tables an import writes to, in the order they are written
+IMPORT_TABLES = ('customers', 'products', 'orders', 'order_items', 'deliveries')
+
+INSERT_TABLE = re.compile(r'\s*INSERT INTO "?(\w+)"?', re.IGNORECASE)
+
+END = object()
+
+# Minimum seconds between two progress reports of a running import
+PROGRESS_INTERVAL = 1.0
+
+
+class ImportProgress:
+    """
+    Tracks one import run. ``commit`` moves the ``ImportCheckpoint`` (if any) past the
+    rows an engine commits, inside the transaction saving them, so the checkpoint
+    never gets ahead of or behind the data. Row counts, inserts and updates per
+    table and time spent parsing and in the database are reported to ``publish``
+    as committed batches go by, e.g. to update the state of a Celery task. Months
+    whose orders, items or deliveries were updated, or whose items changed category
+    or moved to another order_date, are collected in ``updated_months``.
+    """
+    def __init__(self, checkpoint=None, lines=None, publish=None):
+        self.checkpoint = checkpoint
+        self.lines = lines
+        self.publish = publish
+        self.rows_read = 0
+        self.rows_committed = 0
+        self.batches = 0
+        self.inserted = dict.fromkeys(IMPORT_TABLES, 0)
+        self.updated = dict.fromkeys(IMPORT_TABLES, 0)
+        self.orders_moved = 0
+        self.updated_months = set()
+        self.parse_seconds = 0.0
+        self.db_seconds = 0.0
+        self.started = time.perf_counter()
+        self.reported = 0.0
+
+    def rows(self, rows):
+        """
+        Iterates over ``rows`` counting them, and adds the time spent producing them to the parse phase.
+        """
+        rows = iter(rows)
+        while True:
+            start = time.perf_counter()
+            row = next(rows, END)
+            self.parse_seconds += time.perf_counter() - start
+            if row is END:
+                return
+            self.rows_read += 1
+            yield row
+
+    @contextmanager
+    def db(self):
+        """
+        Adds the time spent in the block to the database phase, less any parsing done inside it.
+        """
+        start, parse_seconds = time.perf_counter(), self.parse_seconds
+        try:
+            yield
+        finally:
+            self.db_seconds += time.perf_counter() - start - (self.parse_seconds - parse_seconds)
+
+    def count_writes(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper counting the rows ``INSERT`` statements add to the
+        import tables, and those upserts (``ON CONFLICT DO UPDATE``) update.
+        """
+        result = execute(sql, params, many, context)
+        match = INSERT_TABLE.match(sql)
+        if match and match.group(1) in self.inserted:
+            counts = self.updated if 'DO UPDATE' in sql else self.inserted
+            counts[match.group(1)] += max(context['cursor'].rowcount, 0)
+        return result
+
+    def add_updated_months(self, dates):
+        self.updated_months.update(f'{value:%Y-%m}' for value in dates)
+
+    def commit(self, rows):
+        self.rows_committed += rows
+        self.batches += 1
+        if self.checkpoint is not None:
+            self.checkpoint.byte_offset = self.lines.position
+            self.checkpoint.row_count += rows
+            self.checkpoint.save(update_fields=['byte_offset', 'row_count', 'updated_at'])
+        transaction.on_commit(self.report)
+
+    def report(self, force=False):
+        now = time.perf_counter()
+        if self.publish is not None and (force or now - self.reported >= PROGRESS_INTERVAL):
+            self.reported = now
+            # Progress is informational and must never fail the import
+            try:
+                self.publish(self.as_dict())
+            except Exception as e:
+                logger.warning(f"Error publishing import progress: {str(e)}")
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'rows_read': self.rows_read,
+            'rows_committed': self.rows_committed,
+            'row_count': self.checkpoint.row_count if self.checkpoint else self.rows_committed,
+            'batches_committed': self.batches,
+            'inserted': dict(self.inserted),
+            'updated': dict(self.updated),
+            # Stored orders moved to the order_date of their rows by upserts
+            'orders_moved': self.orders_moved,
+            # Rows whose order, order item or delivery was already there unchanged,
+            # from an earlier import or an earlier row of this one
+            'conflicts_skipped': {
+                table: self.rows_committed - self.inserted[table] - self.updated[table]
+                for table in ('orders', 'order_items', 'deliveries')
+            },
+            'updated_months': sorted(self.updated_months),
+            'rows_per_sec': round(self.rows_read / elapsed, 1) if elapsed else 0.0,
+            'elapsed_seconds': round(elapsed, 3),
+            'parse_seconds': round(self.parse_seconds, 3),
+            'db_seconds': round(self.db_seconds, 3),
+        }
+
+
+def get_checkpoint(platform, file_hash, chunk_start=0):
+    """
+    Returns the checkpoint of a file (or of one chunk of it), creating it on the first attempt.
+    """
+    checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+        platform=platform, file_hash=file_hash, chunk_start=chunk_start)
+    return checkpoint
@@ -0,0 +1,399 @@
+import json
+import logging
+import time
+from itertools import islice
+
+from django.db import connection, transaction
+
+from sales.cache import bump_data_version
+from sales.checkpoints import ImportProgress
+from sales.models import OrderItem
+from sales.partitions import ensure_partitions
+from sales.rollups import (LOCK_PRODUCTS_SQL, add_product_items_to_monthly_rollup, delete_empty_rollup_groups,
+                           insert_order_items_sql, update_order_items_sql)
+from sales.row_mapper import compile_row_mapper
+from sales.upserts import UPSERT_KEYS, import_update_fields, move_orders, order_date_moves
+from sales.utils import BatchSizer, deep_sizeof
+
+logger = logging.getLogger(__name__)
+
+STAGING_TABLE = 'import_staging'
+
+STAGING_COLUMNS = (
+    'row_no', 'customer_id', 'customer_name', 'contact_email',
+    'phone_number', 'product_id', 'product_name', 'category', 'order_id',
+    'order_date', 'platform_data', 'quantity_sold', 'selling_price',
+    'total_sale_value', 'delivery_address', 'delivery_date', 'delivery_status',
+    'delivery_partner', 'delivery_data', 'delivery_state',
+)
+
+CREATE_STAGING_SQL = f"""
+    CREATE TEMPORARY TABLE {STAGING_TABLE} (
+        row_no bigint NOT NULL,
+        customer_id text,
+        customer_name text,
+        contact_email text,
+        phone_number text,
+        product_id text,
+        product_name text,
+        category text,
+        order_id text,
+        order_date date,
+        platform_data jsonb,
+        quantity_sold integer,
+        selling_price numeric(10, 2),
+        total_sale_value numeric(12, 2),
+        delivery_address text,
+        delivery_date date,
+        delivery_status text,
+        delivery_partner text,
+        delivery_data jsonb,
+        delivery_state text
+    ) ON COMMIT DROP
+"""
+
+# An order_id has a single order_date (see OrderKey). Like the ORM engine, the
+# staged rows of an order take the date of its first row, or of its last one
+# when orders move; then those of stored orders take their stored date, after
+# the orders to move were moved to theirs.
+STAGED_ORDER_DATES_SQL = f"""
+    UPDATE {STAGING_TABLE} AS staged SET order_date = orders.order_date
+    FROM (
+        SELECT DISTINCT ON (order_id) order_id, order_date
+        FROM {STAGING_TABLE}
+        ORDER BY order_id, row_no {{direction}}
+    ) AS orders
+    WHERE staged.order_id = orders.order_id AND staged.order_date IS DISTINCT FROM orders.order_date
+"""
+
+ORDER_MOVES_SQL = f"""
+    SELECT DISTINCT staged.order_id, order_keys.order_date, staged.order_date
+    FROM {STAGING_TABLE} AS staged
+    JOIN order_keys ON order_keys.order_id = staged.order_id
+    WHERE staged.order_date <> order_keys.order_date
+    ORDER BY 1
+"""
+
+STORED_ORDER_DATES_SQL = f"""
+    UPDATE {STAGING_TABLE} AS staged SET order_date = order_keys.order_date
+    FROM order_keys
+    WHERE staged.order_id = order_keys.order_id AND staged.order_date IS DISTINCT FROM order_keys.order_date
+"""
+
+# The staging table holds one batch. Like the ORM engine, a batch inserts the
+# last values of each customer or product, and the first row of each order,
+# order item and delivery, and keeps the rows stored by earlier batches. The
+# DISTINCT ON orderings below reproduce exactly that, and insert rows in key
+# order so concurrent imports lock them in the same order.
+MERGE_CUSTOMERS_SQL = f"""
+    INSERT INTO customers (customer_id, customer_name, contact_email, phone_number)
+    SELECT DISTINCT ON (customer_id) customer_id, customer_name, contact_email, phone_number
+    FROM {STAGING_TABLE}
+    ORDER BY customer_id, row_no DESC
+    ON CONFLICT (customer_id) DO NOTHING
+"""
+
+MERGE_PRODUCTS_SQL = f"""
+    INSERT INTO products (product_id, product_name, category)
+    SELECT DISTINCT ON (product_id) product_id, product_name, category
+    FROM {STAGING_TABLE}
+    ORDER BY product_id, row_no DESC
+    ON CONFLICT (product_id) DO NOTHING
+"""
+
+MERGE_ORDERS_SQL = f"""
+    INSERT INTO orders (order_id, customer_id, platform_id, order_date, platform_data)
+    SELECT DISTINCT ON (order_id) order_id, customer_id, %s, order_date, platform_data
+    FROM {STAGING_TABLE}
+    ORDER BY order_id, row_no
+    ON CONFLICT DO NOTHING
+"""
+
+# The first staged row of each order item, or the last one for upserts
+STAGED_ORDER_ITEMS_SQL = f"""(
+    SELECT DISTINCT ON (order_id, product_id, selling_price, order_date)
+        order_id, order_date, product_id, quantity_sold, selling_price, total_sale_value
+    FROM {STAGING_TABLE}
+    ORDER BY order_id, product_id, selling_price, order_date, row_no {{direction}}
+)"""
+
+MERGE_ORDER_ITEMS_SQL = insert_order_items_sql(STAGED_ORDER_ITEMS_SQL.format(direction='ASC'))
+
+MERGE_DELIVERIES_SQL = f"""
+    INSERT INTO deliveries (
+        order_id, delivery_address, delivery_date, delivery_status,
+        delivery_partner, delivery_data, delivery_state
+    )
+    SELECT DISTINCT ON (order_id)
+        order_id, delivery_address, delivery_date, delivery_status,
+        delivery_partner, delivery_data, delivery_state
+    FROM {STAGING_TABLE}
+    ORDER BY order_id, row_no
+    ON CONFLICT DO NOTHING
+"""
+
+
+# Merges of the staged rows ignoring conflicts, in the order tables are written
+MERGE_SQL = {
+    'customers': MERGE_CUSTOMERS_SQL,
+    'products': MERGE_PRODUCTS_SQL,
+    'orders': MERGE_ORDERS_SQL,
+    'order_items': MERGE_ORDER_ITEMS_SQL,
+    'deliveries': MERGE_DELIVERIES_SQL,
+}
+
+# Columns written per table by upserts
+UPSERT_COLUMNS = {
+    'customers': ('customer_id', 'customer_name', 'contact_email', 'phone_number'),
+    'products': ('product_id', 'product_name', 'category'),
+    'orders': ('order_id', 'customer_id', 'platform_id', 'order_date', 'platform_data'),
+    'order_items': ('order_id', 'order_date', 'product_id', 'quantity_sold', 'selling_price', 'total_sale_value'),
+    'deliveries': (
+        'order_id', 'delivery_address', 'delivery_date', 'delivery_status',
+        'delivery_partner', 'delivery_data', 'delivery_state',
+    ),
+}
+
+# Upserts the last staged row of each key of a table, like the ORM engine does
+# batch after batch. Only the rows that are new or whose fields to update differ
+# from the stored ones reach the INSERT, so unchanged rows are neither locked nor
+# written. Returns the rows inserted and updated, and the months updated. Order
+# items are inserted and updated by the rollups statements instead, which keep
+# the monthly rollup in step.
+UPSERT_SQL = """
+    WITH staged AS (
+        SELECT DISTINCT ON ({key}) {staged_columns}, order_date AS row_order_date
+        FROM {staging}
+        ORDER BY {key}, row_no DESC
+    ), changed AS (
+        SELECT staged.*, {stored_columns}, stored.{first_key} IS NULL AS is_new
+        FROM staged
+        LEFT JOIN {table} AS stored ON {join}
+        WHERE stored.{first_key} IS NULL OR ROW({stored_fields}) IS DISTINCT FROM ROW({staged_fields})
+    ), written AS (
+        INSERT INTO {table} ({columns})
+        SELECT {columns} FROM changed
+        ORDER BY {key}
+        ON CONFLICT ({key}) DO UPDATE SET {assignments}
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE is_new), COUNT(*) FILTER (WHERE NOT is_new),
+        ARRAY_AGG(DISTINCT DATE_TRUNC('month', row_order_date)::date) FILTER (WHERE NOT is_new)
+    FROM changed
+"""
+
+# Staged products whose category an upsert changes, locked before their items
+# are subtracted from the rollup (see LOCK_PRODUCTS_SQL)
+CHANGED_CATEGORIES_SQL = f"""
+    SELECT staged.product_id
+    FROM (
+        SELECT DISTINCT ON (product_id) product_id, category
+        FROM {STAGING_TABLE}
+        ORDER BY product_id, row_no DESC
+    ) AS staged
+    JOIN products ON products.product_id = staged.product_id
+    WHERE products.category IS DISTINCT FROM staged.category
+    ORDER BY staged.product_id
+    FOR UPDATE OF products
+"""
+
+LOCK_STAGED_PRODUCTS_SQL = LOCK_PRODUCTS_SQL.format(
+    product_ids=f'SELECT product_id FROM {STAGING_TABLE}', mode='KEY SHARE')
+
+
+def upsert_sql(table, fields):
+    """
+    Returns the ``UPSERT_SQL`` of a table updating ``fields``.
+    """
+    key = UPSERT_KEYS[table]
+    columns = UPSERT_COLUMNS[table]
+    return UPSERT_SQL.format(
+        table=table,
+        staging=STAGING_TABLE,
+        key=', '.join(key),
+        first_key=key[0],
+        # Orders belong to the importing platform, the only parameter
+        staged_columns=', '.join('%s::uuid AS platform_id' if column == 'platform_id' else column
+                                 for column in columns),
+        stored_columns=', '.join(f'stored.{field} AS stored_{field}' for field in fields),
+        join=' AND '.join(f'stored.{column} = staged.{column}' for column in key),
+        stored_fields=', '.join(f'stored.{field}' for field in fields),
+        staged_fields=', '.join(f'staged.{field}' for field in fields),
+        columns=', '.join(columns),
+        assignments=', '.join(f'{field} = EXCLUDED.{field}' for field in fields),
+    )
+
+
+class CopyStream:
+    """
+    Minimal file-like object that feeds lines from an iterator to ``COPY FROM STDIN``
+    without materializing the whole payload in memory.
+    """
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+
+        data = ''.join(chunks)
+        if size < 0:
+            self.buffer = ''
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def copy_import_platform_data(platform, reader, progress=None):
+    """
+    Imports the rows of a ``csv.reader`` for a specific platform in batches sized
+    by a ``BatchSizer``, like the ORM engine: each batch is streamed into a staging
+    table with ``COPY FROM STDIN`` and merged with set-based ``INSERT ... SELECT``,
+    or upserted table by table in the "upsert" conflict mode (see
+    ``import_update_fields``), and committed to ``progress`` in its own transaction.
+    """
+    platform_config = platform.platform_config
+    progress = progress or ImportProgress()
+    batch = BatchSizer(platform_config)
+    update_fields = import_update_fields(platform_config)
+    moves_orders, update_fields['orders'] = order_date_moves(update_fields)
+    rows = progress.rows(staging_lines(platform_config, reader))
+
+    count = 0
+    while True:
+        lines = []
+        order_dates = set()
+        for order_date, line in islice(rows, batch.size):
+            lines.append(line)
+            if order_date is not None:
+                order_dates.add(order_date)
+        if not lines:
+            break
+
+        start = time.perf_counter()
+        with progress.db():
+            # In its own transaction, so the batch does not hold the partition locks
+            ensure_partitions(order_dates)
+            merge_batch(platform, lines, update_fields, moves_orders, progress)
+        batch.update(len(lines), time.perf_counter() - start, deep_sizeof(lines))
+        count += len(lines)
+
+    logger.info(f'Batch sizes for {platform.platform_name.capitalize()}: {batch.summary()}')
+    return count
+
+
+def merge_batch(platform, lines, update_fields, moves_orders, progress):
+    """
+    Stages a batch of ``COPY`` lines (see ``staging_lines``) and merges them into
+    the sales tables, in one transaction committing them to ``progress``.
+    """
+    updated_dates = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CREATE_STAGING_SQL)
+        cursor.copy_expert(f"COPY {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) FROM STDIN", CopyStream(lines))
+
+        cursor.execute(STAGED_ORDER_DATES_SQL.format(direction='DESC' if moves_orders else 'ASC'))
+        if moves_orders:
+            cursor.execute(ORDER_MOVES_SQL)
+            moves = cursor.fetchall()
+            updated_dates.extend(move_orders(moves))
+            progress.orders_moved += len(moves)
+        cursor.execute(STORED_ORDER_DATES_SQL)
+
+        # Items of products changing category move to the new one in the rollup
+        moved_products = []
+        if 'category' in update_fields['products']:
+            cursor.execute(CHANGED_CATEGORIES_SQL)
+            moved_products = [product_id for product_id, in cursor.fetchall()]
+            add_product_items_to_monthly_rollup(moved_products, sign=-1)
+
+        for table, merge_sql in MERGE_SQL.items():
+            params = [platform.platform_id] if table == 'orders' else []
+            if table == 'order_items':
+                cursor.execute(LOCK_STAGED_PRODUCTS_SQL)
+            if table == 'order_items' and update_fields[table]:
+                staged_items = STAGED_ORDER_ITEMS_SQL.format(direction='DESC')
+                cursor.execute(insert_order_items_sql(staged_items))
+                progress.inserted[table] += cursor.fetchone()[0]
+                cursor.execute(update_order_items_sql(staged_items, update_fields[table]))
+                updated, months = cursor.fetchone()
+                progress.updated[table] += updated
+                updated_dates.extend(months or [])
+            elif update_fields[table]:
+                cursor.execute(upsert_sql(table, update_fields[table]), params)
+                inserted, updated, months = cursor.fetchone()
+                # Upserts run in CTEs, which the INSERT counting cannot see.
+                progress.inserted[table] += inserted
+                progress.updated[table] += updated
+                if table in ('orders', 'order_items', 'deliveries'):
+                    updated_dates.extend(months or [])
+            else:
+                cursor.execute(merge_sql, params)
+                if table == 'order_items':
+                    # The items are inserted in a CTE, which the INSERT counting cannot see.
+                    progress.inserted['order_items'] += cursor.fetchone()[0]
+
+            if table == 'products':
+                updated_dates.extend(add_product_items_to_monthly_rollup(moved_products))
+        cursor.execute(f'DROP TABLE {STAGING_TABLE}')
+        delete_empty_rollup_groups(updated_dates)
+
+        progress.commit(len(lines))
+        progress.add_updated_months(updated_dates)
+
+        transaction.on_commit(bump_data_version)
+
+
+def staging_lines(platform_config, reader):
+    """
+    Yields the order_date and the ``COPY`` text-format line of every CSV row, with
+    values prepared by the same model fields the ORM engine goes through.
+    """
+    mapper = compile_row_mapper(platform_config, reader)
+    quantity_field = OrderItem._meta.get_field('quantity_sold')
+    price_field = OrderItem._meta.get_field('selling_price')
+    total_field = OrderItem._meta.get_field('total_sale_value')
+
+    for row_no, row in enumerate(mapper.map_rows(reader)):
+        values = (
+            row_no,
+            row.customer_id,
+            row.customer_name,
+            row.contact_email,
+            row.phone_number,
+            row.product_id,
+            row.product_name,
+            row.category,
+            row.order_id,
+            row.order_date,
+            json.dumps(row.platform_data),
+            quantity_field.get_prep_value(row.quantity_sold),
+            price_field.get_prep_value(row.selling_price),
+            total_field.get_prep_value(row.total_sale_value),
+            row.delivery_address,
+            row.delivery_date,
+            row.delivery_status,
+            row.delivery_partner,
+            json.dumps(row.delivery_data),
+            row.delivery_state,
+        )
+        yield row.order_date, '\t'.join(copy_text(value) for value in values) + '\n'
+
+
+def copy_text(value):
+    """
+    Encodes a value for the ``COPY`` text format.
+    """
+    if value is None:
+        return r'\N'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
@@ -0,0 +1,139 @@
+import csv
+import gzip
+import io
+import logging
+import time
+
+from django.db import connection
+from django.db.models import Prefetch
+
+from sales.cache import bump_data_version
+from sales.filters import OrderLineFilter
+from sales.models import Order, OrderItem, OrderLine, Platform
+
+EXPORT_FIELDNAMES = [
+    'order_id', 'order_date', 'customer_id', 'platform_id',
+    'product_id', 'product_name', 'category', 'quantity_sold',
+    'selling_price', 'total_sale_value', 'delivery_id',
+    'delivery_address', 'delivery_date', 'delivery_status',
+    'delivery_partner'  # base fields
+]
+
+logger = logging.getLogger(__name__)
+
+# Lines fetched per server-side cursor round trip
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """
+    Pseudo-buffer whose ``write`` hands the value back, so ``csv`` writers can
+    produce one line at a time for a streaming response.
+    """
+    def write(self, value):
+        return value
+
+
+def orders_with_details():
+    """
+    Returns the orders queryset of ``OrderSerializer``, with its relations loaded.
+    """
+    # Using select_related for single-depth relationships
+    # Using prefetch_related for deeper relationships or many-to-many relationships
+    return Order.objects.select_related(
+        'customer', 'platform').prefetch_related(
+        Prefetch(
+            'order_items',
+            queryset=OrderItem.objects.select_related('product').order_by('order_item_id')
+        ),
+        'delivery').order_by(
+        'order_id'
+    )
+
+
+def export_platforms(platform_name=None):
+    """
+    Returns the platforms whose dynamic fields an export includes.
+    """
+    platforms = Platform.objects.all()
+    if platform_name:
+        platforms = platforms.filter(platform_name__iexact=platform_name)
+    return platforms
+
+
+def export_fieldnames(platforms):
+    """
+    Returns the CSV columns: the base fields followed by the platform-specific
+    order and delivery fields configured for the given platforms.
+    """
+    dynamic_fields = {}
+    for platform in platforms:
+        dynamic_fields.update(dict.fromkeys(
+            platform.platform_config.get('platform_data_field_mapping', {})))
+        dynamic_fields.update(dict.fromkeys(
+            platform.platform_config.get('delivery_data_field_mapping', {})))
+
+    return EXPORT_FIELDNAMES + [
+        field for field in dynamic_fields if field not in EXPORT_FIELDNAMES
+    ]
+
+
+def iter_export_rows(queryset):
+    """
+    Yields one dict per order item of an ``OrderLine`` queryset, in one flat scan
+    of ``order_lines`` iterated server-side in chunks, so memory stays flat
+    regardless of the number of orders.
+    """
+    lines = queryset.filter(order_item_id__isnull=False).order_by('order_id', 'order_item_id').values(
+        *EXPORT_FIELDNAMES, 'platform_data', 'delivery_data')
+    for line in lines.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        row_data = {field: line[field] for field in EXPORT_FIELDNAMES}
+        # Append dynamic data
+        row_data.update(line['platform_data'] or {})
+        if line['delivery_id'] is not None:
+            row_data.update(line['delivery_data'] or {})
+        yield row_data
+
+
+def iter_csv_lines(queryset, fieldnames):
+    """
+    Yields the export CSV line by line, starting with the header.
+    """
+    writer = csv.DictWriter(Echo(), fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
+    yield writer.writeheader()
+    for row_data in iter_export_rows(queryset):
+        yield writer.writerow(row_data)
+
+
+def write_compressed_export(filters, fileobj):
+    """
+    Writes the orders matching the ``OrderLineFilter`` parameters in ``filters`` as a
+    gzip-compressed CSV to ``fileobj`` and returns the number of rows written.
+    """
+    queryset = OrderLineFilter(filters, queryset=OrderLine.objects.all()).qs
+    fieldnames = export_fieldnames(export_platforms(filters.get('platform')))
+
+    row_count = -1  # not counting the header
+    # Closing the text wrapper finishes the gzip stream but leaves fileobj open.
+    compressed = gzip.GzipFile(fileobj=fileobj, mode='wb')
+    with io.TextIOWrapper(compressed, encoding='utf-8', newline='') as text:
+        for line in iter_csv_lines(queryset, fieldnames):
+            text.write(line)
+            row_count += 1
+
+    return row_count
+
+
+def refresh_order_lines():
+    """
+    Refreshes the ``order_lines`` view with the committed imports, without blocking
+    the listings and exports reading it, then invalidates the cached responses
+    read from the previous contents. Its statistics are updated too, as approximate
+    metrics size their samples from them.
+    """
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {OrderLine._meta.db_table}')
+        cursor.execute(f'ANALYZE {OrderLine._meta.db_table}')
+    bump_data_version()
+    logger.info(f'Refreshed {OrderLine._meta.db_table} in {time.perf_counter() - start:.3f}s')
@@ -1,17 +1,68 @@
-from sales.models import Order
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
+from sales.models import Delivery, Order, OrderItem, OrderLine
+from sales.utils import normalize_state
+
+
 class OrderFilter(filters.FilterSet):
     start_date = filters.DateFilter(field_name="order_date", lookup_expr='gte')
     end_date = filters.DateFilter(field_name="order_date", lookup_expr='lte')
-    category = filters.CharFilter(field_name="order_items__product__category", lookup_expr='iexact')
+    category = filters.CharFilter(field_name="order_items__product__category", method='filter_by_category')
     delivery_status = filters.CharFilter(field_name="delivery__delivery_status")
     platform = filters.CharFilter(field_name="platform__platform_name", lookup_expr='iexact')
-    state = filters.CharFilter(field_name="delivery__delivery_address", method='filter_by_state')
+    state = filters.CharFilter(field_name="delivery__delivery_state", method='filter_by_state')
 
     class Meta:
         model = Order
         fields = []
 
+    # Multi-valued relations are filtered with EXISTS rather than joins, so an
+    # order is returned once no matter how many of its rows match.
+    def filter_by_category(self, queryset, name, value):
+        # Matching order_date lets PostgreSQL probe only the partition of the order
+        return queryset.filter(Exists(OrderItem.objects.filter(
+            order=OuterRef('pk'), order_date=OuterRef('order_date'), product__category__iexact=value)))
+
+    def filter_by_state(self, queryset, name, value):
+        return queryset.filter(Exists(Delivery.objects.filter(
+            order=OuterRef('pk'), delivery_state=normalize_state(value))))
+
+    def order_item_filters(self):
+        """
+        Lookups limiting the order items joined to the filtered orders to the same
+        date range, so that queries aggregating them scan only the order_items
+        partitions of that range.
+        """
+        data = self.form.cleaned_data
+        filters = {}
+        if data.get('start_date'):
+            filters['order_items__order_date__gte'] = data['start_date']
+        if data.get('end_date'):
+            filters['order_items__order_date__lte'] = data['end_date']
+        return filters
+
+
+class OrderLineFilter(filters.FilterSet):
+    """
+    ``OrderFilter`` over the ``order_lines`` view: the same parameters select the
+    lines of the same orders. Order and delivery fields repeat on every line of an
+    order, so only the category needs to look at the other lines.
+    """
+    start_date = filters.DateFilter(field_name="order_date", lookup_expr='gte')
+    end_date = filters.DateFilter(field_name="order_date", lookup_expr='lte')
+    category = filters.CharFilter(field_name="category", method='filter_by_category')
+    delivery_status = filters.CharFilter(field_name="delivery_status")
+    platform = filters.CharFilter(field_name="platform_name", lookup_expr='iexact')
+    state = filters.CharFilter(field_name="delivery_state", method='filter_by_state')
+
+    class Meta:
+        model = OrderLine
+        fields = []
+
+    def filter_by_category(self, queryset, name, value):
+        return queryset.filter(Exists(OrderLine.objects.filter(
+            order_id=OuterRef('order_id'), category__iexact=value)))
+
     def filter_by_state(self, queryset, name, value):
-        return queryset.filter(delivery__delivery_address__icontains=value)
+        return queryset.filter(delivery_state=normalize_state(value))
@@ -0,0 +1,39 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from sales.models import Platform
+from sales.tasks import IMPORT_ENGINES
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/sec of the import engines on a CSV file (changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('platform', help='Platform name, e.g. Amazon')
+        parser.add_argument('file_path', help='Path to a CSV export of that platform')
+        parser.add_argument(
+            '--engines', nargs='+', default=list(IMPORT_ENGINES),
+            choices=list(IMPORT_ENGINES), help='Engines to benchmark'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            platform = Platform.objects.get(platform_name__iexact=options['platform'])
+        except Platform.DoesNotExist:
+            raise CommandError(f"Platform '{options['platform']}' not found.")
+
+        for engine in options['engines']:
+            with open(options['file_path'], 'r') as file, transaction.atomic():
+                start = time.perf_counter()
+                rows = IMPORT_ENGINES[engine](platform, csv.reader(file))
+                elapsed = time.perf_counter() - start
+                # Every engine starts from the same database state.
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f'{engine:>6}: {rows} rows in {elapsed:.2f}s '
+                f'({rows / elapsed if elapsed else 0:,.0f} rows/sec)'
+            )
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from sales.exports import orders_with_details
+from sales.models import OrderLine
+from sales.serializers import OrderRowSerializer, OrderSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-order cost of OrderSerializer and the OrderRowSerializer fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000, help='Orders serialized per run, like a page size')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per serializer, the best one is reported')
+
+    def handle(self, *args, **options):
+        if options['orders'] < 1 or options['repeat'] < 1:
+            raise CommandError('--orders and --repeat must be positive.')
+
+        def model_serializer():
+            orders = list(orders_with_details()[:options['orders']])
+            start = time.process_time()
+            data = OrderSerializer(orders, many=True).data
+            return data, time.process_time() - start
+
+        def row_serializer():
+            rows = list(OrderLine.objects.filter(line_number=1).order_by('order_id').values(
+                'order_id')[:options['orders']])
+            serializer = OrderRowSerializer(rows)
+            start = time.process_time()
+            data = serializer.data
+            return data, time.process_time() - start
+
+        results = {}
+        for name, run in (('model', model_serializer), ('rows', row_serializer)):
+            serialize_timings, total_timings = [], []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                data, serialize_seconds = run()
+                total_timings.append(time.perf_counter() - start)
+                serialize_timings.append(serialize_seconds)
+            results[name] = JSONRenderer().render(data)
+            orders = len(data) or 1
+            self.stdout.write(
+                f'{name:>6}: {len(data)} orders, {min(serialize_timings) / orders * 1e6:.1f} µs/order CPU '
+                f'serializing, {min(total_timings) / orders * 1e6:.1f} µs/order with the queries'
+            )
+
+        if results['rows'] != results['model']:
+            raise CommandError('The serializers rendered different JSON.')
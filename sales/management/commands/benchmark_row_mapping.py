@@ -0,0 +1,96 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.models import Platform
+from sales.row_mapper import cached_parse_date, compile_row_mapper
+from sales.utils import parse_date, parse_state
+
+
+def extract_platform_data(platform_config, row):
+    """
+    Extracts platform-specific data from a row.
+    """
+    platform_data_field_mapping = platform_config.get('platform_data_field_mapping', {})
+    return {k: row.get(v) for k, v in platform_data_field_mapping.items()}
+
+
+def extract_delivery_data(platform_config, row):
+    """
+    Extracts platform-specific delivery data from a row.
+    """
+    delivery_data_field_mapping = platform_config.get('delivery_data_field_mapping', {})
+    return {k: row.get(v) for k, v in delivery_data_field_mapping.items()}
+
+
+def map_dict_row(platform_config, row):
+    """
+    Per-row mapping of a ``csv.DictReader`` row as the import engines did it before
+    ``RowMapper``, kept as the benchmark baseline.
+    """
+    field_mapping = platform_config.get('field_mapping', {})
+    item_quantity = float(row.get(field_mapping.get('item_quantity'), 0))
+    item_selling_price = float(row.get(field_mapping.get('item_selling_price'), 0))
+    return (
+        row.get(field_mapping.get('customer_id')),
+        row.get(field_mapping.get('customer_name')),
+        row.get(field_mapping.get('contact_email')),
+        row.get(field_mapping.get('phone_number')),
+        row.get(field_mapping.get('product_id')),
+        row.get(field_mapping.get('product_name')),
+        row.get(field_mapping.get('product_category')),
+        row.get(field_mapping.get('order_id')),
+        parse_date(row.get(field_mapping.get('order_date')), platform_config.get('order_date_format')),
+        extract_platform_data(platform_config, row),
+        item_quantity,
+        item_selling_price,
+        item_quantity * item_selling_price,
+        row.get(field_mapping.get('delivery_address')),
+        parse_date(row.get(field_mapping.get('delivery_date')), platform_config.get('delivery_date_format')),
+        row.get(field_mapping.get('delivery_status')),
+        row.get(field_mapping.get('delivery_partner')),
+        extract_delivery_data(platform_config, row),
+        parse_state(row.get(field_mapping.get('delivery_address'))),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-row CPU cost of DictReader mapping and the compiled RowMapper on a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('platform', help='Platform name, e.g. Amazon')
+        parser.add_argument('file_path', help='Path to a CSV export of that platform')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per mapper, the best one is reported')
+
+    def handle(self, *args, **options):
+        try:
+            platform = Platform.objects.get(platform_name__iexact=options['platform'])
+        except Platform.DoesNotExist:
+            raise CommandError(f"Platform '{options['platform']}' not found.")
+
+        platform_config = platform.platform_config
+        with open(options['file_path'], 'r', newline='') as file:
+            lines = file.readlines()
+
+        def dict_reader():
+            return [map_dict_row(platform_config, row) for row in csv.DictReader(lines)]
+
+        def row_mapper():
+            cached_parse_date.cache_clear()
+            reader = csv.reader(lines)
+            return list(compile_row_mapper(platform_config, reader).map_rows(reader))
+
+        results = {}
+        for name, run in (('dict', dict_reader), ('compiled', row_mapper)):
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.process_time()
+                rows = run()
+                timings.append(time.process_time() - start)
+            results[name] = rows
+            per_row = min(timings) / len(rows) * 1e6 if rows else 0
+            self.stdout.write(f'{name:>8}: {len(rows)} rows, {per_row:.2f} µs/row CPU')
+
+        if [tuple(row) for row in results['compiled']] != results['dict']:
+            raise CommandError('The mappers produced different rows.')
@@ -0,0 +1,80 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.analytics import (SnapshotAnalytics, SQLAnalytics, compare_analytics,
+                             consistency_scenarios, refresh_analytics_snapshot)
+from sales.models import Delivery, Order, Platform, Product
+
+
+class Command(BaseCommand):
+    help = 'Check that the duckdb analytics engine returns the same results as SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true', help='Refresh the snapshot first')
+
+    def handle(self, *args, **options):
+        if options['refresh']:
+            refresh_analytics_snapshot()
+        elif not SnapshotAnalytics().available():
+            raise CommandError('The analytics snapshot was not built yet, run with --refresh.')
+
+        scenarios = consistency_scenarios(self.filter_params())
+        timings = {}
+
+        class TimedEngine:
+            def __init__(self, engine):
+                self.engine = engine
+                self.name = engine.name
+                timings[self.name] = 0.0
+
+            def __getattr__(self, method):
+                def timed(*args):
+                    start = time.perf_counter()
+                    try:
+                        return getattr(self.engine, method)(*args)
+                    finally:
+                        timings[self.name] += time.perf_counter() - start
+                return timed
+
+        mismatches = compare_analytics(scenarios, TimedEngine(SQLAnalytics()), TimedEngine(SnapshotAnalytics()))
+        for mismatch in mismatches:
+            self.stderr.write(f"Mismatch in {mismatch['name']}:\n  sql: {mismatch['sql']}\n  duckdb: {mismatch['duckdb']}")
+        self.stdout.write(
+            f"{len(scenarios)} scenarios, {len(mismatches)} mismatches; "
+            + ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in timings.items())
+        )
+        if mismatches:
+            raise CommandError('The analytics snapshot differs from the database, refresh it with --full.')
+
+    def filter_params(self):
+        """
+        Filter combinations built from the data: a date range, and the first platform,
+        category, delivery status and state.
+        """
+        params = [{}]
+        first_order = Order.objects.order_by('order_date').first()
+        if first_order is None:
+            return params
+
+        platform = Platform.objects.order_by('platform_name').values_list('platform_name', flat=True).first()
+        category = Product.objects.order_by('category').values_list('category', flat=True).first()
+        delivery = Delivery.objects.exclude(delivery_state='').order_by('delivery_state').first()
+        params += [
+            {
+                'start_date': first_order.order_date.isoformat(),
+                'end_date': (first_order.order_date + timedelta(days=365)).isoformat(),
+            },
+            {'platform': platform.lower()},
+            {'category': category.upper()},
+            {'delivery_status': 'Cancelled'},
+        ]
+        if delivery is not None:
+            params.append({'state': delivery.delivery_state.title()})
+            params.append({
+                'start_date': first_order.order_date.isoformat(), 'platform': platform,
+                'category': category, 'state': delivery.delivery_state,
+                'delivery_status': delivery.delivery_status,
+            })
+        return params
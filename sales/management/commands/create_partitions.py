@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.partitions import ensure_partitions, upcoming_months
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly partitions of orders and order_items for the coming months'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int, default=settings.PARTITION_MONTHS_AHEAD,
+            help='Months to create ahead of the start month'
+        )
+        parser.add_argument('--start', help='First month to create, as YYYY-MM (the current month by default)')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['start']:
+            try:
+                start = datetime.strptime(options['start'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--start must be a month like 2025-01.')
+        if options['months'] < 0:
+            raise CommandError('--months cannot be negative.')
+
+        created = ensure_partitions(upcoming_months(options['months'], start))
+        if created:
+            self.stdout.write(f"Created partitions: {', '.join(created)}.")
+        else:
+            self.stdout.write('All partitions already exist.')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.benchmarks import write_platform_csv
+from sales.models import Platform
+
+
+class Command(BaseCommand):
+    help = 'Write a deterministic synthetic CSV export of a platform, matching its field mappings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('platform', help='Platform name, e.g. Amazon')
+        parser.add_argument('file_path', help='Path of the CSV file to write')
+        parser.add_argument('--rows', type=int, default=10000, help='Number of order item rows')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed always writes the same file')
+
+    def handle(self, *args, **options):
+        try:
+            platform = Platform.objects.get(platform_name__iexact=options['platform'])
+        except Platform.DoesNotExist:
+            raise CommandError(f"Platform '{options['platform']}' not found.")
+        if options['rows'] < 1:
+            raise CommandError('--rows must be positive.')
+
+        with open(options['file_path'], 'w', newline='') as file:
+            write_platform_csv(
+                file, platform.platform_name, platform.platform_config, options['rows'], options['seed']
+            )
+        self.stdout.write(f"Wrote {options['rows']} {platform.platform_name} rows to {options['file_path']}.")
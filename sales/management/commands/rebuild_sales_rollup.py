@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sales.rollups import rebuild_monthly_rollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly sales rollup from scratch from the order items'
+
+    def handle(self, *args, **kwargs):
+        groups = rebuild_monthly_rollup()
+        self.stdout.write(f'Monthly sales rollup rebuilt with {groups} rows.')
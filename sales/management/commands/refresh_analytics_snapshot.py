@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from sales.analytics import refresh_analytics_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Refresh the Parquet snapshot of the order lines read by the duckdb analytics engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rewrite every month')
+        parser.add_argument('--months', nargs='+', default=(), help='Months to rewrite too, as YYYY-MM')
+
+    def handle(self, *args, **options):
+        result = refresh_analytics_snapshot(options['months'], options['full'])
+        self.stdout.write(
+            f"Analytics snapshot refreshed: {result['rows_written']} rows of "
+            f"{len(result['months_written'])} months written, {len(result['months_removed'])} months removed."
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sales.exports import refresh_order_lines
+
+
+class Command(BaseCommand):
+    help = 'Refresh the order_lines view read by the order listing and export'
+
+    def handle(self, *args, **kwargs):
+        refresh_order_lines()
+        self.stdout.write('order_lines refreshed.')
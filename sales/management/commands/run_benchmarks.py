@@ -0,0 +1,93 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from sales.benchmarks import (benchmark_endpoint, benchmark_environment, benchmark_import,
+                              endpoint_scenarios)
+from sales.exports import refresh_order_lines
+from sales.models import Platform
+from sales.tasks import IMPORT_ENGINES
+
+
+class Command(BaseCommand):
+    help = (
+        'Import synthetic exports of every platform, time the dashboard endpoints on them '
+        'and write the results as JSON (changes are rolled back unless --keep-data is given)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Rows imported per platform')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data')
+        parser.add_argument('--platforms', nargs='+', help='Platforms to import, all by default')
+        parser.add_argument(
+            '--engine', choices=list(IMPORT_ENGINES),
+            help='Import engine to use instead of the one of each platform config'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Calls per endpoint scenario')
+        parser.add_argument(
+            '--skip-import', action='store_true',
+            help='Only time the endpoints, on the data already in the database'
+        )
+        parser.add_argument('--keep-data', action='store_true', help='Commit the imported data')
+        parser.add_argument(
+            '--output', default='benchmark-results.json', help='JSON file to write the results to'
+        )
+
+    def handle(self, *args, **options):
+        platforms = Platform.objects.order_by('platform_name')
+        if options['platforms']:
+            platforms = platforms.filter(platform_name__in=options['platforms'])
+        platforms = list(platforms)
+        if not platforms:
+            raise CommandError('No platforms to benchmark, load them with import_configs first.')
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError('--rows and --repeat must be positive.')
+
+        results = {
+            **benchmark_environment(),
+            'rows_per_platform': 0 if options['skip_import'] else options['rows'],
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'imports': {},
+            'endpoints': {},
+        }
+
+        with transaction.atomic():
+            if not options['skip_import']:
+                for platform in platforms:
+                    if options['engine']:
+                        platform.platform_config = {
+                            **platform.platform_config, 'import_engine': options['engine']
+                        }
+                    try:
+                        stats = benchmark_import(platform, options['rows'], options['seed'])
+                    except ValueError as e:
+                        raise CommandError(str(e))
+                    results['imports'][platform.platform_name] = stats
+                    self.stdout.write(
+                        f"import {platform.platform_name} ({stats['engine']}): "
+                        f"{stats['rows_committed']} rows in {stats['elapsed_seconds']}s "
+                        f"({stats['rows_per_sec']:,.0f} rows/sec)"
+                    )
+
+                # As the import tasks do once done, for the listing and export
+                start = time.perf_counter()
+                refresh_order_lines()
+                results['order_lines_refresh_seconds'] = round(time.perf_counter() - start, 3)
+                self.stdout.write(f"order_lines refresh: {results['order_lines_refresh_seconds']}s")
+
+            for name, view, url_name, params in endpoint_scenarios([p.platform_name for p in platforms]):
+                result = benchmark_endpoint(view, url_name, params, options['repeat'])
+                results['endpoints'][name] = result
+                self.stdout.write(
+                    f"{name}: p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms, "
+                    f"{result['queries']} queries, {result['response_bytes']} bytes"
+                )
+
+            transaction.set_rollback(not options['keep_data'])
+
+        with open(options['output'], 'w') as file:
+            json.dump(results, file, indent=2, default=str)
+        self.stdout.write(f"Results written to {options['output']}.")
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_monthly_rollup(apps, schema_editor):
+    MonthlySalesRollup = apps.get_model('sales', 'MonthlySalesRollup')
+    OrderItem = apps.get_model('sales', 'OrderItem')
+
+    groups = OrderItem.objects.annotate(
+        month=TruncMonth('order__order_date')).values(
+        'month', 'order__platform_id', 'product__category').annotate(
+        total_quantity=Sum('quantity_sold'),
+        total_revenue=Sum('total_sale_value')).order_by()
+
+    MonthlySalesRollup.objects.bulk_create(
+        MonthlySalesRollup(
+            month=group['month'],
+            platform_id=group['order__platform_id'],
+            category=group['product__category'],
+            total_quantity=group['total_quantity'],
+            total_revenue=group['total_revenue'],
+        ) for group in groups.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('category', models.CharField(max_length=100)),
+                ('total_quantity', models.BigIntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sales.platform')),
+            ],
+            options={
+                'db_table': 'monthly_sales_rollup',
+                'unique_together': {('month', 'platform', 'category')},
+            },
+        ),
+        migrations.RunPython(backfill_monthly_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:26
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0002_monthlysalesrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filters', models.JSONField(default=dict)),
+                ('filters_hash', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('row_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('file_path', models.CharField(blank=True, max_length=255, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'export_jobs',
+                'indexes': [models.Index(fields=['filters_hash', 'created_at'], name='export_jobs_filters_620db1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:28
+
+import re
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# Frozen copy of sales.utils.parse_state as of this migration, so later changes
+# to it do not change the states it backfills.
+STATE_NOISE = re.compile(r'[^A-Za-z&]+')
+COUNTRY_NAMES = {'INDIA'}
+
+
+def parse_state(address):
+    for part in reversed((address or '').split(',')):
+        state = ' '.join(STATE_NOISE.sub(' ', part).split()).upper()
+        if state and state not in COUNTRY_NAMES:
+            return state
+    return ''
+
+
+def backfill_delivery_state(apps, schema_editor):
+    Delivery = apps.get_model('sales', 'Delivery')
+
+    batch = []
+    for delivery in Delivery.objects.only('delivery_id', 'delivery_address').iterator(chunk_size=2000):
+        delivery.delivery_state = parse_state(delivery.delivery_address)
+        batch.append(delivery)
+        if len(batch) == 2000:
+            Delivery.objects.bulk_update(batch, ['delivery_state'])
+            batch = []
+    Delivery.objects.bulk_update(batch, ['delivery_state'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0003_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='delivery_state',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(backfill_delivery_state, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_state'], name='deliveries_deliver_586264_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Upper('category'), name='products_category_upper_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_delivery_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64)),
+                ('chunk_start', models.BigIntegerField(default=0)),
+                ('byte_offset', models.BigIntegerField(default=0)),
+                ('row_count', models.BigIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sales.platform')),
+            ],
+            options={
+                'db_table': 'import_checkpoints',
+                'unique_together': {('platform', 'file_hash', 'chunk_start')},
+            },
+        ),
+    ]
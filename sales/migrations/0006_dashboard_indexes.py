@@ -0,0 +1,54 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:51
+
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built and dropped without locking out imports; the new ones are
+    # created before the ones they replace are dropped.
+    atomic = False
+
+    dependencies = [
+        ('sales', '0005_importcheckpoint'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_status', 'order'], name='deliveries_status_order_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_state', 'order'], name='deliveries_state_order_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['order_date'], include=('order_id', 'platform'), name='orders_date_covering_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['platform', 'order_date'], include=('order_id',), name='orders_platform_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='orderitem',
+            index=models.Index(fields=['order'], include=('product', 'quantity_sold', 'total_sale_value'), name='order_items_order_covering_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='delivery',
+            name='deliveries_deliver_db2090_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='delivery',
+            name='deliveries_deliver_586264_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='order',
+            name='orders_order_d_6e39a9_idx',
+        ),
+        # Duplicate of the index Django creates for the product foreign key
+        RemoveIndexConcurrently(
+            model_name='orderitem',
+            name='order_items_product_a53db1_idx',
+        ),
+    ]
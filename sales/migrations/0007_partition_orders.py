@@ -0,0 +1,150 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:05
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# Primary and unique keys of partitioned tables must contain order_date, so the
+# foreign keys to orders are not enforced by the database anymore.
+PARTITIONED_TABLES_SQL = {
+    'orders': [
+        'ALTER TABLE orders ADD CONSTRAINT orders_pkey PRIMARY KEY (order_id, order_date)',
+        'ALTER TABLE orders ADD CONSTRAINT orders_customer_id_b7016332_fk_customers_customer_id '
+        'FOREIGN KEY (customer_id) REFERENCES customers (customer_id) DEFERRABLE INITIALLY DEFERRED',
+        'ALTER TABLE orders ADD CONSTRAINT orders_platform_id_a1a14b41_fk_platforms_platform_id '
+        'FOREIGN KEY (platform_id) REFERENCES platforms (platform_id) DEFERRABLE INITIALLY DEFERRED',
+        'CREATE INDEX orders_customer_id_b7016332 ON orders (customer_id)',
+        'CREATE INDEX orders_platform_id_a1a14b41 ON orders (platform_id)',
+        'CREATE INDEX orders_date_covering_idx ON orders (order_date) INCLUDE (order_id, platform_id)',
+        'CREATE INDEX orders_platform_date_idx ON orders (platform_id, order_date) INCLUDE (order_id)',
+        'CREATE INDEX orders_platfor_474023_gin ON orders USING gin (platform_data)',
+    ],
+    'order_items': [
+        'ALTER TABLE order_items ADD CONSTRAINT order_items_pkey PRIMARY KEY (order_item_id, order_date)',
+        'ALTER TABLE order_items ADD CONSTRAINT order_items_order_id_product_id_sell_90e82333_uniq '
+        'UNIQUE (order_id, product_id, selling_price, order_date)',
+        'ALTER TABLE order_items ADD CONSTRAINT order_items_product_id_dd557d5a_fk_products_product_id '
+        'FOREIGN KEY (product_id) REFERENCES products (product_id) DEFERRABLE INITIALLY DEFERRED',
+        'ALTER TABLE order_items ADD CONSTRAINT order_items_quantity_sold_check CHECK (quantity_sold >= 0)',
+        'CREATE INDEX order_items_order_id_412ad78b ON order_items (order_id)',
+        'CREATE INDEX order_items_product_id_dd557d5a ON order_items (product_id)',
+        'CREATE INDEX order_items_order_covering_idx ON order_items (order_id) '
+        'INCLUDE (product_id, quantity_sold, total_sale_value)',
+    ],
+}
+
+
+# Frozen copies of the sales.partitions helpers as of this migration, so later
+# changes to them do not change what it does.
+def month_start(value):
+    return value.replace(day=1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upcoming_months(months_ahead):
+    start = month_start(timezone.now().date())
+    return [add_months(start, months) for months in range(months_ahead + 1)]
+
+
+def create_partition(cursor, table, month):
+    name = f'{table}_{month:%Y_%m}'
+    bounds = [month, add_months(month, 1)]
+    cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM {table}_default WHERE order_date >= %s AND order_date < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+        """,
+        bounds
+    )
+    cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', bounds)
+
+
+def partition_tables(apps, schema_editor):
+    execute = schema_editor.execute
+    execute('ALTER TABLE order_items ADD COLUMN order_date date')
+    execute(
+        'UPDATE order_items SET order_date = orders.order_date '
+        'FROM orders WHERE orders.order_id = order_items.order_id'
+    )
+    execute('ALTER TABLE order_items ALTER COLUMN order_date SET NOT NULL')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(order_date), MAX(order_date) FROM orders')
+        first_date, last_date = cursor.fetchone()
+
+    # Months of the existing orders, and up to three months ahead
+    months = upcoming_months(3)
+    if first_date is not None:
+        month = month_start(first_date)
+        months = []
+        while month <= max(month_start(last_date), upcoming_months(3)[-1]):
+            months.append(month)
+            month = add_months(month, 1)
+
+    for table, statements in PARTITIONED_TABLES_SQL.items():
+        execute(f'ALTER TABLE {table} RENAME TO {table}_unpartitioned')
+        execute(
+            f'CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (order_date)'
+        )
+        execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+        with schema_editor.connection.cursor() as cursor:
+            for month in months:
+                create_partition(cursor, table, month)
+        execute(f'INSERT INTO {table} SELECT * FROM {table}_unpartitioned')
+        # Drops the foreign keys referencing the old table too
+        execute(f'DROP TABLE {table}_unpartitioned CASCADE')
+        for statement in statements:
+            execute(statement)
+
+    execute(
+        "SELECT setval(pg_get_serial_sequence('order_items', 'order_item_id'), "
+        "COALESCE(MAX(order_item_id), 0) + 1, false) FROM order_items"
+    )
+    execute('ANALYZE orders, order_items')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(partition_tables),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='orderitem',
+                    name='order_date',
+                    field=models.DateField(),
+                    preserve_default=False,
+                ),
+                migrations.AlterField(
+                    model_name='orderitem',
+                    name='order',
+                    field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='sales.order'),
+                ),
+                migrations.AlterField(
+                    model_name='delivery',
+                    name='order',
+                    field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='sales.order'),
+                ),
+                migrations.AlterUniqueTogether(
+                    name='orderitem',
+                    unique_together={('order', 'product', 'selling_price', 'order_date')},
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+CREATE_ORDER_LINES_SQL = """
+    CREATE MATERIALIZED VIEW order_lines AS
+    SELECT
+        orders.order_id, items.order_item_id,
+        ROW_NUMBER() OVER (PARTITION BY orders.order_id ORDER BY items.order_item_id) AS line_number,
+        orders.order_date, orders.customer_id, orders.platform_id, platforms.platform_name,
+        orders.platform_data, items.product_id, products.product_name, products.category,
+        items.quantity_sold, items.selling_price, items.total_sale_value,
+        deliveries.delivery_id, deliveries.delivery_address, deliveries.delivery_date,
+        deliveries.delivery_status, deliveries.delivery_partner, deliveries.delivery_data,
+        deliveries.delivery_state
+    FROM orders
+    JOIN platforms ON platforms.platform_id = orders.platform_id
+    LEFT JOIN order_items AS items ON items.order_id = orders.order_id AND items.order_date = orders.order_date
+    LEFT JOIN products ON products.product_id = items.product_id
+    LEFT JOIN deliveries ON deliveries.order_id = orders.order_id
+"""
+
+ORDER_LINES_INDEXES_SQL = [
+    # Required by REFRESH MATERIALIZED VIEW CONCURRENTLY; also reads the lines of a page of orders
+    'CREATE UNIQUE INDEX order_lines_order_item_uniq ON order_lines (order_id, order_item_id)',
+    # Pages of orders, by order_id or by (order_date, order_id), read their first lines
+    'CREATE INDEX order_lines_first_line_idx ON order_lines (order_id) WHERE line_number = 1',
+    'CREATE INDEX order_lines_first_line_date_idx ON order_lines (order_date, order_id) WHERE line_number = 1',
+    # OrderLineFilter fields; platform and category are compared case-insensitively
+    'CREATE INDEX order_lines_platform_idx ON order_lines (UPPER(platform_name::text), order_id)',
+    'CREATE INDEX order_lines_category_idx ON order_lines (UPPER(category::text), order_id)',
+    'CREATE INDEX order_lines_status_idx ON order_lines (delivery_status, order_id)',
+    'CREATE INDEX order_lines_state_idx ON order_lines (delivery_state, order_id)',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_partition_orders'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [CREATE_ORDER_LINES_SQL, *ORDER_LINES_INDEXES_SQL],
+            reverse_sql='DROP MATERIALIZED VIEW order_lines',
+        ),
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('order_item_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('order_id', models.CharField(max_length=50)),
+                ('line_number', models.BigIntegerField()),
+                ('order_date', models.DateField()),
+                ('customer_id', models.CharField(max_length=50)),
+                ('platform_id', models.UUIDField()),
+                ('platform_name', models.CharField(max_length=100)),
+                ('platform_data', models.JSONField(null=True)),
+                ('product_id', models.CharField(max_length=50, null=True)),
+                ('product_name', models.CharField(max_length=255, null=True)),
+                ('category', models.CharField(max_length=100, null=True)),
+                ('quantity_sold', models.PositiveIntegerField(null=True)),
+                ('selling_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('total_sale_value', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('delivery_id', models.IntegerField(null=True)),
+                ('delivery_address', models.CharField(max_length=255, null=True)),
+                ('delivery_date', models.DateField(null=True)),
+                ('delivery_status', models.CharField(max_length=50, null=True)),
+                ('delivery_partner', models.CharField(max_length=100, null=True)),
+                ('delivery_data', models.JSONField(null=True)),
+                ('delivery_state', models.CharField(max_length=100, null=True)),
+            ],
+            options={
+                'db_table': 'order_lines',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,145 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+# Orders stored under more than one order_date keep the earliest one: the items
+# of the others move to it, unless it has the same item already, and the rollup
+# and order lines are rebuilt.
+MERGE_DUPLICATE_ORDERS_SQL = [
+    """
+    CREATE TEMPORARY TABLE first_order_dates ON COMMIT DROP AS
+    SELECT order_id, MIN(order_date) AS order_date
+    FROM orders
+    GROUP BY order_id
+    HAVING COUNT(*) > 1
+    """,
+    """
+    DELETE FROM order_items
+    WHERE (order_item_id, order_date) IN (
+        SELECT order_item_id, order_date
+        FROM (
+            SELECT
+                items.order_item_id, items.order_date,
+                ROW_NUMBER() OVER (
+                    PARTITION BY items.order_id, items.product_id, items.selling_price ORDER BY items.order_date
+                ) AS item_number
+            FROM order_items AS items
+            JOIN first_order_dates USING (order_id)
+        ) AS ranked
+        WHERE item_number > 1
+    )
+    """,
+    """
+    UPDATE order_items SET order_date = first_order_dates.order_date
+    FROM first_order_dates
+    WHERE order_items.order_id = first_order_dates.order_id
+        AND order_items.order_date <> first_order_dates.order_date
+    """,
+    """
+    DELETE FROM orders USING first_order_dates
+    WHERE orders.order_id = first_order_dates.order_id AND orders.order_date <> first_order_dates.order_date
+    """,
+    'DELETE FROM monthly_sales_rollup',
+    """
+    INSERT INTO monthly_sales_rollup (month, platform_id, category, total_quantity, total_revenue)
+    SELECT
+        DATE_TRUNC('month', items.order_date)::date, orders.platform_id, products.category,
+        SUM(items.quantity_sold), SUM(items.total_sale_value)
+    FROM order_items AS items
+    JOIN orders ON orders.order_id = items.order_id AND orders.order_date = items.order_date
+    JOIN products ON products.product_id = items.product_id
+    GROUP BY 1, 2, 3
+    """,
+    'REFRESH MATERIALIZED VIEW order_lines',
+]
+
+# Statement-level triggers keep order_keys in step with the statements run on
+# orders, including updates moving orders to another order_date partition.
+# Statements run on a partition directly, like create_partition moving rows out
+# of the default partition, leave the orders where they are and do not fire them.
+ORDER_KEYS_TRIGGERS_SQL = [
+    'INSERT INTO order_keys (order_id, order_date) SELECT order_id, order_date FROM orders',
+    """
+    CREATE FUNCTION order_keys_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO order_keys (order_id, order_date)
+        SELECT order_id, order_date FROM new_orders ORDER BY order_id;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE FUNCTION order_keys_update() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        DELETE FROM order_keys USING (
+            SELECT order_id, order_date FROM old_orders
+            EXCEPT SELECT order_id, order_date FROM new_orders
+        ) AS moved
+        WHERE order_keys.order_id = moved.order_id AND order_keys.order_date = moved.order_date;
+        INSERT INTO order_keys (order_id, order_date)
+        SELECT order_id, order_date FROM (
+            SELECT order_id, order_date FROM new_orders
+            EXCEPT SELECT order_id, order_date FROM old_orders
+        ) AS moved
+        ORDER BY order_id;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE FUNCTION order_keys_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        DELETE FROM order_keys USING old_orders
+        WHERE order_keys.order_id = old_orders.order_id AND order_keys.order_date = old_orders.order_date;
+        RETURN NULL;
+    END
+    $$
+    """,
+    'CREATE TRIGGER order_keys_insert AFTER INSERT ON orders '
+    'REFERENCING NEW TABLE AS new_orders FOR EACH STATEMENT EXECUTE FUNCTION order_keys_insert()',
+    'CREATE TRIGGER order_keys_update AFTER UPDATE ON orders '
+    'REFERENCING OLD TABLE AS old_orders NEW TABLE AS new_orders FOR EACH STATEMENT EXECUTE FUNCTION order_keys_update()',
+    'CREATE TRIGGER order_keys_delete AFTER DELETE ON orders '
+    'REFERENCING OLD TABLE AS old_orders FOR EACH STATEMENT EXECUTE FUNCTION order_keys_delete()',
+]
+
+DROP_ORDER_KEYS_TRIGGERS_SQL = [
+    'DROP TRIGGER order_keys_insert ON orders',
+    'DROP TRIGGER order_keys_update ON orders',
+    'DROP TRIGGER order_keys_delete ON orders',
+    'DROP FUNCTION order_keys_insert()',
+    'DROP FUNCTION order_keys_update()',
+    'DROP FUNCTION order_keys_delete()',
+    'DELETE FROM order_keys',
+]
+
+
+def merge_duplicate_orders(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM orders GROUP BY order_id HAVING COUNT(*) > 1)')
+        if not cursor.fetchone()[0]:
+            return
+        for statement in MERGE_DUPLICATE_ORDERS_SQL:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_order_lines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderKey',
+            fields=[
+                ('order_id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('order_date', models.DateField()),
+            ],
+            options={
+                'db_table': 'order_keys',
+            },
+        ),
+        migrations.RunPython(merge_duplicate_orders, migrations.RunPython.noop),
+        migrations.RunSQL(ORDER_KEYS_TRIGGERS_SQL, reverse_sql=DROP_ORDER_KEYS_TRIGGERS_SQL),
+    ]
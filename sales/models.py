@@ -1,6 +1,7 @@
 from uuid import uuid4
 from django.db import models
 from django.contrib.postgres.indexes import GinIndex
+from django.db.models.functions import Upper
 
 
 class Customer(models.Model):
@@ -25,6 +26,8 @@ class Product(models.Model):
         db_table = 'products'
         indexes = [
             models.Index(fields=['category']),
+            # Serves the case-insensitive category filter
+            models.Index(Upper('category'), name='products_category_upper_idx'),
         ]
 
     def __str__(self):
@@ -47,6 +50,9 @@ class Platform(models.Model):
 
 
 class Order(models.Model):
+    # The table is range-partitioned by month of order_date (see sales.partitions),
+    # so its primary key is (order_id, order_date) in the database. order_keys
+    # keeps order_id unique across partitions (see OrderKey).
     order_id = models.CharField(max_length=50, primary_key=True)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     platform = models.ForeignKey(Platform, on_delete=models.CASCADE)
@@ -56,27 +62,54 @@ class Order(models.Model):
     class Meta:
         db_table = 'orders'
         indexes = [
-            models.Index(fields=['order_date']),
+            # Date ranges and series read the orders and their platform from the index alone
+            models.Index(fields=['order_date'], include=['order_id', 'platform'], name='orders_date_covering_idx'),
+            # Orders of a platform over a date range
+            models.Index(fields=['platform', 'order_date'], include=['order_id'], name='orders_platform_date_idx'),
             GinIndex(fields=['platform_data']),
         ]
 
     def __str__(self):
         return self.order_id
 
+class OrderKey(models.Model):
+    """
+    The order_date of every order, maintained from orders by database triggers
+    (see migration 0009). Its primary key keeps order_id unique, which the
+    partitioned orders table cannot enforce, and imports look up the date
+    orders are stored under in it.
+    """
+    order_id = models.CharField(max_length=50, primary_key=True)
+    order_date = models.DateField()
+
+    class Meta:
+        db_table = 'order_keys'
+
+    def __str__(self):
+        return f'{self.order_id} ({self.order_date})'
+
+
 class OrderItem(models.Model):
     order_item_id = models.AutoField(primary_key=True)
-    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items')
+    # Partitioned tables cannot be referenced by foreign keys without their partition key
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items', db_constraint=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity_sold = models.PositiveIntegerField()
     selling_price = models.DecimalField(max_digits=10, decimal_places=2)
     total_sale_value = models.DecimalField(max_digits=12, decimal_places=2)
+    # Date of the order, by whose month the table is partitioned like orders
+    order_date = models.DateField()
 
     class Meta:
         db_table = 'order_items'
         indexes = [
-            models.Index(fields=['product']),
+            # Aggregates joining the items of orders read them from the index alone
+            models.Index(
+                fields=['order'], include=['product', 'quantity_sold', 'total_sale_value'],
+                name='order_items_order_covering_idx'
+            ),
         ]
-        unique_together = ('order', 'product', 'selling_price')
+        unique_together = ('order', 'product', 'selling_price', 'order_date')
 
     def __str__(self):
         return f'{self.order.order_id} - {self.product.product_name}'
@@ -84,20 +117,132 @@ class OrderItem(models.Model):
 
 class Delivery(models.Model):
     delivery_id = models.AutoField(primary_key=True)
-    order = models.OneToOneField(Order, on_delete=models.CASCADE)
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, db_constraint=False)
     delivery_address = models.CharField(max_length=255)
     delivery_date = models.DateField()
     delivery_status = models.CharField(max_length=50)
     delivery_partner = models.CharField(max_length=100, null=True, blank=True)
     delivery_data = models.JSONField(null=True, blank=True)
+    # Normalized state derived from delivery_address at import time, see parse_state
+    delivery_state = models.CharField(max_length=100, blank=True, default='')
 
     class Meta:
         db_table = 'deliveries'
         indexes = [
-            models.Index(fields=['delivery_status']),
+            # The status and state filters find the orders from the index alone
+            models.Index(fields=['delivery_status', 'order'], name='deliveries_status_order_idx'),
+            models.Index(fields=['delivery_state', 'order'], name='deliveries_state_order_idx'),
             GinIndex(fields=['delivery_data']),
         ]
         unique_together = ('order', 'delivery_status', 'delivery_address')
 
     def __str__(self):
         return f'Delivery for Order {self.order.order_id}'
+
+
+class MonthlySalesRollup(models.Model):
+    month = models.DateField()
+    platform = models.ForeignKey(Platform, on_delete=models.CASCADE)
+    category = models.CharField(max_length=100)
+    total_quantity = models.BigIntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'monthly_sales_rollup'
+        unique_together = ('month', 'platform', 'category')
+
+    def __str__(self):
+        return f'{self.month:%Y-%m} - {self.platform.platform_name} - {self.category}'
+
+
+class OrderLine(models.Model):
+    """
+    Row of the ``order_lines`` materialized view (migration 0008): one per order
+    item, with its order, platform, product and delivery denormalized, read by the
+    order listing and export. Orders without items have a single line with no item
+    fields, and ``line_number`` 1 is the first line of every order. It is refreshed
+    concurrently after each import, see ``refresh_order_lines``.
+    """
+    # Not null but for orders without items; the view's unique key is (order_id, order_item_id)
+    order_item_id = models.IntegerField(primary_key=True)
+    order_id = models.CharField(max_length=50)
+    line_number = models.BigIntegerField()
+    order_date = models.DateField()
+    customer_id = models.CharField(max_length=50)
+    platform_id = models.UUIDField()
+    platform_name = models.CharField(max_length=100)
+    platform_data = models.JSONField(null=True)
+    product_id = models.CharField(max_length=50, null=True)
+    product_name = models.CharField(max_length=255, null=True)
+    category = models.CharField(max_length=100, null=True)
+    quantity_sold = models.PositiveIntegerField(null=True)
+    selling_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    total_sale_value = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    delivery_id = models.IntegerField(null=True)
+    delivery_address = models.CharField(max_length=255, null=True)
+    delivery_date = models.DateField(null=True)
+    delivery_status = models.CharField(max_length=50, null=True)
+    delivery_partner = models.CharField(max_length=100, null=True)
+    delivery_data = models.JSONField(null=True)
+    delivery_state = models.CharField(max_length=100, null=True)
+
+    class Meta:
+        db_table = 'order_lines'
+        managed = False
+
+    def __str__(self):
+        return f'{self.order_id} - {self.product_name}'
+
+
+class ExportJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job_id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    filters = models.JSONField(default=dict)
+    filters_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    row_count = models.PositiveIntegerField(null=True, blank=True)
+    file_path = models.CharField(max_length=255, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'export_jobs'
+        indexes = [
+            models.Index(fields=['filters_hash', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f'Export {self.job_id} ({self.status})'
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of importing one file, identified by its content hash. ``chunk_start``
+    is 0 for the whole file, or the first byte of a chunk of a parallel import.
+    """
+    platform = models.ForeignKey(Platform, on_delete=models.CASCADE)
+    file_hash = models.CharField(max_length=64)
+    chunk_start = models.BigIntegerField(default=0)
+    byte_offset = models.BigIntegerField(default=0)
+    row_count = models.BigIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'import_checkpoints'
+        unique_together = ('platform', 'file_hash', 'chunk_start')
+
+    def __str__(self):
+        return f'Import of {self.file_hash[:12]} at byte {self.byte_offset} ({self.row_count} rows)'
@@ -0,0 +1,144 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class OrderKeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination for orders, ordered by ``order_id`` or by
+    ``(order_date, order_id)``. Every page is fetched with an indexed range
+    condition on the last key of the previous page instead of an ``OFFSET``,
+    so deep pages cost the same as the first one. Pass ``count=false`` to skip
+    the ``COUNT(*)`` over the filtered orders.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 1000
+    orderings = {
+        'order_id': ('order_id',),
+        'order_date': ('order_date', 'order_id'),
+    }
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering_name, key, reverse = self.decode_cursor(request)
+        self.ordering = self.orderings[self.ordering_name]
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, 'true').lower() != 'false':
+            self.count = queryset.count()
+
+        if key is None:
+            queryset = queryset.order_by(*self.ordering)
+        elif reverse:
+            queryset = queryset.filter(self.keyset_condition(key, 'lt')).order_by(
+                *(f'-{field}' for field in self.ordering))
+        else:
+            queryset = queryset.filter(self.keyset_condition(key, 'gt')).order_by(*self.ordering)
+
+        # Fetching one extra row tells whether there is a page after this one.
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, key is not None
+
+        self.page = results
+        return results
+
+    def keyset_condition(self, key, lookup):
+        """
+        Builds the condition selecting rows after (``gt``) or before (``lt``) ``key``
+        in the current ordering. The leading inclusive bound lets PostgreSQL start
+        an index range scan at the key instead of filtering the whole table.
+        """
+        *leading_values, last_value = key
+        condition = Q(**{f'{self.ordering[-1]}__{lookup}': last_value})
+        for field, value in reversed(list(zip(self.ordering, leading_values))):
+            condition = Q(**{f'{field}__{lookup}': value}) | (Q(**{field: value}) & condition)
+
+        if leading_values:
+            condition &= Q(**{f'{self.ordering[0]}__{lookup}e': key[0]})
+        return condition
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def decode_cursor(self, request):
+        """
+        Returns ``(ordering, key, reverse)`` from the cursor query parameter, or the
+        first page of the requested ordering when there is no cursor.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            ordering = request.query_params.get(self.ordering_query_param, 'order_id')
+            if ordering not in self.orderings:
+                raise ValidationError({
+                    self.ordering_query_param: f"Must be one of {', '.join(self.orderings)}."
+                })
+            return ordering, None, False
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            ordering, key, reverse = cursor['o'], cursor['k'], bool(cursor['r'])
+            if ordering not in self.orderings or len(key) != len(self.orderings[ordering]):
+                raise ValueError
+            if ordering == 'order_date':
+                date.fromisoformat(key[0])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return ordering, key, reverse
+
+    def encode_cursor(self, row, reverse):
+        key = [str(get_value(row, field)) for field in self.ordering]
+        cursor = json.dumps({'o': self.ordering_name, 'k': key, 'r': int(reverse)})
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            urlsafe_b64encode(cursor.encode()).decode()
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+def get_value(row, field):
+    """
+    Reads a field from a model instance or a ``.values()`` dict.
+    """
+    return row[field] if isinstance(row, dict) else getattr(row, field)
@@ -0,0 +1,112 @@
+import logging
+from datetime import date
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Tables range-partitioned by month of order_date (see migration 0007). Each has
+# a DEFAULT partition, named <table>_default, for rows of months with no partition.
+PARTITIONED_TABLES = ('orders', 'order_items')
+
+# Serializes partition creation between concurrent imports
+PARTITION_LOCK_ID = 0x5A1E5
+
+# Monthly partitions known to exist in this process, to skip the catalog lookups
+known_partitions = set()
+
+
+def month_start(value):
+    return value.replace(day=1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_{month:%Y_%m}'
+
+
+def upcoming_months(months_ahead, start=None):
+    """
+    Returns the first days of the month of ``start`` (today by default) and of the ``months_ahead`` next ones.
+    """
+    start = month_start(start or timezone.now().date())
+    return [add_months(start, months) for months in range(months_ahead + 1)]
+
+
+def existing_partitions():
+    """
+    Returns the names of the partitions of the partitioned tables.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = ANY(%s)
+            """,
+            [list(PARTITIONED_TABLES)]
+        )
+        return {name for name, in cursor.fetchall()}
+
+
+def create_partition(cursor, table, month):
+    """
+    Creates the partition of ``table`` for ``month``. Rows of that month in the
+    default partition are moved to it, as attaching it would fail otherwise.
+    """
+    name = partition_name(table, month)
+    bounds = [month, add_months(month, 1)]
+    cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM {table}_default WHERE order_date >= %s AND order_date < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+        """,
+        bounds
+    )
+    if cursor.rowcount:
+        logger.warning(f'Moved {cursor.rowcount} rows of {table}_default to {name}')
+    cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', bounds)
+
+
+def ensure_partitions(months):
+    """
+    Creates the missing partitions of the months (first days of months) in
+    ``months``, for all the partitioned tables, and returns their names. Imports
+    call it before saving rows, so rows are routed to their monthly partition
+    rather than to the default one.
+    """
+    months = {month_start(month) for month in months}
+    missing = {
+        month for month in months
+        if any(partition_name(table, month) not in known_partitions for table in PARTITIONED_TABLES)
+    }
+    if not missing:
+        return []
+
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [PARTITION_LOCK_ID])
+        existing = existing_partitions()
+        for month in sorted(missing):
+            for table in PARTITIONED_TABLES:
+                if partition_name(table, month) not in existing:
+                    create_partition(cursor, table, month)
+                    created.append(partition_name(table, month))
+
+        # Remembered once committed, as an enclosing transaction may still roll them back
+        partitions = existing | set(created)
+        transaction.on_commit(lambda: known_partitions.update(partitions))
+
+    if created:
+        logger.info(f"Created partitions {', '.join(created)}")
+    return created
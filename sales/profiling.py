@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+current_profile = ContextVar('current_profile', default=None)
+
+PROFILED_METRICS = ('duration_ms', 'queries', 'db_ms', 'slowest_query_ms', 'serializer_ms', 'response_bytes')
+
+
+class RequestProfile:
+    """
+    Query count, database time, slowest query and serializer time of one request.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+        self.serializer_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper timing every query of the request.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            if elapsed >= self.slowest_time:
+                self.slowest_time = elapsed
+                self.slowest_sql = sql
+
+
+class ProfileStore:
+    """
+    Keeps the last ``window`` profiles of every view of this process and reports
+    their percentiles.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.slowest_queries = {}
+        self.lock = threading.Lock()
+
+    def add(self, view_name, sample, slowest_sql):
+        with self.lock:
+            self.samples[view_name].append(sample)
+            slowest = self.slowest_queries.get(view_name)
+            if slowest_sql and (slowest is None or sample['slowest_query_ms'] >= slowest['ms']):
+                self.slowest_queries[view_name] = {'ms': sample['slowest_query_ms'], 'sql': slowest_sql}
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+            self.slowest_queries.clear()
+
+    def summary(self):
+        with self.lock:
+            samples = {view_name: list(view_samples) for view_name, view_samples in self.samples.items()}
+            slowest_queries = dict(self.slowest_queries)
+
+        return {
+            view_name: {
+                'requests': len(view_samples),
+                **{
+                    metric: {
+                        f'p{percent}': percentile(
+                            sorted(sample[metric] for sample in view_samples), percent)
+                        for percent in (50, 95, 99)
+                    } for metric in PROFILED_METRICS
+                },
+                'slowest_query': slowest_queries.get(view_name),
+            } for view_name, view_samples in sorted(samples.items())
+        }
+
+
+profile_store = ProfileStore(settings.QUERY_PROFILING_WINDOW)
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of sorted ``values``.
+    """
+    if not values:
+        return None
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+
+@contextmanager
+def serializer_timer():
+    """
+    Adds the time spent in the block to the serializer time of the profiled request, if any.
+    """
+    profile = current_profile.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.serializer_time += time.perf_counter() - start
+
+
+class QueryProfilingMiddleware:
+    """
+    Opt-in (``QUERY_PROFILING``) profiling of the sales API: records the query count,
+    database time, slowest query, serializer time and response size of every request,
+    returns them in a ``Server-Timing`` header and aggregates them per view for the
+    metrics endpoint. Requests over ``QUERY_PROFILING_MAX_QUERIES`` queries are logged.
+    """
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        if (match is None or not match.func.__module__.startswith('sales.')
+                or match.url_name == 'query-metrics'):
+            return response
+
+        sample = {
+            'duration_ms': round(duration * 1000, 3),
+            'queries': profile.queries,
+            'db_ms': round(profile.db_time * 1000, 3),
+            'slowest_query_ms': round(profile.slowest_time * 1000, 3),
+            'serializer_ms': round(profile.serializer_time * 1000, 3),
+            # Streaming responses are produced after the view returns
+            'response_bytes': 0 if response.streaming else len(response.content),
+        }
+        profile_store.add(match.view_name, sample, profile.slowest_sql)
+
+        queries = '1 query' if profile.queries == 1 else f'{profile.queries} queries'
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={sample["db_ms"]};desc="{queries}"',
+            f'db-slowest;dur={sample["slowest_query_ms"]}',
+            f'serializer;dur={sample["serializer_ms"]}',
+            f'total;dur={sample["duration_ms"]}',
+        ])
+
+        if profile.queries > settings.QUERY_PROFILING_MAX_QUERIES:
+            logger.warning(
+                f"{request.method} {request.path} ({match.view_name}) ran {profile.queries} queries "
+                f"in {sample['db_ms']}ms, slowest: {profile.slowest_sql}"
+            )
+        return response
@@ -0,0 +1,263 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connection, models, transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from sales.models import MonthlySalesRollup, OrderItem
+
+# Adds newly inserted order items to the rollup. ``{items}`` is a relation with
+# (order_id, order_date, product_id, quantity_sold, total_sale_value) columns;
+# groups are upserted in key order so concurrent imports lock rollup rows in the
+# same order. Joining orders on order_date too prunes them to the items' months.
+UPSERT_ROLLUP_SQL = """
+    INSERT INTO monthly_sales_rollup (month, platform_id, category, total_quantity, total_revenue)
+    SELECT
+        DATE_TRUNC('month', items.order_date)::date, orders.platform_id, products.category,
+        SUM(items.quantity_sold), SUM(items.total_sale_value)
+    FROM {items} AS items (order_id, order_date, product_id, quantity_sold, total_sale_value)
+    JOIN orders ON orders.order_id = items.order_id AND orders.order_date = items.order_date
+    JOIN products ON products.product_id = items.product_id
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (month, platform_id, category) DO UPDATE SET
+        total_quantity = monthly_sales_rollup.total_quantity + EXCLUDED.total_quantity,
+        total_revenue = monthly_sales_rollup.total_revenue + EXCLUDED.total_revenue
+"""
+
+# Inserts order items ignoring conflicts and adds to the rollup only the rows
+# the INSERT returns, so concurrent imports of the same item never both count
+# it. ``{items}`` is a relation with (order_id, order_date, product_id,
+# quantity_sold, selling_price, total_sale_value) columns, unique on the key of
+# order_items. Returns the number of items inserted.
+INSERT_ORDER_ITEMS_SQL = """
+    WITH inserted AS (
+        INSERT INTO order_items (
+            order_id, order_date, product_id, quantity_sold, selling_price, total_sale_value
+        )
+        SELECT * FROM {items} AS items (
+            order_id, order_date, product_id, quantity_sold, selling_price, total_sale_value
+        )
+        ON CONFLICT DO NOTHING
+        RETURNING order_id, order_date, product_id, quantity_sold, total_sale_value
+    ), rollup AS (
+        {rollup}
+    )
+    SELECT COUNT(*) FROM inserted
+"""
+
+# Updates {fields} of the stored order items that differ from the rows of
+# ``{items}`` (same columns as above) and adds the differences to the rollup.
+# The stored rows are locked in key order before their values are read, so an
+# import updating an item after a concurrent one adds the difference to what
+# the other stored. Returns the number of items updated and their months.
+UPDATE_ORDER_ITEMS_SQL = """
+    WITH locked AS (
+        SELECT
+            stored.order_item_id, stored.order_date, stored.quantity_sold AS stored_quantity_sold,
+            stored.total_sale_value AS stored_total_sale_value, items.quantity_sold, items.total_sale_value
+        FROM {items} AS items (
+            order_id, order_date, product_id, quantity_sold, selling_price, total_sale_value
+        )
+        JOIN order_items AS stored ON stored.order_id = items.order_id
+            AND stored.product_id = items.product_id AND stored.selling_price = items.selling_price
+            AND stored.order_date = items.order_date
+        WHERE ROW({stored_fields}) IS DISTINCT FROM ROW({item_fields})
+        ORDER BY stored.order_id, stored.product_id, stored.selling_price, stored.order_date
+        FOR UPDATE OF stored
+    ), updated AS (
+        UPDATE order_items SET {assignments}
+        FROM locked
+        WHERE order_items.order_item_id = locked.order_item_id AND order_items.order_date = locked.order_date
+        RETURNING
+            order_items.order_id, order_items.order_date, order_items.product_id,
+            order_items.quantity_sold - locked.stored_quantity_sold,
+            order_items.total_sale_value - locked.stored_total_sale_value
+    ), rollup AS (
+        {rollup}
+    )
+    SELECT COUNT(*), ARRAY_AGG(DISTINCT DATE_TRUNC('month', order_date)::date) FROM updated
+"""
+
+
+def insert_order_items_sql(items):
+    """
+    Returns the ``INSERT_ORDER_ITEMS_SQL`` inserting the rows of the relation ``items``.
+    """
+    return INSERT_ORDER_ITEMS_SQL.format(items=items, rollup=UPSERT_ROLLUP_SQL.format(items='inserted'))
+
+
+def update_order_items_sql(items, fields):
+    """
+    Returns the ``UPDATE_ORDER_ITEMS_SQL`` updating ``fields`` from the rows of the relation ``items``.
+    """
+    return UPDATE_ORDER_ITEMS_SQL.format(
+        items=items,
+        stored_fields=', '.join(f'stored.{field}' for field in fields),
+        item_fields=', '.join(f'items.{field}' for field in fields),
+        assignments=', '.join(f'{field} = locked.{field}' for field in fields),
+        rollup=UPSERT_ROLLUP_SQL.format(items='updated'),
+    )
+
+# Locks the products in {product_ids} in key order, with the row lock {mode}.
+# Imports add order items to the rollup under the category of their product
+# holding a KEY SHARE lock on it, and change the category of a product holding
+# an UPDATE lock, which conflict: the items of a product are never added under
+# a category that its subtraction and re-addition in between has missed.
+LOCK_PRODUCTS_SQL = """
+    SELECT product_id FROM products
+    WHERE product_id IN ({product_ids})
+    ORDER BY product_id
+    FOR {mode}
+"""
+
+# Groups of the rollup left empty by negative deltas, in the given months
+DELETE_EMPTY_ROLLUP_GROUPS_SQL = """
+    DELETE FROM monthly_sales_rollup
+    WHERE id IN (
+        SELECT id FROM monthly_sales_rollup
+        WHERE month = ANY(%s::date[]) AND total_quantity = 0 AND total_revenue = 0
+        ORDER BY month, platform_id, category
+        FOR UPDATE
+    )
+"""
+
+# Order items passed as one array parameter per column
+ORDER_ITEMS_ARRAYS = (
+    'unnest(%s::varchar[], %s::date[], %s::varchar[], %s::integer[], %s::numeric[], %s::numeric[])'
+)
+
+
+def stored_order_item(order_item):
+    """
+    Returns ``(order_id, product_id, selling_price, quantity_sold, total_sale_value)``
+    of an unsaved order item, with the values ``order_items`` will store for it.
+    """
+    return (
+        order_item.order_id,
+        order_item.product_id,
+        *(stored_value(order_item, field_name) for field_name in (
+            'selling_price', 'quantity_sold', 'total_sale_value'))
+    )
+
+
+def stored_value(instance, field_name):
+    """
+    Converts a field value the way it is saved, including PostgreSQL's rounding
+    of numeric columns to their scale.
+    """
+    field = instance._meta.get_field(field_name)
+    value = field.get_prep_value(getattr(instance, field_name))
+    if isinstance(field, models.DecimalField) and value is not None:
+        value = value.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+    return value
+
+
+def insert_order_items(order_items):
+    """
+    Inserts order items, ignoring the ones already stored, and adds those inserted
+    to the monthly rollup. Each item is an ``(order_id, order_date, product_id,
+    quantity_sold, selling_price, total_sale_value)`` tuple, unique on the key of
+    ``order_items`` and given in key order. Returns the number of items inserted.
+    """
+    if not order_items:
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(insert_order_items_sql(ORDER_ITEMS_ARRAYS), [list(column) for column in zip(*order_items)])
+        return cursor.fetchone()[0]
+
+
+def update_order_items(order_items, fields):
+    """
+    Updates ``fields`` of the stored order items that differ from ``order_items``
+    (see ``insert_order_items``) and adds the differences to the monthly rollup.
+    Returns the number of items updated and the months of their orders.
+    """
+    if not order_items or not fields:
+        return 0, []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            update_order_items_sql(ORDER_ITEMS_ARRAYS, fields), [list(column) for column in zip(*order_items)])
+        updated, months = cursor.fetchone()
+        return updated, months or []
+
+
+def lock_products(product_ids, mode):
+    """
+    Locks ``product_ids`` with the row lock ``mode``, ``KEY SHARE`` before writing
+    their order items or ``UPDATE`` before changing their category (see ``LOCK_PRODUCTS_SQL``).
+    """
+    if not product_ids:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            LOCK_PRODUCTS_SQL.format(product_ids='SELECT unnest(%s::varchar[])', mode=mode), [sorted(product_ids)])
+
+
+def add_product_items_to_monthly_rollup(product_ids, sign=1):
+    """
+    Adds all the stored order items of ``product_ids`` to the monthly rollup under
+    the current category of their product, or subtracts them with ``sign`` -1:
+    changing the category of products subtracts their items before the change and
+    adds them back after it. Returns the months of the items.
+    """
+    if not product_ids:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPSERT_ROLLUP_SQL.format(items=(
+                '(SELECT order_id, order_date, product_id, %s * quantity_sold, %s * total_sale_value '
+                'FROM order_items WHERE product_id = ANY(%s))'
+            )) + ' RETURNING month',
+            [sign, sign, sorted(product_ids)]
+        )
+        return sorted({month for month, in cursor.fetchall()})
+
+
+def delete_empty_rollup_groups(dates):
+    """
+    Deletes the groups of the monthly rollup in the months of ``dates`` that
+    subtracted deltas left with no quantity nor revenue, so the rollup holds the
+    same groups as ``rebuild_monthly_rollup`` would. They are locked in key order
+    like the upserts lock them.
+    """
+    months = sorted({value.replace(day=1) for value in dates})
+    if not months:
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(DELETE_EMPTY_ROLLUP_GROUPS_SQL, [months])
+        return cursor.rowcount
+
+
+def rebuild_monthly_rollup():
+    """
+    Rebuilds the monthly rollup from ``order_items``. Imports committing during the
+    rebuild wait for it and add their items afterwards, so nothing is counted twice.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'LOCK TABLE {MonthlySalesRollup._meta.db_table} IN EXCLUSIVE MODE'
+            )
+
+        MonthlySalesRollup.objects.all().delete()
+        groups = OrderItem.objects.annotate(
+            month=TruncMonth('order_date')).values(
+            'month', 'order__platform_id', 'product__category').annotate(
+            total_quantity=Sum('quantity_sold'),
+            total_revenue=Sum('total_sale_value')).order_by()
+
+        return len(MonthlySalesRollup.objects.bulk_create(
+            MonthlySalesRollup(
+                month=group['month'],
+                platform_id=group['order__platform_id'],
+                category=group['product__category'],
+                total_quantity=group['total_quantity'],
+                total_revenue=group['total_revenue'],
+            ) for group in groups.iterator()
+        ))
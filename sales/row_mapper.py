@@ -0,0 +1,117 @@
+from collections import namedtuple
+from functools import lru_cache
+from operator import itemgetter
+
+from sales.utils import parse_date, parse_state
+
+MappedRow = namedtuple('MappedRow', [
+    'customer_id', 'customer_name', 'contact_email', 'phone_number',
+    'product_id', 'product_name', 'category', 'order_id', 'order_date',
+    'platform_data', 'quantity_sold', 'selling_price', 'total_sale_value',
+    'delivery_address', 'delivery_date', 'delivery_status', 'delivery_partner',
+    'delivery_data', 'delivery_state',
+])
+
+
+@lru_cache(maxsize=8192)
+def cached_parse_date(date_str, date_format):
+    """
+    ``parse_date`` memoized, as the rows of an export share few distinct dates.
+    """
+    return parse_date(date_str, date_format)
+
+
+class RowMapper:
+    """
+    Row transform compiled from a platform config and the header of a CSV file.
+    Mapped columns are resolved to list indexes once, so ``csv.reader`` rows are
+    mapped without per-row config or dict lookups, to the same values a
+    ``csv.DictReader`` row gets through the platform's field mappings.
+    """
+    def __init__(self, platform_config, header):
+        self.indexes = {column: index for index, column in enumerate(header)}
+        self.width = len(header)
+        field_mapping = platform_config.get('field_mapping', {})
+
+        self.get_customer = self.tuple_getter(field_mapping.get(field) for field in (
+            'customer_id', 'customer_name', 'contact_email', 'phone_number'))
+        self.get_product = self.tuple_getter(field_mapping.get(field) for field in (
+            'product_id', 'product_name', 'product_category'))
+        self.get_delivery = self.tuple_getter(field_mapping.get(field) for field in (
+            'delivery_address', 'delivery_date', 'delivery_status', 'delivery_partner'))
+        self.get_order_id = self.getter(field_mapping.get('order_id'))
+        self.get_order_date = self.getter(field_mapping.get('order_date'))
+        self.get_quantity = self.getter(field_mapping.get('item_quantity'), default=0)
+        self.get_selling_price = self.getter(field_mapping.get('item_selling_price'), default=0)
+
+        self.platform_fields = [
+            (key, self.getter(column)) for key, column in
+            platform_config.get('platform_data_field_mapping', {}).items()
+        ]
+        self.delivery_fields = [
+            (key, self.getter(column)) for key, column in
+            platform_config.get('delivery_data_field_mapping', {}).items()
+        ]
+        self.order_date_format = platform_config.get('order_date_format')
+        self.delivery_date_format = platform_config.get('delivery_date_format')
+
+    def getter(self, column, default=None):
+        """
+        Returns a getter of ``column``, returning ``default`` if the file has no such column.
+        """
+        if column not in self.indexes:
+            return lambda row: default
+        return itemgetter(self.indexes[column])
+
+    def tuple_getter(self, columns):
+        """
+        Returns a getter of the tuple of ``columns``, with ``None`` for missing columns.
+        """
+        columns = list(columns)
+        if all(column in self.indexes for column in columns):
+            return itemgetter(*(self.indexes[column] for column in columns))
+        getters = [self.getter(column) for column in columns]
+        return lambda row: tuple(get(row) for get in getters)
+
+    def map_rows(self, reader):
+        """
+        Yields a ``MappedRow`` for every non-blank row of a ``csv.reader`` positioned
+        after the header. Short rows are padded with ``None`` like ``csv.DictReader`` does.
+        """
+        width = self.width
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                row += [None] * (width - len(row))
+            yield self.map(row)
+
+    def map(self, row):
+        quantity = float(self.get_quantity(row))
+        selling_price = float(self.get_selling_price(row))
+        order_date = self.get_order_date(row)
+        delivery_address, delivery_date, delivery_status, delivery_partner = self.get_delivery(row)
+
+        return MappedRow(
+            *self.get_customer(row),
+            *self.get_product(row),
+            self.get_order_id(row),
+            cached_parse_date(order_date, self.order_date_format) if order_date else None,
+            {key: get(row) for key, get in self.platform_fields},
+            quantity,
+            selling_price,
+            quantity * selling_price,
+            delivery_address,
+            cached_parse_date(delivery_date, self.delivery_date_format) if delivery_date else None,
+            delivery_status,
+            delivery_partner,
+            {key: get(row) for key, get in self.delivery_fields},
+            parse_state(delivery_address),
+        )
+
+
+def compile_row_mapper(platform_config, reader):
+    """
+    Reads the header of a ``csv.reader`` and returns the ``RowMapper`` for its rows.
+    """
+    return RowMapper(platform_config, next(reader, []))
@@ -1,5 +1,21 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import OrderItem, Order, Delivery, Product, Platform
+from .models import OrderItem, OrderLine, Order, Delivery, Product, Platform, ExportJob
+from .profiling import serializer_timer
+
+
+class ProfiledSerializerMixin:
+    """
+    Reports the time spent building ``data`` to the query profiling middleware.
+    """
+    @property
+    def data(self):
+        with serializer_timer():
+            return super().data
+
+
+class ProfiledListSerializer(ProfiledSerializerMixin, serializers.ListSerializer):
+    pass
 
 
 class PlatformSerializer(serializers.ModelSerializer):
@@ -19,16 +35,17 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderItem
-        fields = '__all__'
+        # order_date only partitions the table, it is the date of the order
+        exclude = ('order_date',)
 
 
 class DeliverySerializer(serializers.ModelSerializer):
     class Meta:
         model = Delivery
-        fields = '__all__'
+        exclude = ('delivery_state',)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True, read_only=True)
     platform_data = serializers.JSONField()
     delivery = DeliverySerializer(read_only=True)
@@ -37,3 +54,99 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
+        list_serializer_class = ProfiledListSerializer
+
+
+# Columns of the ``order_lines`` rows ``OrderRowSerializer`` serializes
+ORDER_LINE_FIELDS = (
+    'order_id', 'order_item_id', 'order_date', 'customer_id', 'platform_id', 'platform_name', 'platform_data',
+    'product_id', 'product_name', 'category', 'quantity_sold', 'selling_price', 'total_sale_value',
+    'delivery_id', 'delivery_address', 'delivery_date', 'delivery_status', 'delivery_partner', 'delivery_data',
+)
+
+
+class OrderRowSerializer:
+    """
+    Read-only fast path of ``OrderSerializer`` for a page of orders, given as rows
+    with their ``order_id``: all the lines of the page are read from the
+    ``order_lines`` view in a single ``.values_list()`` query and ``data`` is built
+    from plain tuples, with the same keys, key order and representations as
+    ``OrderSerializer``, so the rendered JSON is byte-identical without DRF's
+    per-field work.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.lines = []
+        if rows:
+            self.lines = list(OrderLine.objects.filter(
+                order_id__in=[row['order_id'] for row in rows]
+            ).order_by('order_id', 'order_item_id').values_list(*ORDER_LINE_FIELDS))
+
+    @property
+    def data(self):
+        with serializer_timer():
+            orders = {}
+            for line in self.lines:
+                line = dict(zip(ORDER_LINE_FIELDS, line))
+                if line['order_id'] not in orders:
+                    orders[line['order_id']] = self.order(line)
+                if line['order_item_id'] is not None:
+                    orders[line['order_id']]['order_items'].append(self.order_item(line))
+            # Skips orders a refresh removed since the page was read
+            return [orders[row['order_id']] for row in self.rows if row['order_id'] in orders]
+
+    def order_item(self, line):
+        return {
+            'order_item_id': line['order_item_id'],
+            'product': {
+                'product_id': line['product_id'],
+                'product_name': line['product_name'],
+                'category': line['category'],
+            },
+            'quantity_sold': line['quantity_sold'],
+            'selling_price': format(line['selling_price'], 'f'),
+            'total_sale_value': format(line['total_sale_value'], 'f'),
+            'order': line['order_id'],
+        }
+
+    def order(self, line):
+        delivery = None
+        if line['delivery_id'] is not None:
+            delivery = {
+                'delivery_id': line['delivery_id'],
+                'delivery_address': line['delivery_address'],
+                'delivery_date': line['delivery_date'].isoformat(),
+                'delivery_status': line['delivery_status'],
+                'delivery_partner': line['delivery_partner'],
+                'delivery_data': line['delivery_data'],
+                'order': line['order_id'],
+            }
+        return {
+            'order_id': line['order_id'],
+            'order_items': [],
+            'platform_data': line['platform_data'],
+            'delivery': delivery,
+            'platform': {
+                'platform_id': str(line['platform_id']),
+                'platform_name': line['platform_name'],
+            },
+            'order_date': line['order_date'].isoformat(),
+            'customer': line['customer_id'],
+        }
+
+
+class ExportJobSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = (
+            'job_id', 'status', 'filters', 'row_count', 'download_url', 'error',
+            'created_at', 'completed_at'
+        )
+
+    def get_download_url(self, obj):
+        if obj.status != ExportJob.STATUS_COMPLETED:
+            return None
+        return self.context['request'].build_absolute_uri(
+            reverse('export-job-download', args=[obj.job_id]))
@@ -1,21 +1,45 @@
 import csv
 import logging
-from datetime import datetime
-
-from celery import shared_task
+import tempfile
+import time
+from datetime import timedelta
+from itertools import chain
+from operator import itemgetter
+
+from celery import chord, shared_task
+from celery.result import AsyncResult
 from celery.exceptions import MaxRetriesExceededError
+from django.conf import settings
+from django.core.files import File
 from django.core.files.storage import default_storage
-from django.db import transaction
-
-from sales.models import (Customer, Delivery, Order, OrderItem, Platform,
-                          Product)
+from django.db import connection, transaction
+from django.utils import timezone
+
+from sales.analytics import refresh_analytics_snapshot
+from sales.cache import bump_data_version
+from sales.checkpoints import ImportProgress, get_checkpoint
+from sales.copy_import import copy_import_platform_data
+from sales.exports import refresh_order_lines, write_compressed_export
+from sales.models import (Customer, Delivery, ExportJob, ImportCheckpoint,
+                          Order, OrderItem, Platform, Product)
+from sales.partitions import ensure_partitions, upcoming_months
+from sales.rollups import delete_empty_rollup_groups
+from sales.row_mapper import compile_row_mapper
+from sales.upserts import (UPSERT_FIELDS, UPSERT_KEYS, assign_order_dates, import_update_fields,
+                           move_orders, order_date_moves, split_unknown_rows, write_objects,
+                           write_order_items, write_products, write_rows)
+from sales.utils import (BatchSizer, ChunkLines, KnownIdCache, deep_sizeof,
+                         file_compression, file_sha256, open_import_file,
+                         split_file_chunks)
 
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True, max_retries=3)
 def import_data_task(self, platform, file_path):
     """
-    Celery task to import data from CSV files for different platforms.
+    Celery task to import data from CSV files for different platforms. While it runs,
+    its ``PROGRESS`` state carries the import counters and timings (see ``ImportProgress``),
+    which are also its result.
     """
     try:
         platform_instance = Platform.objects.get(platform_name__iexact=platform)
@@ -27,8 +51,27 @@ def import_data_task(self, platform, file_path):
 
 
     try:
-        import_platform_data(platform_instance, file_path)
-        default_storage.delete(file_path)
+        # Retries resume after the last committed batch of the same file content,
+        # and files that were already imported completely are skipped.
+        checkpoint = get_checkpoint(platform_instance, file_sha256(file_path))
+        if checkpoint.completed_at:
+            logger.info(
+                f"Skipping '{file_path}' for platform '{platform}': the same file was "
+                f"imported on {checkpoint.completed_at:%Y-%m-%d %H:%M}."
+            )
+            default_storage.delete(file_path)
+            return {'skipped': True, 'row_count': checkpoint.row_count}
+        elif (platform_instance.platform_config.get('import_mode') == 'parallel'
+                and file_compression(file_path) is None):
+            # The chord callback deletes the file once every chunk is imported.
+            # Compressed files cannot be split into byte ranges and import serially.
+            return import_platform_data_parallel(platform_instance, file_path, checkpoint)
+        else:
+            stats = import_platform_data(
+                platform_instance, file_path, checkpoint, publish=task_progress_publisher(self))
+            default_storage.delete(file_path)
+            schedule_import_refreshes(stats['updated_months'])
+            return stats
     except Exception as e:
         # Log the error
         error_message = f"Error importing data for platform '{platform}': {str(e)}"
@@ -43,164 +86,448 @@ def import_data_task(self, platform, file_path):
             raise e
 
 
-def import_platform_data(platform, file_path):
+@shared_task(bind=True, max_retries=3)
+def import_chunk_task(self, platform_id, file_path, file_hash, start, end):
     """
-    Imports data for a specific platform from a CSV file using optimized bulk operations.
+    Celery task to import one byte range of a CSV file, see ``import_platform_data_parallel``.
     """
-    platform_name = platform.platform_name
-    platform_config = platform.platform_config
+    try:
+        platform = Platform.objects.get(platform_id=platform_id)
+        return import_file_range(
+            platform, file_path, get_checkpoint(platform, file_hash, start), end,
+            publish=task_progress_publisher(self)
+        )
+    except Exception as e:
+        logger.error(f"Error importing bytes {start}-{end} of '{file_path}': {str(e)}")
+        if self.request.retries >= self.max_retries:
+            # The chord callback never runs once a chunk has failed for good, so
+            # the file is deleted here; a re-upload resumes from the chunk checkpoints.
+            logger.error(f"Max retries exceeded, giving up the import of '{file_path}'.")
+            default_storage.delete(file_path)
+            raise
+        self.retry(exc=e, countdown=60)
+
+
+@shared_task
+def finalize_import_task(chunk_stats, platform_name, file_path, checkpoint_id):
+    """
+    Chord callback of ``import_platform_data_parallel`` reporting the import totals.
+    """
+    default_storage.delete(file_path)
+    totals = {'rows': sum(stats['row_count'] for stats in chunk_stats), 'chunks': len(chunk_stats)}
+    ImportCheckpoint.objects.filter(pk=checkpoint_id).update(
+        row_count=totals['rows'], completed_at=timezone.now())
+    logger.info(
+        f"Data imported for {platform_name.capitalize()}: "
+        f"{totals['rows']} rows in {totals['chunks']} chunks"
+    )
+    schedule_import_refreshes(sorted({
+        month for stats in chunk_stats for month in stats.get('updated_months', ())
+    }))
+    return totals
+
+
+@shared_task
+def export_orders_task(job_id):
+    """
+    Celery task writing the orders of an export job to a gzip-compressed CSV in default storage.
+    """
+    job = ExportJob.objects.get(job_id=job_id)
+    job.status = ExportJob.STATUS_RUNNING
+    job.save(update_fields=['status'])
 
-    with open(file_path, 'r') as file:
-        reader = csv.DictReader(file)
-        batch_size = platform_config.get('batch_size', 1000)
-
-        # Initialize data collections
-        customers_data = {}
-        products_data = {}
-        orders_data = []
-        order_items_data = []
-        deliveries_data = []
-
-        count = 0
-
-        for row in reader:
-            field_mapping = platform_config.get('field_mapping', {})
-            customer_id = row.get(field_mapping.get('customer_id'))
-            product_id = row.get(field_mapping.get('product_id'))
-
-            # Collect customer data
-            customers_data[customer_id] = {
-                'customer_id': customer_id,
-                'customer_name': row.get(field_mapping.get('customer_name')),
-                'contact_email': row.get(field_mapping.get('contact_email')),
-                'phone_number': row.get(field_mapping.get('phone_number')),
-            }
-
-            # Collect product data
-            products_data[product_id] = {
-                'product_id': product_id,
-                'product_name': row.get(field_mapping.get('product_name')),
-                'category': row.get(field_mapping.get('product_category')),
-            }
-
-            # Parse dates
-            order_date = parse_date(
-                row.get(field_mapping.get('order_date')),
-                platform_config.get('order_date_format')
-            )
-            delivery_date = parse_date(
-                row.get(field_mapping.get('delivery_date')),
-                platform_config.get('delivery_date_format')
-            )
+    try:
+        with tempfile.TemporaryFile() as file:
+            job.row_count = write_compressed_export(job.filters, file)
+            file.seek(0)
+            job.file_path = default_storage.save(f'exports/{job.job_id}.csv.gz', File(file))
+        job.status = ExportJob.STATUS_COMPLETED
+    except Exception as e:
+        error_message = f"Error exporting orders for job '{job_id}': {str(e)}"
+        logger.error(error_message)
+        job.status = ExportJob.STATUS_FAILED
+        job.error = error_message
 
-            # Collect order data
-            orders_data.append({
-                'order_id': row.get(field_mapping.get('order_id')),
-                'customer_id': customer_id,
-                'platform_id': platform.platform_id,
-                'order_date': order_date,
-                'platform_data': extract_platform_data(platform_config, row),
-            })
-
-            # Collect order item data
-            item_quantity = float(row.get(field_mapping.get('item_quantity'), 0))
-            item_selling_price = float(row.get(field_mapping.get('item_selling_price'), 0))
-            item_total_value = item_quantity * item_selling_price
-
-            order_items_data.append({
-                'order_id': row.get(field_mapping.get('order_id')),
-                'product_id': product_id,
-                'quantity_sold': item_quantity,
-                'selling_price': item_selling_price,
-                'total_sale_value': item_total_value,
-            })
-
-            # Collect delivery data
-            deliveries_data.append({
-                'order_id': row.get(field_mapping.get('order_id')),
-                'delivery_address': row.get(field_mapping.get('delivery_address')),
-                'delivery_date': delivery_date,
-                'delivery_status': row.get(field_mapping.get('delivery_status')),
-                'delivery_partner': row.get(field_mapping.get('delivery_partner')),
-                'delivery_data': extract_delivery_data(platform_config, row),
-            })
-
-            count += 1
-
-            if count % batch_size == 0:
-                # Process batch
-                process_batch(customers_data, products_data, orders_data, order_items_data, deliveries_data)
-                # Reset data collections
-                customers_data = {}
-                products_data = {}
-                orders_data = []
-                order_items_data = []
-                deliveries_data = []
-
-        # Process any remaining data
-        if orders_data:
-            process_batch(customers_data, products_data, orders_data, order_items_data, deliveries_data)
-
-        logger.info(f'Data imported for {platform_name.capitalize()}')
-
-def process_batch(customers_data, products_data, orders_data, order_items_data, deliveries_data):
+    job.completed_at = timezone.now()
+    job.save()
+
+
+@shared_task
+def purge_export_jobs_task():
     """
-    Processes a batch of data, performing bulk operations for customers, products, orders, order items, and deliveries.
+    Celery task deleting export jobs and artifacts older than ``EXPORT_JOB_RETENTION``.
     """
-    with transaction.atomic():
-        # Process customers
-        customer_ids = list(customers_data.keys())
-        existing_customers = {
-            customer.customer_id: customer for customer in Customer.objects.filter(
-                customer_id__in=customer_ids)
-        }
+    expired_jobs = ExportJob.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=settings.EXPORT_JOB_RETENTION))
+
+    for job in expired_jobs:
+        if job.file_path:
+            default_storage.delete(job.file_path)
+    expired_jobs.delete()
 
-        new_customers = []
 
-        for cid, data in customers_data.items():
-            if cid not in existing_customers:
-                new_customers.append(Customer(**data))
+@shared_task
+def create_partitions_task():
+    """
+    Celery task creating the partitions of the current month and of the ``PARTITION_MONTHS_AHEAD`` next ones.
+    """
+    ensure_partitions(upcoming_months(settings.PARTITION_MONTHS_AHEAD))
 
-        Customer.objects.bulk_create(new_customers)
 
-        # Process products
-        product_ids = list(products_data.keys())
-        existing_products = {
-            product.product_id: product for product in Product.objects.filter(
-                product_id__in=product_ids)
+@shared_task
+def refresh_analytics_snapshot_task(months=()):
+    """
+    Celery task refreshing the months of the analytics snapshot changed by imports,
+    and ``months`` (``YYYY-MM``) whose rows imports updated in place.
+    """
+    return refresh_analytics_snapshot(months)
+
+
+@shared_task
+def refresh_order_lines_task():
+    """
+    Celery task refreshing the ``order_lines`` view read by the order listing and export.
+    """
+    refresh_order_lines()
+
+
+def schedule_import_refreshes(updated_months=()):
+    """
+    Queues the refreshes of the data derived from the imported orders: the
+    ``order_lines`` view, and the analytics snapshot if the dashboard reads from it.
+    Snapshot months are rewritten when their items were added or removed, and for
+    ``updated_months`` as upserts change rows without changing their count.
+    """
+    refresh_order_lines_task.delay()
+    if settings.ANALYTICS_ENGINE == 'duckdb':
+        refresh_analytics_snapshot_task.delay(list(updated_months))
+
+
+def import_platform_data(platform, file_path, checkpoint, publish=None):
+    """
+    Imports data for a specific platform from a CSV file in default storage, which
+    may be gzip or zstd-compressed, starting after the rows already committed
+    according to ``checkpoint``.
+    """
+    stats = import_file_range(platform, file_path, checkpoint, publish=publish)
+
+    logger.info(
+        f"Data imported for {platform.platform_name.capitalize()}: {stats['rows_committed']} rows "
+        f"in {stats['elapsed_seconds']}s ({stats['rows_per_sec']} rows/sec, "
+        f"parse {stats['parse_seconds']}s, database {stats['db_seconds']}s)"
+    )
+    return stats
+
+def import_platform_data_parallel(platform, file_path, checkpoint):
+    """
+    Splits a CSV file into byte-range chunks on newline boundaries and fans them out
+    as ``import_chunk_task`` subtasks, so the whole worker pool shares one import.
+    Each chunk keeps its own checkpoint; ``checkpoint`` is completed by the chord
+    callback. Fields with embedded newlines are not supported in this mode.
+    """
+    chunk_size = platform.platform_config.get('chunk_size', 32 * 1024 * 1024)
+    chunk_tasks = [
+        import_chunk_task.s(str(platform.platform_id), file_path, checkpoint.file_hash, start, end)
+        for start, end in split_file_chunks(file_path, chunk_size)
+    ]
+    chunk_task_ids = [chunk_task.freeze().id for chunk_task in chunk_tasks]
+
+    result = chord(chunk_tasks)(finalize_import_task.s(platform.platform_name, file_path, checkpoint.pk))
+    return {'chunk_task_ids': chunk_task_ids, 'finalize_task_id': result.id}
+
+def import_file_range(platform, file_path, checkpoint, end=None, publish=None):
+    """
+    Imports the rows of a CSV file in default storage from the checkpoint's position
+    (the chunk start, or the first row) up to byte ``end`` (the end of the file by
+    default), records progress with every committed batch and completes the
+    checkpoint. Offsets are those of the decompressed content. Returns the stats of
+    the ``ImportProgress``, reported to ``publish`` along the way.
+    """
+    progress = ImportProgress(checkpoint, publish=publish)
+    if checkpoint.completed_at:
+        return progress.as_dict()
+
+    with open_import_file(file_path) as file:
+        progress.lines = ChunkLines(file, max(checkpoint.chunk_start, checkpoint.byte_offset), end)
+        import_platform_rows(platform, csv.reader(progress.lines), progress)
+
+    checkpoint.completed_at = timezone.now()
+    checkpoint.save(update_fields=['completed_at', 'updated_at'])
+    progress.report(force=True)
+    return progress.as_dict()
+
+def import_task_status(task_id):
+    """
+    Returns the state and stats of an ``import_data_task`` from the result backend.
+    For a parallel import, the stats of its chunk tasks are added up.
+    """
+    result = AsyncResult(task_id)
+    status = {'task_id': task_id, 'state': result.state, 'progress': None}
+
+    if result.state == 'FAILURE':
+        status['error'] = str(result.result)
+    elif isinstance(result.info, dict) and 'chunk_task_ids' in result.info:
+        chunk_results = [AsyncResult(chunk_task_id) for chunk_task_id in result.info['chunk_task_ids']]
+        states = [chunk_result.state for chunk_result in chunk_results]
+        status['chunks'] = {state: states.count(state) for state in sorted(set(states))}
+        status['progress'] = merge_import_stats(
+            chunk_result.info for chunk_result in chunk_results
+            if isinstance(chunk_result.info, dict)
+        )
+        if 'FAILURE' in states:
+            status['state'] = 'FAILURE'
+        elif AsyncResult(result.info['finalize_task_id']).state != 'SUCCESS':
+            status['state'] = 'PROGRESS'
+    elif isinstance(result.info, dict):
+        status['progress'] = result.info
+    return status
+
+def merge_import_stats(stats_list):
+    """
+    Adds up the stats of concurrent imports; the elapsed time is the longest one.
+    """
+    merged = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                merged[key] = {name: merged.get(key, {}).get(name, 0) + count for name, count in value.items()}
+            elif key == 'elapsed_seconds':
+                merged[key] = max(merged.get(key, 0), value)
+            elif isinstance(value, int):
+                merged[key] = merged.get(key, 0) + value
+            elif isinstance(value, float):
+                merged[key] = round(merged.get(key, 0) + value, 3)
+
+    if merged.get('elapsed_seconds'):
+        merged['rows_per_sec'] = round(merged['rows_read'] / merged['elapsed_seconds'], 1)
+    return merged
+
+def task_progress_publisher(task):
+    """
+    Returns a callback publishing import stats as the ``PROGRESS`` state of a bound Celery task.
+    """
+    def publish(stats):
+        task.update_state(state='PROGRESS', meta=stats)
+    return publish
+
+def import_platform_rows(platform, reader, progress=None):
+    """
+    Imports the rows of a ``csv.reader``, header included, using the engine
+    selected by ``import_engine`` in the platform config (defaults to ``orm``).
+    Engines report every committed batch to ``progress``, an ``ImportProgress``.
+    """
+    engine = platform.platform_config.get('import_engine', 'orm')
+    if engine not in IMPORT_ENGINES:
+        raise ValueError(f"Unknown import engine '{engine}'.")
+
+    progress = progress or ImportProgress()
+    with connection.execute_wrapper(progress.count_writes):
+        return IMPORT_ENGINES[engine](platform, reader, progress)
+
+def bulk_create_platform_data(platform, reader, progress=None):
+    """
+    Imports the rows of a ``csv.reader`` for a specific platform using optimized bulk operations.
+    """
+    platform_config = platform.platform_config
+    mapper = compile_row_mapper(platform_config, reader)
+    progress = progress or ImportProgress()
+
+    batch = BatchSizer(platform_config)
+    update_fields = import_update_fields(platform_config)
+
+    # Customers and products recur across batches, so remember which ones exist
+    id_cache_size = platform_config.get('id_cache_size', 100000)
+    known_customers = KnownIdCache(id_cache_size)
+    known_products = KnownIdCache(id_cache_size)
+
+    # Initialize data collections
+    customers_data = {}
+    products_data = {}
+    orders_data = []
+    order_items_data = []
+    deliveries_data = []
+
+    count = 0
+
+    for row in progress.rows(mapper.map_rows(reader)):
+        # Collect customer data
+        customers_data[row.customer_id] = {
+            'customer_id': row.customer_id,
+            'customer_name': row.customer_name,
+            'contact_email': row.contact_email,
+            'phone_number': row.phone_number,
         }
 
-        new_products = []
+        # Collect product data
+        products_data[row.product_id] = {
+            'product_id': row.product_id,
+            'product_name': row.product_name,
+            'category': row.category,
+        }
 
-        for pid, data in products_data.items():
-            if pid not in existing_products:
-                new_products.append(Product(**data))
+        # Collect order data
+        orders_data.append({
+            'order_id': row.order_id,
+            'customer_id': row.customer_id,
+            'platform_id': platform.platform_id,
+            'order_date': row.order_date,
+            'platform_data': row.platform_data,
+        })
+
+        # Collect order item data
+        order_items_data.append({
+            'order_id': row.order_id,
+            'order_date': row.order_date,
+            'product_id': row.product_id,
+            'quantity_sold': row.quantity_sold,
+            'selling_price': row.selling_price,
+            'total_sale_value': row.total_sale_value,
+        })
+
+        # Collect delivery data
+        deliveries_data.append({
+            'order_id': row.order_id,
+            'delivery_address': row.delivery_address,
+            'delivery_date': row.delivery_date,
+            'delivery_status': row.delivery_status,
+            'delivery_partner': row.delivery_partner,
+            'delivery_data': row.delivery_data,
+            'delivery_state': row.delivery_state,
+        })
+
+        count += 1
+
+        if len(orders_data) >= batch.size:
+            # Process batch
+            commit_batch(batch, progress, known_customers, known_products, update_fields,
+                         customers_data, products_data, orders_data, order_items_data, deliveries_data)
+            # Reset data collections
+            customers_data = {}
+            products_data = {}
+            orders_data = []
+            order_items_data = []
+            deliveries_data = []
+
+    # Process any remaining data
+    if orders_data:
+        commit_batch(batch, progress, known_customers, known_products, update_fields,
+                     customers_data, products_data, orders_data, order_items_data, deliveries_data)
+
+    logger.info(
+        f'Known ID caches for {platform.platform_name.capitalize()}: '
+        f'customers {known_customers.stats()}, products {known_products.stats()}'
+    )
+    logger.info(f'Batch sizes for {platform.platform_name.capitalize()}: {batch.summary()}')
+    return count
+
+def commit_batch(batch, progress, known_customers, known_products, update_fields, *batch_data):
+    """
+    Runs ``process_batch`` on the collected rows and reports the duration of its
+    transaction and the memory held by the rows to the ``BatchSizer``.
+    """
+    start = time.perf_counter()
+    with progress.db():
+        # In its own transaction, so the batch does not hold the partition locks
+        ensure_partitions({data['order_date'] for data in batch_data[2] if data['order_date']})
+        process_batch(*batch_data, known_customers, known_products, progress, update_fields)
+    batch.update(len(batch_data[2]), time.perf_counter() - start, estimate_batch_memory(*batch_data))
+
+def estimate_batch_memory(customers_data, products_data, orders_data, order_items_data, deliveries_data):
+    """
+    Estimates the bytes held by a batch from the size of its last row.
+    """
+    row_size = deep_sizeof((orders_data[-1], order_items_data[-1], deliveries_data[-1]))
+    customer_size = deep_sizeof(next(iter(customers_data.values())))
+    product_size = deep_sizeof(next(iter(products_data.values())))
+    return (row_size * len(orders_data) + customer_size * len(customers_data)
+            + product_size * len(products_data))
+
+def process_batch(customers_data, products_data, orders_data, order_items_data, deliveries_data,
+                  known_customers, known_products, progress=None, update_fields=None):
+    """
+    Processes a batch of data, performing bulk operations for customers, products, orders, order items, and deliveries.
+    Customers and products in the ``KnownIdCache`` instances are not looked up again, and
+    ``progress`` is advanced past the batch in the same transaction. Rows already stored
+    are kept as they are, unless ``update_fields`` (see ``import_update_fields``) has
+    fields to update for their table: those are then upserted from the last row of the
+    batch for their key if they changed, and unchanged rows are not written. Rows of
+    orders stored under another order_date take that date, or move the order to
+    theirs when orders update their order_date (see ``move_orders``).
+    """
+    update_fields = update_fields or dict.fromkeys(UPSERT_FIELDS, ())
+    row_count = len(orders_data)
+    updated_dates = []
+
+    # Rows are inserted in primary/unique key order and conflicts are ignored, so
+    # concurrent chunks of a parallel import take row locks in the same order and
+    # cannot deadlock or fail on each other's customers and products.
+    with transaction.atomic():
+        # Process customers
+        customer_fields = update_fields['customers']
+        customer_values, new_customers, changed_customers = split_unknown_rows(
+            {cid: Customer(**data) for cid, data in sorted(customers_data.items())},
+            known_customers, customer_fields)
+        write_rows(Customer, new_customers, changed_customers, UPSERT_KEYS['customers'], customer_fields)
 
-        Product.objects.bulk_create(new_products)
+        # Process products
+        product_fields = update_fields['products']
+        product_values, new_products, changed_products = split_unknown_rows(
+            {pid: Product(**data) for pid, data in sorted(products_data.items())},
+            known_products, product_fields)
+        updated_dates.extend(write_products(new_products, changed_products, product_fields))
 
         # Bulk create orders
+        moves_orders, order_fields = order_date_moves(update_fields)
+        order_dates, moves = assign_order_dates(orders_data, moves_orders)
+        updated_dates.extend(move_orders(moves))
+        if progress is not None:
+            progress.orders_moved += len(moves)
+        for data in chain(orders_data, order_items_data):
+            data['order_date'] = order_dates[data['order_id']]
+
+        if order_fields:
+            # Upserts keep the last row of each order
+            orders_data = list({data['order_id']: data for data in orders_data}.values())
         order_objects = [Order(
             order_id=data['order_id'],
             customer_id=data['customer_id'],
             platform_id=data['platform_id'],
             order_date=data['order_date'],
             platform_data=data['platform_data'],
-        ) for data in orders_data]
+        ) for data in sorted(orders_data, key=itemgetter('order_id'))]
 
-        Order.objects.bulk_create(order_objects, ignore_conflicts=True)
+        changed_orders = write_objects(
+            Order, order_objects, UPSERT_KEYS['orders'], order_fields,
+            order_id__in=order_dates, order_date__in=set(order_dates.values()))
+        updated_dates.extend(order.order_date for order in changed_orders)
 
         # Bulk create order items
         order_item_objects = [OrderItem(
             order_id=data['order_id'],
+            order_date=data['order_date'],
             product_id=data['product_id'],
             quantity_sold=data['quantity_sold'],
             selling_price=data['selling_price'],
             total_sale_value=data['total_sale_value'],
-        ) for data in order_items_data]
-
-        OrderItem.objects.bulk_create(order_item_objects, ignore_conflicts=True)
+        ) for data in sorted(
+            order_items_data, key=itemgetter('order_id', 'product_id', 'selling_price'))]
+
+        # The rollup counts the items the INSERT returns and the differences the
+        # UPDATE makes to the rows it locked, so concurrent chunks writing the
+        # same items never count them twice
+        inserted_items, updated_items, updated_months = write_order_items(
+            order_item_objects, update_fields['order_items'])
+        updated_dates.extend(updated_months)
+        if progress is not None:
+            # Written in CTEs, which the INSERT counting cannot see
+            progress.inserted['order_items'] += inserted_items
+            progress.updated['order_items'] += updated_items
 
         # Bulk create deliveries
+        delivery_fields = update_fields['deliveries']
+        if delivery_fields:
+            # Upserts keep the last row of each delivery
+            deliveries_data = list({data['order_id']: data for data in deliveries_data}.values())
         delivery_objects = [Delivery(
             order_id=data['order_id'],
             delivery_address=data['delivery_address'],
@@ -208,28 +535,28 @@ def process_batch(customers_data, products_data, orders_data, order_items_data,
             delivery_status=data['delivery_status'],
             delivery_partner=data['delivery_partner'],
             delivery_data=data['delivery_data'],
-        ) for data in deliveries_data]
+            delivery_state=data['delivery_state'],
+        ) for data in sorted(deliveries_data, key=itemgetter('order_id'))]
 
-        Delivery.objects.bulk_create(delivery_objects, ignore_conflicts=True)
+        changed_deliveries = write_objects(
+            Delivery, delivery_objects, UPSERT_KEYS['deliveries'], delivery_fields,
+            order_id__in=order_dates)
+        updated_dates.extend(order_dates[delivery.order_id] for delivery in changed_deliveries)
 
-def extract_platform_data(platform_config, row):
-    """
-    Extracts platform-specific data from a row.
-    """
-    platform_data_field_mapping = platform_config.get('platform_data_field_mapping', {})
-    return {k: row.get(v) for k, v in platform_data_field_mapping.items()}
+        # Negative deltas may have emptied groups of the rollup
+        delete_empty_rollup_groups(updated_dates)
 
-def extract_delivery_data(platform_config, row):
-    """
-    Extracts platform-specific delivery data from a row.
-    """
-    delivery_data_field_mapping = platform_config.get('delivery_data_field_mapping', {})
-    return {k: row.get(v) for k, v in delivery_data_field_mapping.items()}
+        if progress is not None:
+            progress.commit(row_count)
+            progress.add_updated_months(updated_dates)
 
-def parse_date(date_str, date_format):
-    """
-    Parses a date string into a date object using the provided format.
-    """
-    if date_str:
-        return datetime.strptime(date_str, date_format).date()
-    return None
+        transaction.on_commit(bump_data_version)
+
+    # Only once the batch is saved do its customers and products surely exist, with these values
+    known_customers.add(customer_values)
+    known_products.add(product_values)
+
+IMPORT_ENGINES = {
+    'orm': bulk_create_platform_data,
+    'copy': copy_import_platform_data,
+}
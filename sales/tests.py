@@ -1,3 +1,1326 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import uuid
+from base64 import urlsafe_b64encode
+from datetime import date
+from decimal import Decimal
+from unittest import mock, skipIf
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Exists, OuterRef, Sum
+from django.db.models.functions import TruncMonth
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from sales import analytics, copy_import, tasks
+from sales.analytics import (
+    SampledAnalytics, SQLAnalytics, compare_analytics, consistency_scenarios, order_filterset,
+    refresh_analytics_snapshot,
+)
+from sales.benchmarks import benchmark_header, generate_platform_rows
+from sales.cache import bump_data_version, cached_response
+from sales.checkpoints import ImportProgress, get_checkpoint
+from sales.exports import EXPORT_FIELDNAMES, orders_with_details, refresh_order_lines
+from sales.filters import OrderFilter
+from sales.management.commands.benchmark_row_mapping import map_dict_row
+from sales.models import (
+    Customer, Delivery, ExportJob, ImportCheckpoint, MonthlySalesRollup, Order, OrderItem, OrderKey, OrderLine,
+    Platform, Product,
+)
+from sales.partitions import ensure_partitions
+from sales.profiling import QueryProfilingMiddleware, profile_store
+from sales.rollups import rebuild_monthly_rollup
+from sales.row_mapper import compile_row_mapper
+from sales.serializers import OrderSerializer
+from sales.tasks import (
+    export_orders_task, import_chunk_task, import_data_task, import_platform_data, import_platform_data_parallel,
+    import_platform_rows, process_batch,
+)
+from sales.utils import (
+    BatchSizer, ChunkLines, KnownIdCache, file_compression, file_sha256, normalize_state, open_import_file,
+    parse_state, zstandard,
+)
+from sales.views import ExportJobListAPI, ImportStatusAPI, OrderListView, SalesTimeSeriesAPI, SummaryMetricsAPI
+
+SCANNED_PARTITION = re.compile(r' on ((?:orders|order_items)_(?:\d{4}_\d{2}|default))\b')
+
+
+class DashboardIndexTests(TransactionTestCase):
+    """
+    The hot dashboard queries are answered by index-only scans on the composite and
+    covering indexes, and date-bounded ones only scan the partitions of their months.
+    Sequential and bitmap scans are disabled, as tables this small would otherwise
+    always be scanned sequentially.
+    """
+    tables = ('customers', 'products', 'platforms', 'orders', 'order_items', 'deliveries')
+
+    def setUp(self):
+        ensure_partitions(date(2024, month, 1) for month in range(1, 13))
+        self.platform = Platform.objects.create(platform_name='Amazon')
+        customer = Customer.objects.create(
+            customer_id='C1', customer_name='Customer 1', contact_email='c1@example.com', phone_number='1')
+        products = Product.objects.bulk_create(
+            Product(product_id=f'P{number}', product_name=f'Product {number}', category='Books')
+            for number in range(3)
+        )
+        for number in range(30):
+            order = Order.objects.create(
+                order_id=f'O{number}', customer=customer, platform=self.platform,
+                order_date=date(2024, number % 12 + 1, 1), platform_data={})
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, order_date=order.order_date, product=product, quantity_sold=1,
+                          selling_price=Decimal('10.00'), total_sale_value=Decimal('10.00'))
+                for product in products
+            )
+            Delivery.objects.create(
+                order=order, delivery_address='1 Main Road, City, Karnataka',
+                delivery_date=order.order_date, delivery_status='Cancelled' if number % 3 else 'Delivered',
+                delivery_data={}, delivery_state='KARNATAKA')
+
+        with connection.cursor() as cursor:
+            # Fills the visibility maps, which index-only scans rely on
+            cursor.execute(f"VACUUM ANALYZE {', '.join(self.tables)}")
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('SET enable_bitmapscan = off')
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('RESET enable_seqscan')
+            cursor.execute('RESET enable_bitmapscan')
+
+    def assertIndexOnlyScan(self, queryset, *index_names):
+        """
+        Asserts that the plan has an index-only scan using each index, or one of its
+        partitions for indexes of partitioned tables.
+        """
+        plan = queryset.explain()
+        with connection.cursor() as cursor:
+            for index_name in index_names:
+                cursor.execute(
+                    'SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass',
+                    [index_name]
+                )
+                names = [index_name] + [name for name, in cursor.fetchall()]
+                self.assertTrue(
+                    any(f'Index Only Scan using {name} ' in plan for name in names),
+                    f'No index-only scan using {index_name} in:\n{plan}'
+                )
+
+    def assertScannedPartitions(self, queryset, partitions):
+        plan = queryset.explain()
+        self.assertEqual(set(SCANNED_PARTITION.findall(plan)), set(partitions), plan)
+
+    def test_date_range_aggregate_of_items(self):
+        queryset = Order.objects.filter(
+            order_date__range=(date(2024, 1, 1), date(2024, 6, 30))).values(
+            month=TruncMonth('order_date')).annotate(
+            total_quantity=Sum('order_items__quantity_sold'),
+            total_revenue=Sum('order_items__total_sale_value')).order_by()
+        # The primary key of the partitions, (order_id, order_date), covers the orders side
+        self.assertIndexOnlyScan(queryset, 'orders_pkey', 'order_items_order_covering_idx')
+
+    def test_platform_date_range(self):
+        queryset = Order.objects.filter(
+            platform=self.platform, order_date__gte=date(2024, 3, 1)).values('order_id')
+        self.assertIndexOnlyScan(queryset, 'orders_platform_date_idx')
+
+    def test_delivery_status_filter(self):
+        queryset = Delivery.objects.filter(delivery_status='Cancelled').values('order_id')
+        self.assertIndexOnlyScan(queryset, 'deliveries_status_order_idx')
+
+    def test_delivery_state_filter(self):
+        queryset = Order.objects.filter(Exists(Delivery.objects.filter(
+            order=OuterRef('pk'), delivery_state='KARNATAKA'))).values('order_id')
+        self.assertIndexOnlyScan(queryset, 'deliveries_state_order_idx')
+
+    def test_date_filtered_listing_prunes_partitions(self):
+        queryset = Order.objects.filter(order_date__range=(date(2024, 3, 1), date(2024, 3, 31)))
+        self.assertScannedPartitions(queryset, ['orders_2024_03'])
+
+    def test_date_range_aggregate_prunes_partitions(self):
+        queryset = Order.objects.filter(
+            order_date__range=(date(2024, 3, 1), date(2024, 4, 30)),
+            order_items__order_date__range=(date(2024, 3, 1), date(2024, 4, 30))).values(
+            month=TruncMonth('order_date')).annotate(
+            total_revenue=Sum('order_items__total_sale_value')).order_by()
+        self.assertScannedPartitions(
+            queryset, ['orders_2024_03', 'orders_2024_04', 'order_items_2024_03', 'order_items_2024_04'])
+
+
+class SampleOrdersMixin:
+    """
+    Creates two months of orders of two platforms, one of them without a delivery.
+    """
+    def create_sample_orders(self):
+        ensure_partitions([date(2024, 1, 1), date(2024, 2, 1)])
+        platforms = [Platform.objects.create(platform_name=name) for name in ('Amazon', 'Flipkart')]
+        self.customer = Customer.objects.create(
+            customer_id='C1', customer_name='Customer 1', contact_email='c1@example.com', phone_number='1')
+        self.products = Product.objects.bulk_create(
+            Product(product_id=f'P{number}', product_name=f'Product {number}', category=category)
+            for number, category in enumerate(('Books', 'Toys', 'Books'))
+        )
+        for number in range(12):
+            order = self.create_order(f'O{number}', platforms[number % 2], date(2024, number % 2 + 1, number + 1))
+            if number != 5:
+                Delivery.objects.create(
+                    order=order, delivery_address='1 Main Road, City', delivery_date=order.order_date,
+                    delivery_status=('Delivered', 'Cancelled', 'Shipped')[number % 3],
+                    delivery_data={'Tracking': f'T{number}'}, delivery_state=('KARNATAKA', 'DELHI')[number % 2])
+
+    def create_order(self, order_id, platform, order_date):
+        order = Order.objects.create(
+            order_id=order_id, customer=self.customer, platform=platform, order_date=order_date,
+            platform_data={'Coupon': order_id})
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, order_date=order_date, product=product, quantity_sold=number + 1,
+                      selling_price=Decimal('9.99'), total_sale_value=Decimal('9.99') * (number + 1))
+            for number, product in enumerate(self.products[:len(order_id) % 3 + 1])
+        )
+        return order
+
+
+class SummaryMetricsTests(SampleOrdersMixin, TestCase):
+    """
+    Summary metrics are computed in one query over the filtered orders and served
+    from the cache until the next import commits.
+    """
+    def setUp(self):
+        self.create_sample_orders()
+        cache.clear()
+
+    def get(self, **params):
+        return SummaryMetricsAPI.as_view()(APIRequestFactory().get(reverse('summary-metrics'), params)).data
+
+    def test_metrics_of_filtered_orders(self):
+        with self.assertNumQueries(1):
+            metrics = self.get()
+        # Every order has 6 items sold but O10 and O11, 1; O1, O4, O7 and O10 are cancelled
+        self.assertEqual(metrics, {
+            'total_revenue': {'total_sale_value__sum': Decimal('9.99') * 62},
+            'total_orders': 12,
+            'total_products_sold': 62,
+            'canceled_order_percentage': 4 / 12 * 100,
+        })
+        metrics = self.get(platform='flipkart')
+        self.assertEqual((metrics['total_orders'], metrics['total_products_sold']), (6, 31))
+
+    def test_no_orders(self):
+        metrics = self.get(start_date='2030-01-01')
+        self.assertEqual((metrics['total_orders'], metrics['canceled_order_percentage']), (0, 0.0))
+
+    def test_cached_until_data_version_bump(self):
+        metrics = self.get()
+        Order.objects.filter(order_id='O0').delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(), metrics)
+        # Other filters are cached separately
+        self.assertEqual(self.get(platform='amazon')['total_orders'], 5)
+
+        bump_data_version()
+        self.assertEqual(self.get()['total_orders'], 11)
+
+
+class OrderFilterTests(SampleOrdersMixin, TestCase):
+    """
+    The category and state filters return every matching order once, however many
+    of its items match, ignoring case and the spelling of states.
+    """
+    def setUp(self):
+        self.create_sample_orders()
+
+    def filter(self, **params):
+        return list(OrderFilter(params, queryset=Order.objects.order_by('order_id')).qs.values_list(
+            'order_id', flat=True))
+
+    def test_category(self):
+        # O0 to O9 have two Books items and a Toys one, O10 and O11 a Books item
+        self.assertEqual(self.filter(category='books'), sorted(f'O{number}' for number in range(12)))
+        self.assertEqual(self.filter(category='TOYS'), sorted(f'O{number}' for number in range(10)))
+        self.assertEqual(self.filter(category='Games'), [])
+
+    def test_state(self):
+        delhi = sorted(f'O{number}' for number in (1, 3, 7, 9, 11))
+        self.assertEqual(self.filter(state='Delhi'), delhi)
+        self.assertEqual(self.filter(state=' delhi. '), delhi)
+        self.assertEqual(self.filter(state='Karnataka', category='toys'), ['O0', 'O2', 'O4', 'O6', 'O8'])
+
+    def test_states_of_addresses(self):
+        addresses = {
+            '825 Main Road, City 253, Uttar Pradesh': 'UTTAR PRADESH',
+            'Flat 4, MG Road, Bengaluru, Karnataka - 560001, India': 'KARNATAKA',
+            '12 Residency Road, Srinagar, Jammu & Kashmir 190001': 'JAMMU & KASHMIR',
+            '7 Anna Salai, Chennai, tamil-nadu, 600002, INDIA': 'TAMIL NADU',
+            'New Delhi 110001': 'NEW DELHI',
+            '': '',
+            None: '',
+        }
+        for address, state in addresses.items():
+            with self.subTest(address=address):
+                self.assertEqual(parse_state(address), state)
+        self.assertEqual(normalize_state('  Tamil   Nadu. '), 'TAMIL NADU')
+        self.assertEqual(normalize_state(None), '')
+
+
+@skipIf(analytics.duckdb is None, 'duckdb is not installed')
+class AnalyticsSnapshotTests(SampleOrdersMixin, TestCase):
+    """
+    The duckdb analytics engine returns the same results as SQL over its snapshot.
+    """
+    def setUp(self):
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        settings = override_settings(ANALYTICS_SNAPSHOT_DIR=snapshot_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.create_sample_orders()
+
+    def test_snapshot_matches_sql(self):
+        rebuild_monthly_rollup()
+        refresh_analytics_snapshot()
+        scenarios = consistency_scenarios([
+            {},
+            {'start_date': '2024-01-05', 'end_date': '2024-02-20'},
+            {'platform': 'amazon'},
+            {'category': 'TOYS'},
+            {'delivery_status': 'Cancelled', 'state': 'Delhi'},
+        ])
+        self.assertEqual(compare_analytics(scenarios), [])
+
+    def test_refresh_rewrites_changed_months(self):
+        self.assertEqual(refresh_analytics_snapshot()['months_written'], ['2024-01', '2024-02'])
+        self.assertEqual(refresh_analytics_snapshot()['months_written'], [])
+
+        self.create_order('O100', Platform.objects.get(platform_name='Amazon'), date(2024, 2, 15))
+        self.assertEqual(refresh_analytics_snapshot()['months_written'], ['2024-02'])
+
+        Order.objects.filter(order_date__lt=date(2024, 2, 1)).delete()
+        self.assertEqual(refresh_analytics_snapshot()['months_removed'], ['2024-01'])
+        rebuild_monthly_rollup()
+        self.assertEqual(compare_analytics(consistency_scenarios([{}])), [])
+
+
+class OrderLinesTests(SampleOrdersMixin, TestCase):
+    """
+    Orders listed and exported from the ``order_lines`` view, and the summary
+    metrics sampled from it, are the same as read from the order tables.
+    """
+    def setUp(self):
+        self.create_sample_orders()
+        # An order without items has a line too
+        Order.objects.create(
+            order_id='O99', customer=self.customer, platform=Platform.objects.get(platform_name='Amazon'),
+            order_date=date(2024, 1, 20), platform_data=None)
+        refresh_order_lines()
+
+    def list_orders(self, **params):
+        response = OrderListView.as_view()(APIRequestFactory().get(reverse('orders'), params))
+        return response.data
+
+    def test_listing_matches_order_serializer(self):
+        data = self.list_orders(page_size=100, pagination='cursor')
+        self.assertEqual(data['count'], 13)
+        self.assertEqual(data['results'], OrderSerializer(orders_with_details(), many=True).data)
+
+    def test_filters_select_whole_orders(self):
+        data = self.list_orders(category='toys', state='Delhi')
+        expected = orders_with_details().filter(
+            order_items__product__category='Toys', delivery__delivery_state='DELHI').distinct()
+        self.assertEqual(data['results'], OrderSerializer(expected, many=True).data)
+
+    def test_export_has_a_row_per_item(self):
+        response = OrderListView.as_view()(APIRequestFactory().get(reverse('orders'), {'export': 'true'}))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1 + OrderItem.objects.count())
+        self.assertTrue(lines[1].startswith('O0;2024-01-01;C1;'))
+
+    def export_rows(self, **params):
+        response = OrderListView.as_view()(APIRequestFactory().get(reverse('orders'), {'export': 'true', **params}))
+        reader = csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode()), delimiter=';')
+        return reader.fieldnames, {(row['order_id'], row['product_id']): row for row in reader}
+
+    def test_export_columns_follow_platforms(self):
+        Platform.objects.filter(platform_name='Amazon').update(platform_config={
+            'platform_data_field_mapping': {'Coupon': 'Coupon Code'},
+            'delivery_data_field_mapping': {'Tracking': 'Tracking ID'}})
+        Platform.objects.filter(platform_name='Flipkart').update(platform_config={
+            'platform_data_field_mapping': {'Coupon': 'Coupon'}})
+
+        header, rows = self.export_rows()
+        self.assertEqual(header, EXPORT_FIELDNAMES + ['Coupon', 'Tracking'])
+        self.assertEqual(len(rows), OrderItem.objects.count())
+        self.assertEqual((rows['O1', 'P1']['Coupon'], rows['O1', 'P1']['Tracking']), ('O1', 'T1'))
+        self.assertEqual(rows['O1', 'P1']['delivery_status'], 'Cancelled')
+        # O5 has no delivery
+        self.assertEqual((rows['O5', 'P0']['delivery_id'], rows['O5', 'P0']['Tracking']), ('', ''))
+
+        # Only Flipkart's fields: the delivery data of its orders is left out
+        header, rows = self.export_rows(platform='flipkart')
+        self.assertEqual(header, EXPORT_FIELDNAMES + ['Coupon'])
+        self.assertEqual(len(rows), OrderItem.objects.filter(order__platform__platform_name='Flipkart').count())
+        self.assertEqual({order_id for order_id, product_id in rows}, {f'O{number}' for number in range(1, 12, 2)})
+        self.assertEqual(rows['O1', 'P1']['Coupon'], 'O1')
+        self.assertEqual(rows['O5', 'P2']['delivery_address'], '')
+
+    def test_approximate_summary_metrics(self):
+        filterset = order_filterset({'category': 'toys'})
+        exact = SQLAnalytics().summary_metrics(filterset)
+        # Few enough lines to read them all, so the estimates are exact
+        approx = SampledAnalytics().summary_metrics(filterset)
+        self.assertEqual(approx['sample_fraction'], 1.0)
+        self.assertEqual({name: approx[name] for name in exact}, exact)
+        self.assertEqual(approx['error_bounds']['total_revenue'], 0)
+
+        sampled = SampledAnalytics(sample_rows=1, seed=0).summary_metrics(filterset)
+        self.assertLess(sampled['sample_fraction'], 1.0)
+
+
+@override_settings(ANALYTICS_ENGINE='sql')
+class SalesTimeSeriesTests(SampleOrdersMixin, TestCase):
+    """
+    /api/sales-timeseries/ buckets the filtered orders by period and dimension and
+    rejects unknown granularities and dimensions; unlike the summary metrics, a
+    category filter also restricts the items counted.
+    """
+    def setUp(self):
+        self.create_sample_orders()
+        cache.clear()
+
+    def get(self, **params):
+        return SalesTimeSeriesAPI.as_view()(APIRequestFactory().get(reverse('sales-timeseries'), params))
+
+    def series(self, **params):
+        """
+        Returns the period, dimension if grouped, quantity and orders of each bucket.
+        """
+        response = self.get(**params)
+        self.assertEqual(response.status_code, 200)
+        for row in response.data:
+            self.assertEqual(row['total_revenue'], Decimal('9.99') * row['total_quantity'])
+        return [
+            (row['period'], *([row[params['group_by']]] if 'group_by' in params else []),
+             row['total_quantity'], row['total_orders'])
+            for row in response.data
+        ]
+
+    def test_granularity(self):
+        # Every order has 6 items sold but O10 and O11, 1
+        self.assertEqual(self.series(), [(date(2024, 1, 1), 31, 6), (date(2024, 2, 1), 31, 6)])
+        self.assertEqual(self.series(granularity='quarter'), [(date(2024, 1, 1), 62, 12)])
+        # Monday January 1st to Sunday the 7th
+        self.assertEqual(self.series(granularity='week')[0], (date(2024, 1, 1), 24, 4))
+        self.assertEqual(len(self.series(granularity='day')), 12)
+
+    def test_group_by(self):
+        self.assertEqual(self.series(group_by='platform'), [
+            (date(2024, 1, 1), 'Amazon', 31, 6), (date(2024, 2, 1), 'Flipkart', 31, 6)])
+        self.assertEqual(self.series(group_by='category', platform='Amazon'), [
+            (date(2024, 1, 1), 'Books', 21, 6), (date(2024, 1, 1), 'Toys', 10, 5)])
+        # O5 has no delivery
+        self.assertEqual(self.series(group_by='delivery_status', start_date='2024-02-01'), [
+            (date(2024, 2, 1), 'Cancelled', 12, 2), (date(2024, 2, 1), 'Delivered', 12, 2),
+            (date(2024, 2, 1), 'Shipped', 1, 1), (date(2024, 2, 1), None, 6, 1)])
+
+    def test_category_restricts_items(self):
+        self.assertEqual(self.series(category='toys'), [(date(2024, 1, 1), 10, 5), (date(2024, 2, 1), 10, 5)])
+        # The summary metrics count every item of the orders with a Toys item
+        metrics = SQLAnalytics().summary_metrics(order_filterset({'category': 'toys'}))
+        self.assertEqual((metrics['total_products_sold'], metrics['total_orders']), (60, 10))
+
+    def test_invalid_parameters(self):
+        response = self.get(granularity='year', group_by='customer')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'granularity', 'group_by'})
+        self.assertEqual(self.get(start_date='not a date').status_code, 400)
+
+
+class KeysetPaginationTests(SampleOrdersMixin, TestCase):
+    """
+    Cursor pages of /api/orders/ list every order exactly once in either ordering,
+    including orders sharing an order_date, and invalid parameters are client errors.
+    """
+    def setUp(self):
+        self.create_sample_orders()
+        amazon = Platform.objects.get(platform_name='Amazon')
+        for order_id in ('T1', 'T2', 'T3'):
+            self.create_order(order_id, amazon, date(2024, 1, 1))
+        refresh_order_lines()
+
+    def get_page(self, url=None, **params):
+        if url is not None:
+            params = {name: values[0] for name, values in parse_qs(urlsplit(url).query).items()}
+        return OrderListView.as_view()(APIRequestFactory().get(reverse('orders'), params))
+
+    def order_ids(self, response):
+        return [order['order_id'] for order in response.data['results']]
+
+    def test_pages_cover_all_orders(self):
+        orders = Order.objects.all()
+        expected = {
+            'order_id': list(orders.order_by('order_id').values_list('order_id', flat=True)),
+            'order_date': list(orders.order_by('order_date', 'order_id').values_list('order_id', flat=True)),
+        }
+        for ordering, order_ids in expected.items():
+            with self.subTest(ordering=ordering):
+                response = self.get_page(pagination='cursor', ordering=ordering, page_size=4)
+                self.assertEqual(response.data['count'], len(order_ids))
+                self.assertIsNone(response.data['previous'])
+                pages = [self.order_ids(response)]
+                while response.data['next']:
+                    response = self.get_page(response.data['next'])
+                    pages.append(self.order_ids(response))
+                self.assertEqual([len(page) for page in pages], [4, 4, 4, 3])
+                self.assertEqual(sum(pages, []), order_ids)
+
+    def test_previous_link(self):
+        first = self.get_page(pagination='cursor', ordering='order_date', page_size=2, count='false')
+        second = self.get_page(first.data['next'])
+        third = self.get_page(second.data['next'])
+        self.assertIsNone(third.data['count'])
+        # The first page ends within the orders of 2024-01-01
+        self.assertEqual(self.order_ids(first), ['O0', 'T1'])
+
+        previous = self.get_page(third.data['previous'])
+        self.assertEqual(self.order_ids(previous), self.order_ids(second))
+        previous = self.get_page(previous.data['previous'])
+        self.assertEqual(self.order_ids(previous), self.order_ids(first))
+        self.assertIsNone(previous.data['previous'])
+        self.assertEqual(previous.data['next'].split('cursor=')[0], first.data['next'].split('cursor=')[0])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get_page(pagination='cursor', ordering='customer').status_code, 400)
+        self.assertEqual(self.get_page(pagination='cursor', cursor='not-a-cursor').status_code, 404)
+        cursor = urlsafe_b64encode(json.dumps({'o': 'order_date', 'k': ['Monday', 'O1'], 'r': 0}).encode())
+        self.assertEqual(self.get_page(pagination='cursor', cursor=cursor.decode()).status_code, 404)
+        self.assertEqual(self.get_page(page=99).status_code, 404)
+
+
+class ExportJobTests(SampleOrdersMixin, TestCase):
+    """
+    Export jobs write the filtered orders to a compressed CSV served for download,
+    and identical requests reuse their job until the next import. A job that could
+    not be enqueued is marked failed, so the next identical request creates a new one.
+    """
+    def setUp(self):
+        self.create_sample_orders()
+        refresh_order_lines()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_job(self):
+        return ExportJobListAPI.as_view()(
+            APIRequestFactory().post(reverse('export-jobs'), {'platform': 'Amazon'}, format='json'))
+
+    def test_identical_requests_reuse_the_job(self):
+        with mock.patch.object(export_orders_task, 'delay') as delay:
+            response = self.create_job()
+            self.assertEqual(response.status_code, 202)
+            delay.assert_called_once_with(response.data['job_id'])
+
+            reused = self.create_job()
+            self.assertEqual((reused.status_code, reused.data['job_id']), (200, response.data['job_id']))
+
+            bump_data_version()
+            self.assertNotEqual(self.create_job().data['job_id'], response.data['job_id'])
+        self.assertEqual(delay.call_count, 2)
+
+    def test_download_has_a_row_per_item(self):
+        with mock.patch.object(export_orders_task, 'delay'):
+            job_id = self.create_job().data['job_id']
+        export_orders_task(job_id)
+
+        job = ExportJob.objects.get(job_id=job_id)
+        self.assertEqual(job.status, ExportJob.STATUS_COMPLETED)
+        self.assertEqual(job.row_count, OrderItem.objects.filter(order__platform__platform_name='Amazon').count())
+        self.assertTrue(self.client.get(reverse('export-job', args=[job_id])).json()['download_url'])
+
+        response = self.client.get(reverse('export-job-download', args=[job_id]))
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 1 + job.row_count)
+        self.assertTrue(lines[1].startswith('O0;2024-01-01;C1;'))
+
+    def test_enqueue_failure(self):
+        with mock.patch.object(export_orders_task, 'delay', side_effect=ConnectionError('broker down')):
+            response = self.create_job()
+        self.assertEqual(response.status_code, 500)
+        job = ExportJob.objects.get()
+        self.assertEqual(job.status, ExportJob.STATUS_FAILED)
+        self.assertIn('broker down', job.error)
+
+        with mock.patch.object(export_orders_task, 'delay') as delay:
+            response = self.create_job()
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.data['job_id'], str(job.job_id))
+        delay.assert_called_once_with(response.data['job_id'])
+
+
+class CachedView(APIView):
+    """
+    Counts the requests reaching its handler; ?result=error or ?result=created
+    answers like the failing views do.
+    """
+    calls = 0
+
+    @cached_response('test')
+    def get(self, request):
+        CachedView.calls += 1
+        result = request.query_params.get('result')
+        if result == 'error':
+            return Response({'error': 'failed'})
+        if result == 'created':
+            return Response({'calls': CachedView.calls}, status=201)
+        return Response({'calls': CachedView.calls})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'cached-response-tests'}})
+class CachedResponseTests(SimpleTestCase):
+    """
+    Cached responses are served until the data version is bumped, carry an ETag
+    answered with 304, and only successful responses are cached.
+    """
+    def setUp(self):
+        cache.clear()
+        CachedView.calls = 0
+
+    def get(self, path='/test/', **headers):
+        return CachedView.as_view()(APIRequestFactory().get(path, **headers))
+
+    def test_caches_until_data_version_bump(self):
+        response = self.get()
+        self.assertEqual((response.data, response['X-Cache']), ({'calls': 1}, 'MISS'))
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = self.get()
+        self.assertEqual((response.data, response['X-Cache'], response['ETag']), ({'calls': 1}, 'HIT', etag))
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+        bump_data_version()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data, response['X-Cache']), (200, {'calls': 2}, 'MISS'))
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(CachedView.calls, 2)
+
+    def test_cache_key_includes_query_parameters(self):
+        self.get('/test/?a=1&b=2')
+        self.assertEqual(self.get('/test/?b=2&a=1')['X-Cache'], 'HIT')
+        self.assertEqual(self.get('/test/?a=2&b=2')['X-Cache'], 'MISS')
+
+    def test_does_not_cache_errors(self):
+        for result in ('error', 'created'):
+            for _ in range(2):
+                response = self.get(f'/test/?result={result}')
+                self.assertFalse(response.has_header('X-Cache'))
+                self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(CachedView.calls, 4)
+
+
+class QueryProfilingTests(SampleOrdersMixin, TestCase):
+    """
+    The opt-in profiling middleware reports the queries and timings of every sales
+    API request in Server-Timing and per view on /api/query-metrics/, which is not
+    found while profiling is off.
+    """
+    def setUp(self):
+        self.create_sample_orders()
+        cache.clear()
+        profile_store.clear()
+        self.addCleanup(profile_store.clear)
+
+    @override_settings(QUERY_PROFILING=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryProfilingMiddleware(lambda request: None)
+        response = self.client.get(reverse('orders'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get(reverse('query-metrics')).status_code, 404)
+        self.assertEqual(self.client.delete(reverse('query-metrics')).status_code, 404)
+
+    @override_settings(QUERY_PROFILING=True, QUERY_PROFILING_MAX_QUERIES=0)
+    def test_records_requests(self):
+        with self.assertLogs('sales.profiling', 'WARNING') as logs:
+            responses = [self.client.get(reverse('orders'), {'platform': name}) for name in ('Amazon', 'Flipkart')]
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(len(logs.records), 2)
+        queries = []
+        for response in responses:
+            timing = re.match(
+                r'db;dur=[\d.]+;desc="(\d+) quer(?:y|ies)", db-slowest;dur=[\d.]+, '
+                r'serializer;dur=[\d.]+, total;dur=[\d.]+$', response['Server-Timing'])
+            self.assertIsNotNone(timing, response['Server-Timing'])
+            queries.append(int(timing[1]))
+        self.assertGreater(min(queries), 0)
+
+        metrics = self.client.get(reverse('query-metrics')).json()
+        # The metrics endpoint does not record itself
+        self.assertEqual(list(metrics), ['orders'])
+        self.assertEqual(metrics['orders']['requests'], 2)
+        self.assertEqual(metrics['orders']['queries']['p99'], max(queries))
+        self.assertEqual(metrics['orders']['response_bytes']['p50'], min(
+            len(response.content) for response in responses))
+        self.assertTrue(metrics['orders']['slowest_query']['sql'])
+
+        self.assertEqual(self.client.delete(reverse('query-metrics')).status_code, 204)
+        self.assertEqual(self.client.get(reverse('query-metrics')).json(), {})
+
+
+class PlatformImportMixin:
+    """
+    Imports CSV rows through the Amazon platform config, in batches of 50.
+    """
+    def create_platform(self, **config):
+        with open(os.path.join(settings.BASE_DIR, 'sales', 'management', 'configs', 'platform_config.json')) as file:
+            self.config = {**json.load(file)['Amazon'], 'batch_size': 50, **config}
+        self.mapping = self.config['field_mapping']
+        self.platform = Platform.objects.create(platform_name='Amazon', platform_config=self.config)
+
+    def csv_content(self, rows):
+        file = io.StringIO()
+        writer = csv.DictWriter(file, fieldnames=benchmark_header(self.config))
+        writer.writeheader()
+        writer.writerows(rows)
+        return file.getvalue()
+
+    def import_rows(self, rows):
+        progress = ImportProgress()
+        import_platform_rows(self.platform, csv.reader(io.StringIO(self.csv_content(rows))), progress)
+        return progress.as_dict()
+
+    def use_temporary_media_root(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def save_import_file(self, content, name='tmp/amazon.csv'):
+        """
+        Saves an upload to default storage, like DataImportAPI does, and returns its path.
+        """
+        return default_storage.save(name, ContentFile(content))
+
+    def rollup(self):
+        """
+        Returns the groups of the monthly rollup with their totals.
+        """
+        return {
+            (month, platform_id, category): (total_quantity, total_revenue)
+            for month, platform_id, category, total_quantity, total_revenue in
+            MonthlySalesRollup.objects.values_list(
+                'month', 'platform_id', 'category', 'total_quantity', 'total_revenue')
+        }
+
+    def table_contents(self):
+        """
+        Returns the rows of the sales tables, without their generated primary keys.
+        """
+        tables = {
+            Customer: ('customer_id',),
+            Product: ('product_id',),
+            Order: ('order_id',),
+            OrderItem: ('order_id', 'product_id', 'selling_price', 'order_date'),
+            Delivery: ('order_id',),
+        }
+        return {
+            model._meta.db_table: list(model.objects.order_by(*key).values_list(*(
+                field.attname for field in model._meta.concrete_fields
+                if field.attname not in ('order_item_id', 'delivery_id')
+            )))
+            for model, key in tables.items()
+        }
+
+    def delete_imported_rows(self):
+        for model in (Order, Customer, Product):
+            model.objects.all().delete()
+        rebuild_monthly_rollup()
+
+
+class KnownIdCacheTests(TestCase):
+    """
+    The ID caches of the "orm" engine keep the most recently used IDs up to their
+    size, and only learn the IDs of a batch once it is committed.
+    """
+    def test_evicts_least_recently_used(self):
+        known = KnownIdCache(3)
+        known.add(['A', 'B', 'C'])
+        # Looking A up makes B the least recently used
+        self.assertEqual(known.unknown(['A']), set())
+        known.add(['D'])
+        self.assertEqual(list(known.ids), ['C', 'A', 'D'])
+        self.assertEqual(known.unknown(['A', 'B', 'C', 'D']), {'B'})
+        self.assertEqual((known.hits, known.misses), (4, 1))
+
+    def test_size_limit(self):
+        known = KnownIdCache(3)
+        known.add([f'ID{number}' for number in range(10)])
+        self.assertEqual(list(known.ids), ['ID7', 'ID8', 'ID9'])
+        known.add(['ID8'])
+        self.assertEqual(len(known.ids), 3)
+
+    def test_values_must_match(self):
+        known = KnownIdCache(3)
+        known.add({'A': ('Books',)})
+        self.assertEqual(known.unknown({'A': ('Books',)}), set())
+        self.assertEqual(known.unknown({'A': ('Toys',)}), {'A'})
+        self.assertEqual(known.unknown(['A']), {'A'})
+
+    def test_ids_are_added_once_committed(self):
+        ensure_partitions([date(2024, 1, 1)])
+        platform = Platform.objects.create(platform_name='Amazon')
+
+        def batch():
+            return (
+                {'C1': {'customer_id': 'C1', 'customer_name': 'Customer 1', 'contact_email': 'c1@example.com',
+                        'phone_number': '1'}},
+                {'P1': {'product_id': 'P1', 'product_name': 'Product 1', 'category': 'Books'}},
+                [{'order_id': 'O1', 'customer_id': 'C1', 'platform_id': platform.platform_id,
+                  'order_date': date(2024, 1, 2), 'platform_data': {}}],
+                [{'order_id': 'O1', 'order_date': date(2024, 1, 2), 'product_id': 'P1', 'quantity_sold': 1,
+                  'selling_price': 9.99, 'total_sale_value': 9.99}],
+                [{'order_id': 'O1', 'delivery_address': '1 Main Road, City', 'delivery_date': date(2024, 1, 3),
+                  'delivery_status': 'Delivered', 'delivery_partner': None, 'delivery_data': {},
+                  'delivery_state': 'CITY'}],
+            )
+
+        known_customers, known_products = KnownIdCache(10), KnownIdCache(10)
+        with mock.patch.object(Delivery.objects, 'bulk_create', side_effect=DatabaseError('failed')):
+            with self.assertRaises(DatabaseError):
+                process_batch(*batch(), known_customers, known_products)
+        self.assertFalse(Customer.objects.exists())
+        self.assertEqual(list(known_customers.ids), [])
+        self.assertEqual(list(known_products.ids), [])
+
+        process_batch(*batch(), known_customers, known_products)
+        self.assertEqual(known_customers.unknown({'C1': ()}), set())
+        self.assertEqual(known_products.unknown({'P1': ()}), set())
+
+
+class BatchSizerTests(SimpleTestCase):
+    """
+    Adaptive batch sizes move toward target_batch_seconds per batch, at most doubling
+    or halving per batch, within their bounds and memory budget.
+    """
+    def sizer(self, **config):
+        return BatchSizer({'batch_size': 'adaptive', **config})
+
+    def test_fixed_size(self):
+        batch = BatchSizer({'batch_size': 500})
+        batch.update(500, 10.0, 1024)
+        batch.update(500, 0.01, 1024)
+        self.assertEqual(batch.size, 500)
+        self.assertEqual(batch.summary(), '500 x 2')
+
+    def test_grows_toward_target(self):
+        batch = self.sizer()
+        batch.update(1000, 0.4, 0)
+        self.assertEqual(batch.size, 1250)
+        # Much faster than the target, at most doubles
+        batch.update(1250, 0.01, 0)
+        self.assertEqual(batch.size, 2500)
+        batch.update(2500, 0, 0)
+        self.assertEqual(batch.size, 5000)
+
+    def test_shrinks_toward_target(self):
+        batch = self.sizer()
+        batch.update(1000, 0.625, 0)
+        self.assertEqual(batch.size, 800)
+        # Much slower than the target, at most halves
+        batch.update(800, 60.0, 0)
+        self.assertEqual(batch.size, 400)
+
+    def test_bounds(self):
+        batch = self.sizer(initial_batch_size=150, min_batch_size=100, max_batch_size=1000)
+        batch.update(150, 10.0, 0)
+        self.assertEqual(batch.size, 100)
+        batch.update(100, 10.0, 0)
+        self.assertEqual(batch.size, 100)
+        for _ in range(5):
+            batch.update(batch.size, 0.01, 0)
+        self.assertEqual(batch.size, 1000)
+        self.assertEqual(batch.summary(), '150, 100 x 2, 200, 400, 800, 1000')
+
+    def test_memory_budget(self):
+        batch = self.sizer(max_batch_memory_mb=1)
+        # 1000 rows of 2 KiB each: 512 rows fit in 1 MiB
+        batch.update(1000, 0.1, 1000 * 2048)
+        self.assertEqual(batch.size, 512)
+
+
+class RowMapperTests(SimpleTestCase):
+    """
+    RowMapper maps csv.reader rows to the same values as the DictReader mapping it replaced.
+    """
+    def test_matches_dict_reader_mapping(self):
+        with open(os.path.join(settings.BASE_DIR, 'sales', 'management', 'configs', 'platform_config.json')) as file:
+            config = json.load(file)['Amazon']
+        missing = ('PhoneNumber', 'WarehouseLocation')
+        header = [column for column in benchmark_header(config) if column not in missing]
+        rows = [
+            [row[column] for column in header]
+            for row in generate_platform_rows('Amazon', config, 20, seed=1)
+        ]
+        for row in rows[::3]:
+            row[header.index('DeliveryDate')] = ''
+        rows[1][header.index('DateOfSale')] = ''
+        # A short row, without its delivery columns, and a blank line
+        rows[2] = rows[2][:header.index('SellingPrice') + 1]
+        rows.insert(4, [])
+
+        file = io.StringIO()
+        csv.writer(file).writerows([header, *rows])
+        lines = file.getvalue().splitlines(keepends=True)
+
+        reader = csv.reader(lines)
+        mapped = [tuple(row) for row in compile_row_mapper(config, reader).map_rows(reader)]
+        expected = [map_dict_row(config, row) for row in csv.DictReader(lines)]
+        self.assertEqual(len(mapped), 20)
+        self.assertEqual(mapped, expected)
+        self.assertIsNone(mapped[0][14])
+        self.assertIsNone(mapped[1][8])
+        self.assertIsNone(mapped[2][13])
+
+
+class ImportEngineTests(PlatformImportMixin, TestCase):
+    """
+    Both engines store the same rows and rollup from the same files in the default
+    "ignore" conflict mode, including rows repeated within the file and rows
+    conflicting with earlier ones or with those already stored.
+    """
+    def setUp(self):
+        self.create_platform()
+        rows = list(generate_platform_rows('Amazon', self.config, 300))
+        conflicting = [{
+            **row,
+            self.mapping['customer_name']: 'Renamed',
+            self.mapping['product_category']: 'Moved',
+            self.mapping['item_quantity']: '7',
+            self.mapping['delivery_status']: 'Lost',
+        } for row in rows[10:30]]
+        self.files = [
+            rows[:150],
+            conflicting[:5] + rows[:75] + rows[:20] + rows[75:] + conflicting[5:] + rows[200:220],
+        ]
+
+    def test_engines_store_the_same_rows(self):
+        contents = {}
+        for engine in ('orm', 'copy'):
+            with self.subTest(engine=engine):
+                self.config['import_engine'] = engine
+                for rows in self.files:
+                    stats = self.import_rows(rows)
+                    # Both engines commit batches of batch_size rows
+                    self.assertEqual(stats['batches_committed'], -(-len(rows) // 50))
+                    self.assertEqual(stats['rows_committed'], len(rows))
+                contents[engine] = self.table_contents(), self.rollup()
+
+                rebuild_monthly_rollup()
+                self.assertEqual(self.rollup(), contents[engine][1])
+                self.delete_imported_rows()
+
+        self.assertEqual(contents['orm'], contents['copy'])
+        tables, rollup = contents['orm']
+        self.assertEqual(len(tables['orders']), len({row[self.mapping['order_id']] for row in self.files[1]}))
+        self.assertTrue(rollup)
+
+
+class ImportCheckpointTests(PlatformImportMixin, TestCase):
+    """
+    Imports resume after the last batch committed by an interrupted run, and
+    files that were already imported completely are skipped.
+    """
+    def setUp(self):
+        self.use_temporary_media_root()
+        self.create_platform()
+        self.rows = list(generate_platform_rows('Amazon', self.config, 120, seed=2))
+        self.content = self.csv_content(self.rows).encode()
+
+    def save_file(self):
+        return self.save_import_file(self.content)
+
+    def test_resumes_after_last_committed_batch(self):
+        self.import_rows(self.rows)
+        expected = self.table_contents(), self.rollup()
+        self.delete_imported_rows()
+        path = self.save_file()
+
+        # The second batch of each engine fails before writing anything
+        batch_functions = {'orm': (tasks, 'process_batch'), 'copy': (copy_import, 'merge_batch')}
+        for engine, (module, name) in batch_functions.items():
+            with self.subTest(engine=engine):
+                self.config['import_engine'] = engine
+                checkpoint = get_checkpoint(self.platform, file_sha256(path))
+                commit_batch = getattr(module, name)
+                batches = []
+
+                def interrupted_batch(*args):
+                    batches.append(args)
+                    if len(batches) > 1:
+                        raise DatabaseError('connection lost')
+                    return commit_batch(*args)
+
+                with mock.patch.object(module, name, side_effect=interrupted_batch):
+                    with self.assertRaises(DatabaseError):
+                        import_platform_data(self.platform, path, checkpoint)
+                checkpoint.refresh_from_db()
+                self.assertEqual(checkpoint.row_count, 50)
+                self.assertIsNone(checkpoint.completed_at)
+
+                stats = import_platform_data(self.platform, path, get_checkpoint(self.platform, file_sha256(path)))
+                self.assertEqual((stats['rows_committed'], stats['row_count']), (70, 120))
+                self.assertEqual((self.table_contents(), self.rollup()), expected)
+
+                self.delete_imported_rows()
+                ImportCheckpoint.objects.all().delete()
+
+    def test_skips_file_imported_completely(self):
+        path = self.save_file()
+        import_platform_data(self.platform, path, get_checkpoint(self.platform, file_sha256(path)))
+        contents = self.table_contents()
+
+        path = self.save_file()
+        with mock.patch('sales.tasks.import_platform_data') as import_data:
+            result = import_data_task.apply(args=('amazon', path)).get()
+        import_data.assert_not_called()
+        self.assertEqual(result, {'skipped': True, 'row_count': 120})
+        self.assertFalse(default_storage.exists(path))
+        self.assertEqual(self.table_contents(), contents)
+
+
+class CompressedImportTests(PlatformImportMixin, TestCase):
+    """
+    gzip and zstd uploads are imported as their decompressed content, and chunks
+    and checkpoints resume at byte offsets of that content.
+    """
+    compressors = {'gzip': gzip.compress, 'zstd': lambda content: zstandard.ZstdCompressor().compress(content)}
+
+    def setUp(self):
+        self.use_temporary_media_root()
+        self.create_platform()
+        self.rows = list(generate_platform_rows('Amazon', self.config, 120, seed=3))
+        self.content = self.csv_content(self.rows).encode()
+
+    def compressed_files(self):
+        """
+        Yields the compression and path of each compressed copy of the content, as subtests.
+        """
+        for compression, compress in self.compressors.items():
+            with self.subTest(compression=compression):
+                if compression == 'zstd' and zstandard is None:
+                    self.skipTest('zstandard is not installed')
+                path = self.save_import_file(compress(self.content), f'tmp/amazon.csv.{compression}')
+                self.assertEqual(file_compression(path), compression)
+                yield compression, path
+
+    def test_compressed_files_match_plain_file(self):
+        for engine in ('orm', 'copy'):
+            self.config['import_engine'] = engine
+            path = self.save_import_file(self.content)
+            import_platform_data(self.platform, path, get_checkpoint(self.platform, file_sha256(path)))
+            expected = self.table_contents(), self.rollup()
+            self.delete_imported_rows()
+
+            for compression, path in self.compressed_files():
+                stats = import_platform_data(self.platform, path, get_checkpoint(self.platform, file_sha256(path)))
+                self.assertEqual(stats['rows_committed'], 120)
+                self.assertEqual((self.table_contents(), self.rollup()), expected)
+                self.delete_imported_rows()
+            ImportCheckpoint.objects.all().delete()
+
+    def test_chunk_lines_resume_at_offset(self):
+        header, *lines = self.content.decode().splitlines(keepends=True)
+        start = len(header) + sum(len(line) for line in lines[:40])
+        end = start + sum(len(line) for line in lines[40:50]) - 1
+        for compression, path in self.compressed_files():
+            with open_import_file(path) as file:
+                chunk = ChunkLines(file, start)
+                self.assertEqual(list(chunk), [header] + lines[40:])
+                self.assertEqual(chunk.position, len(self.content))
+            # A chunk ends with the line spanning its end
+            with open_import_file(path) as file:
+                self.assertEqual(list(ChunkLines(file, start, end)), [header] + lines[40:50])
+
+
+class ImportStatusTests(PlatformImportMixin, TestCase):
+    """
+    The import status endpoint reports the state and progress of import tasks from
+    the result backend, adding up the chunks of parallel imports, and both engines
+    publish their progress after every batch.
+    """
+    def get_status(self, results, task_id):
+        def async_result(result_id):
+            state, info = results.get(result_id, ('PENDING', None))
+            return mock.Mock(state=state, info=info, result=info)
+
+        with mock.patch('sales.tasks.AsyncResult', side_effect=async_result):
+            return ImportStatusAPI.as_view()(
+                APIRequestFactory().get(reverse('import-status', args=[task_id])), task_id=task_id).data
+
+    def test_pending_and_progress(self):
+        task_id = uuid.uuid4()
+        self.assertEqual(self.get_status({}, task_id), {'task_id': str(task_id), 'state': 'PENDING', 'progress': None})
+
+        stats = {'rows_read': 100, 'rows_committed': 50, 'batches_committed': 1}
+        for state in ('PROGRESS', 'SUCCESS'):
+            status = self.get_status({str(task_id): (state, stats)}, task_id)
+            self.assertEqual((status['state'], status['progress']), (state, stats))
+
+        status = self.get_status({str(task_id): ('FAILURE', ValueError('bad file'))}, task_id)
+        self.assertEqual((status['state'], status['error']), ('FAILURE', 'bad file'))
+
+    def test_parallel_import_adds_up_chunks(self):
+        task_id = uuid.uuid4()
+        chunk_stats = {'rows_read': 10, 'rows_committed': 10, 'inserted': {'orders': 4}, 'elapsed_seconds': 2.0}
+        results = {
+            str(task_id): ('SUCCESS', {
+                'chunk_task_ids': ['chunk-1', 'chunk-2', 'chunk-3'], 'finalize_task_id': 'final',
+            }),
+            'chunk-1': ('SUCCESS', chunk_stats),
+            'chunk-2': ('PROGRESS', {**chunk_stats, 'rows_committed': 5, 'elapsed_seconds': 1.0}),
+        }
+        status = self.get_status(results, task_id)
+        self.assertEqual(status['state'], 'PROGRESS')
+        self.assertEqual(status['chunks'], {'PENDING': 1, 'PROGRESS': 1, 'SUCCESS': 1})
+        self.assertEqual(status['progress'], {
+            'rows_read': 20, 'rows_committed': 15, 'inserted': {'orders': 8}, 'elapsed_seconds': 2.0,
+            'rows_per_sec': 10.0,
+        })
+
+        results.update({'chunk-3': ('SUCCESS', chunk_stats), 'chunk-2': ('SUCCESS', chunk_stats)})
+        self.assertEqual(self.get_status(results, task_id)['state'], 'PROGRESS')
+        results['final'] = ('SUCCESS', {'rows': 30, 'chunks': 3})
+        status = self.get_status(results, task_id)
+        self.assertEqual((status['state'], status['chunks']), ('SUCCESS', {'SUCCESS': 3}))
+
+        results['chunk-1'] = ('FAILURE', DatabaseError('connection lost'))
+        self.assertEqual(self.get_status(results, task_id)['state'], 'FAILURE')
+
+    # The partitions created by the test's imports are rolled back with it, so
+    # running their on-commit callbacks must not make them known for good
+    @mock.patch('sales.partitions.known_partitions', set())
+    @mock.patch('sales.checkpoints.PROGRESS_INTERVAL', 0)
+    def test_engines_publish_progress_per_batch(self):
+        self.create_platform()
+        rows = list(generate_platform_rows('Amazon', self.config, 120))
+        for engine in ('orm', 'copy'):
+            with self.subTest(engine=engine):
+                self.config['import_engine'] = engine
+                published = []
+                progress = ImportProgress(publish=published.append)
+                with self.captureOnCommitCallbacks(execute=True):
+                    import_platform_rows(self.platform, csv.reader(io.StringIO(self.csv_content(rows))), progress)
+                self.assertEqual(len(published), 3)
+                self.assertEqual(published[-1]['rows_committed'], 120)
+                self.delete_imported_rows()
+
+
+class ParallelImportTests(PlatformImportMixin, TestCase):
+    """
+    Parallel imports split the file into chunks imported by a chord of subtasks,
+    here run eagerly.
+    """
+    def setUp(self):
+        self.use_temporary_media_root()
+        self.create_platform(import_mode='parallel', chunk_size=4096)
+        self.rows = list(generate_platform_rows('Amazon', self.config, 150, seed=3))
+        self.content = self.csv_content(self.rows).encode()
+
+        conf = import_chunk_task.app.conf
+        self.addCleanup(setattr, conf, 'task_always_eager', conf.task_always_eager)
+        conf.task_always_eager = True
+        for name in ('schedule_import_refreshes', 'task_progress_publisher'):
+            patcher = mock.patch(f'sales.tasks.{name}', return_value=None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_chunks_match_serial_import(self):
+        self.import_rows(self.rows)
+        expected = self.table_contents(), self.rollup()
+        self.delete_imported_rows()
+
+        path = self.save_import_file(self.content)
+        checkpoint = get_checkpoint(self.platform, file_sha256(path))
+        result = import_platform_data_parallel(self.platform, path, checkpoint)
+        self.assertGreater(len(result['chunk_task_ids']), 1)
+        self.assertEqual((self.table_contents(), self.rollup()), expected)
+
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.row_count, 150)
+        self.assertIsNotNone(checkpoint.completed_at)
+        self.assertEqual(
+            ImportCheckpoint.objects.filter(file_hash=checkpoint.file_hash, chunk_start__gt=0).count(),
+            len(result['chunk_task_ids']))
+        self.assertFalse(default_storage.exists(path))
+
+    def test_chunk_failing_for_good_deletes_file(self):
+        path = self.save_import_file(self.content)
+        file_hash = file_sha256(path)
+        with mock.patch('sales.tasks.import_file_range', side_effect=DatabaseError('connection lost')) as import_range:
+            with self.assertRaises(DatabaseError):
+                import_chunk_task.apply(args=(str(self.platform.platform_id), path, file_hash, 0, 100)).get()
+        self.assertEqual(import_range.call_count, import_chunk_task.max_retries + 1)
+        self.assertFalse(default_storage.exists(path))
+
+
+class OrderDateTests(PlatformImportMixin, TestCase):
+    """
+    An order_id has a single order_date: an order re-sent with another date keeps
+    its stored one, or moves to the new one with its items in the "upsert"
+    conflict mode, and is never stored twice.
+    """
+    def setUp(self):
+        self.create_platform()
+        self.rows = list(generate_platform_rows('Amazon', self.config, 100))
+        self.order_id = self.rows[0][self.mapping['order_id']]
+        self.stored_date = date.fromisoformat(self.rows[0][self.mapping['order_date']])
+        # Re-sent in another month, with one more item
+        resent = [row for row in self.rows if row[self.mapping['order_id']] == self.order_id]
+        resent.append({**self.rows[-1], self.mapping['order_id']: self.order_id})
+        self.resent_rows = [{**row, self.mapping['order_date']: '2022-06-15'} for row in resent]
+
+    def import_resent_order(self, engine):
+        self.config['import_engine'] = engine
+        self.import_rows(self.rows)
+        items = OrderItem.objects.filter(order_id=self.order_id).count()
+        stats = self.import_rows(self.resent_rows)
+
+        order = Order.objects.get(order_id=self.order_id)
+        self.assertEqual(Delivery.objects.get(order_id=self.order_id).order_id, self.order_id)
+        order_items = OrderItem.objects.filter(order_id=self.order_id)
+        self.assertEqual(order_items.count(), items + 1)
+        self.assertEqual({order_item.order_date for order_item in order_items}, {order.order_date})
+        self.assertEqual(
+            set(OrderKey.objects.values_list('order_id', 'order_date')),
+            set(Order.objects.values_list('order_id', 'order_date')))
+
+        rollup = self.rollup()
+        rebuild_monthly_rollup()
+        self.assertEqual(rollup, self.rollup())
+        return order, stats
+
+    def test_stored_date_is_kept(self):
+        for engine in ('orm', 'copy'):
+            with self.subTest(engine=engine):
+                order, stats = self.import_resent_order(engine)
+                self.assertEqual(order.order_date, self.stored_date)
+                self.assertEqual(stats['orders_moved'], 0)
+                self.delete_imported_rows()
+
+    def test_upsert_moves_the_order(self):
+        self.config['conflict_mode'] = 'upsert'
+        for engine in ('orm', 'copy'):
+            with self.subTest(engine=engine):
+                order, stats = self.import_resent_order(engine)
+                self.assertEqual(order.order_date, date(2022, 6, 15))
+                self.assertEqual(stats['orders_moved'], 1)
+                self.assertTrue({'2022-06', f'{self.stored_date:%Y-%m}'} <= set(stats['updated_months']))
+
+                refresh_order_lines()
+                lines = OrderLine.objects.filter(order_id=self.order_id)
+                self.assertEqual({line.order_date for line in lines}, {order.order_date})
+                self.delete_imported_rows()
+
+    def test_database_rejects_another_date(self):
+        self.import_rows(self.rows)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(
+                order_id=self.order_id, customer=self.platform.order_set.first().customer,
+                platform=self.platform, order_date=date(2022, 6, 15))
+
+
+class UpsertImportTests(PlatformImportMixin, TestCase):
+    """
+    Imports in the "upsert" conflict mode update the stored rows that changed, and
+    only them, with both engines, keeping the monthly rollup in step.
+    """
+    def setUp(self):
+        self.create_platform(conflict_mode='upsert')
+        self.rows = list(generate_platform_rows('Amazon', self.config, 200))
+
+    def test_changed_rows_are_updated(self):
+        mapping = self.mapping
+        order_id = self.rows[0][mapping['order_id']]
+        product_id = self.rows[1][mapping['product_id']]
+        changed_rows = [dict(row) for row in self.rows]
+        for row in changed_rows:
+            if row[mapping['order_id']] == order_id:
+                row[mapping['delivery_status']] = 'Lost'
+                row[mapping['item_quantity']] = '9'
+            if row[mapping['product_id']] == product_id:
+                row[mapping['product_category']] = 'Moved'
+
+        for engine in ('orm', 'copy'):
+            with self.subTest(engine=engine):
+                self.config['import_engine'] = engine
+                self.import_rows(self.rows)
+                stats = self.import_rows(changed_rows)
+                self.assertEqual(stats['inserted']['order_items'], 0)
+                self.assertEqual(stats['updated']['deliveries'], 1)
+                self.assertEqual(stats['updated']['products'], 1)
+                self.assertEqual(Delivery.objects.get(order_id=order_id).delivery_status, 'Lost')
+                self.assertEqual(
+                    set(OrderItem.objects.filter(order_id=order_id).values_list('quantity_sold', flat=True)), {9})
+                self.assertEqual(Product.objects.get(product_id=product_id).category, 'Moved')
+                self.assertIn(self.rows[0][mapping['order_date']][:7], stats['updated_months'])
+
+                rollup = self.rollup()
+                rebuild_monthly_rollup()
+                self.assertEqual(rollup, self.rollup())
+
+                # Unchanged rows are not written again
+                stats = self.import_rows(changed_rows)
+                self.assertEqual(sum(stats['inserted'].values()) + sum(stats['updated'].values()), 0)
+                self.delete_imported_rows()
+
+    def test_emptied_groups_are_deleted(self):
+        mapping = self.mapping
+        category = self.rows[0][mapping['product_category']]
+        changed_rows = [
+            {**row, mapping['product_category']: 'Moved'} if row[mapping['product_category']] == category else row
+            for row in self.rows
+        ]
+
+        for engine in ('orm', 'copy'):
+            with self.subTest(engine=engine):
+                self.config['import_engine'] = engine
+                self.import_rows(self.rows)
+                self.import_rows(changed_rows)
+                self.assertFalse(MonthlySalesRollup.objects.filter(category=category).exists())
+                self.assertFalse(MonthlySalesRollup.objects.filter(total_quantity=0).exists())
+
+                rollup = self.rollup()
+                rebuild_monthly_rollup()
+                self.assertEqual(rollup, self.rollup())
+                self.assertEqual(
+                    [month['month'] for month in SQLAnalytics().monthly_totals('total_quantity')],
+                    sorted({month for month, _, _ in rollup}))
+                self.delete_imported_rows()
+
+    def test_ignore_mode_keeps_stored_rows(self):
+        self.config['conflict_mode'] = 'ignore'
+        self.import_rows(self.rows)
+        mapping = self.mapping
+        changed_rows = [{**row, mapping['delivery_status']: 'Lost'} for row in self.rows]
+        stats = self.import_rows(changed_rows)
+        self.assertEqual(stats['updated']['deliveries'], 0)
+        self.assertFalse(Delivery.objects.filter(delivery_status='Lost').exists())
@@ -0,0 +1,266 @@
+from django.db import connection
+
+from sales.models import OrderKey, Product
+from sales.rollups import (UPSERT_ROLLUP_SQL, add_product_items_to_monthly_rollup, insert_order_items,
+                           lock_products, stored_order_item, stored_value, update_order_items)
+
+# Fields an import may update per table in the "upsert" conflict mode, all of
+# them by default. Unique keys are never updated: a corrected selling_price is
+# another order item. The order_date of orders is, by moving them (see
+# move_orders), as an order_id has a single order_date. The platform of an order
+# is not, it is the platform importing it.
+UPSERT_FIELDS = {
+    'customers': ('customer_name', 'contact_email', 'phone_number'),
+    'products': ('product_name', 'category'),
+    'orders': ('customer_id', 'platform_data', 'order_date'),
+    'order_items': ('quantity_sold', 'total_sale_value'),
+    'deliveries': (
+        'delivery_address', 'delivery_date', 'delivery_status', 'delivery_partner',
+        'delivery_data', 'delivery_state',
+    ),
+}
+
+# Unique keys the upserts conflict on, per table
+UPSERT_KEYS = {
+    'customers': ('customer_id',),
+    'products': ('product_id',),
+    'orders': ('order_id', 'order_date'),
+    'order_items': ('order_id', 'product_id', 'selling_price', 'order_date'),
+    'deliveries': ('order_id',),
+}
+
+CONFLICT_MODES = ('ignore', 'upsert')
+
+# Orders moving from stored_date to order_date, as one array parameter per column
+MOVES = 'unnest(%s::varchar[], %s::date[], %s::date[]) AS moves (order_id, stored_date, order_date)'
+
+# Adds the stored items of moving orders under {date} to the rollup with the sign given
+MOVED_ITEMS_ROLLUP_SQL = UPSERT_ROLLUP_SQL.format(items=(
+    '(SELECT items.order_id, items.order_date, items.product_id, %s * items.quantity_sold, '
+    f'%s * items.total_sale_value FROM order_items AS items JOIN {MOVES} '
+    'ON moves.order_id = items.order_id AND moves.{date} = items.order_date)'
+))
+
+# Updating order_date moves the rows to the partition of their new month, and
+# the triggers of orders update order_keys.
+MOVE_ORDERS_SQL = f"""
+    UPDATE orders SET order_date = moves.order_date
+    FROM {MOVES}
+    WHERE orders.order_id = moves.order_id AND orders.order_date = moves.stored_date
+"""
+
+MOVE_ORDER_ITEMS_SQL = f"""
+    UPDATE order_items SET order_date = moves.order_date
+    FROM {MOVES}
+    WHERE order_items.order_id = moves.order_id AND order_items.order_date = moves.stored_date
+"""
+
+
+def import_update_fields(platform_config):
+    """
+    Returns the fields imports update per table, from the platform config. With
+    ``"conflict_mode": "ignore"`` (default) rows already stored are kept as they
+    are and every table has none. With ``"upsert"`` every table has all of its
+    ``UPSERT_FIELDS``, unless ``upsert_fields`` lists others for it (``[]`` to
+    keep its rows as they are).
+    """
+    mode = platform_config.get('conflict_mode', 'ignore')
+    if mode not in CONFLICT_MODES:
+        raise ValueError(f"Unknown conflict mode '{mode}'.")
+    if mode == 'ignore':
+        return dict.fromkeys(UPSERT_FIELDS, ())
+
+    configured = platform_config.get('upsert_fields', {})
+    unknown_tables = set(configured) - set(UPSERT_FIELDS)
+    if unknown_tables:
+        raise ValueError(f"Unknown upsert tables: {', '.join(sorted(unknown_tables))}.")
+
+    update_fields = {}
+    for table, allowed in UPSERT_FIELDS.items():
+        fields = tuple(configured.get(table, allowed))
+        unknown_fields = set(fields) - set(allowed)
+        if unknown_fields:
+            raise ValueError(f"Fields of {table} that cannot be upserted: {', '.join(sorted(unknown_fields))}.")
+        update_fields[table] = fields
+    return update_fields
+
+
+def stored_values(instance, field_names):
+    """
+    Returns the values of ``field_names`` of an unsaved instance as they would be stored.
+    """
+    return tuple(stored_value(instance, field_name) for field_name in field_names)
+
+
+def split_changed_rows(objects, key_fields, field_names, **lookups):
+    """
+    Splits unsaved ``objects``, unique on ``key_fields``, against the rows matching
+    ``lookups``: returns the objects with no stored row, and ``(object, stored
+    values)`` pairs of those whose ``field_names`` differ from the stored row.
+    Unchanged objects are left out.
+    """
+    model = type(objects[0]) if objects else None
+    stored = {} if model is None else {
+        row[:len(key_fields)]: row[len(key_fields):]
+        for row in model.objects.filter(**lookups).values_list(*key_fields, *field_names)
+    }
+
+    new = []
+    changed = []
+    for instance in objects:
+        key = stored_values(instance, key_fields)
+        if key not in stored:
+            new.append(instance)
+        elif stored[key] != stored_values(instance, field_names):
+            changed.append((instance, stored[key]))
+    return new, changed
+
+
+def write_rows(model, new, changed, key_fields, field_names):
+    """
+    Inserts the ``new`` objects, ignoring conflicts, and upserts the ``changed`` ones
+    (see ``split_changed_rows``) with ``INSERT ... ON CONFLICT DO UPDATE`` of
+    ``field_names``, in the order given. Unchanged rows are not written at all, so
+    re-importing a file costs no row versions nor WAL.
+    """
+    model.objects.bulk_create(new, ignore_conflicts=True)
+    if changed:
+        model.objects.bulk_create(
+            [instance for instance, _ in changed],
+            update_conflicts=True, unique_fields=key_fields, update_fields=field_names,
+        )
+
+
+def split_unknown_rows(objects, known, field_names):
+    """
+    Splits unsaved customers or products, by primary key in key order, like
+    ``split_changed_rows``, leaving out those in the ``KnownIdCache`` ``known``
+    with the same values of ``field_names``. Also returns these values by
+    primary key, to add to ``known`` once the batch is committed.
+    """
+    values = {pk: stored_values(instance, field_names) for pk, instance in objects.items()}
+    unknown = known.unknown(values)
+    if not unknown:
+        known.queries_saved += 1
+        return values, [], []
+
+    model = type(next(iter(objects.values())))
+    key_fields = (model._meta.pk.name,)
+    new, changed = split_changed_rows(
+        [instance for pk, instance in objects.items() if pk in unknown],
+        key_fields, field_names, **{f'{key_fields[0]}__in': unknown})
+    return values, new, changed
+
+
+def write_objects(model, objects, key_fields, field_names, **lookups):
+    """
+    Inserts unsaved ``objects`` ignoring conflicts or, with ``field_names`` to
+    update, writes those that are new or changed against the rows matching
+    ``lookups`` (see ``write_rows``). Returns the changed objects.
+    """
+    if not field_names:
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+        return []
+
+    new, changed = split_changed_rows(objects, key_fields, field_names, **lookups)
+    write_rows(model, new, changed, key_fields, field_names)
+    return [instance for instance, _ in changed]
+
+
+def write_products(new, changed, field_names):
+    """
+    Writes products split by ``split_changed_rows``, moving the items of those
+    whose category changes to the new category in the monthly rollup. Those
+    products are locked before their items are subtracted, so that no import
+    adds items of theirs to the rollup until the change is committed (see
+    ``LOCK_PRODUCTS_SQL``). Returns the months of the items moved.
+    """
+    moved = []
+    if 'category' in field_names:
+        category_index = field_names.index('category')
+        moved = [product.product_id for product, stored in changed if stored[category_index] != product.category]
+
+    lock_products(moved, 'UPDATE')
+    add_product_items_to_monthly_rollup(moved, sign=-1)
+    write_rows(Product, new, changed, UPSERT_KEYS['products'], field_names)
+    return add_product_items_to_monthly_rollup(moved)
+
+
+def write_order_items(order_items, field_names):
+    """
+    Writes unsaved order items given in key order: inserts the first one of each
+    key, or the last one when ``field_names`` are updated, and updates those of
+    the stored items that differ, adding both to the monthly rollup (see
+    ``insert_order_items``). Their products are locked first, so their category
+    cannot change in between (see ``LOCK_PRODUCTS_SQL``). Returns the numbers of
+    items inserted and updated, and the months of those updated.
+    """
+    rows = {}
+    for order_item in order_items:
+        order_id, product_id, selling_price, quantity_sold, total_sale_value = stored_order_item(order_item)
+        key = (order_id, product_id, selling_price, order_item.order_date)
+        if field_names or key not in rows:
+            rows[key] = (order_id, order_item.order_date, product_id, quantity_sold, selling_price, total_sale_value)
+    rows = list(rows.values())
+
+    lock_products({row[2] for row in rows}, 'KEY SHARE')
+    inserted = insert_order_items(rows)
+    updated, months = update_order_items(rows, field_names)
+    return inserted, updated, months
+
+
+def order_date_moves(update_fields):
+    """
+    Returns whether imports move stored orders to the order_date of their rows,
+    and the other fields of orders they update (see ``import_update_fields``).
+    """
+    order_fields = update_fields['orders']
+    return 'order_date' in order_fields, tuple(field for field in order_fields if field != 'order_date')
+
+
+def stored_order_dates(order_ids):
+    """
+    Returns the order_date of the stored orders among ``order_ids``.
+    """
+    return dict(OrderKey.objects.filter(order_id__in=order_ids).values_list('order_id', 'order_date'))
+
+
+def assign_order_dates(orders_data, moves_orders):
+    """
+    Returns the order_date the rows of each order of a batch take, as an order_id
+    has a single order_date (see ``OrderKey``): the date of its first row, or of
+    its last one when orders move, and for stored orders their stored date,
+    unless they move to that of their rows. Also returns these moves for
+    ``move_orders``.
+    """
+    order_dates = {}
+    for data in orders_data:
+        if moves_orders or data['order_id'] not in order_dates:
+            order_dates[data['order_id']] = data['order_date']
+
+    moves = []
+    for order_id, stored_date in sorted(stored_order_dates(order_dates).items()):
+        if not moves_orders or order_dates[order_id] is None:
+            order_dates[order_id] = stored_date
+        elif order_dates[order_id] != stored_date:
+            moves.append((order_id, stored_date, order_dates[order_id]))
+    return order_dates, moves
+
+
+def move_orders(moves):
+    """
+    Moves stored orders, with their items, to another order_date, and their items
+    from the month of the old date to the month of the new one in the monthly
+    rollup. ``moves`` are ``(order_id, stored_date, order_date)`` tuples in
+    order_id order. Returns both dates of the orders moved.
+    """
+    if not moves:
+        return []
+
+    columns = [list(column) for column in zip(*moves)]
+    with connection.cursor() as cursor:
+        cursor.execute(MOVED_ITEMS_ROLLUP_SQL.format(date='stored_date'), [-1, -1, *columns])
+        cursor.execute(MOVE_ORDERS_SQL, columns)
+        cursor.execute(MOVE_ORDER_ITEMS_SQL, columns)
+        cursor.execute(MOVED_ITEMS_ROLLUP_SQL.format(date='order_date'), [1, 1, *columns])
+    return columns[1] + columns[2]
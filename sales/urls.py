@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (
-    MonthlySalesVolume, MonthlyRevenue, OrderListView, SummaryMetricsAPI,
-    DataImportAPI
+    MonthlySalesVolume, MonthlyRevenue, SalesTimeSeriesAPI, OrderListView, SummaryMetricsAPI,
+    DataImportAPI, ImportStatusAPI, ExportJobListAPI, ExportJobDetailAPI,
+    ExportJobDownloadAPI, QueryMetricsAPI
 )
 
 urlpatterns = [
@@ -10,6 +11,11 @@ urlpatterns = [
         DataImportAPI.as_view(),
         name='import-data'
     ),
+    path(
+        'import-data/<uuid:task_id>/',
+        ImportStatusAPI.as_view(),
+        name='import-status'
+    ),
     path(
         'monthly-sales-volume/',
         MonthlySalesVolume.as_view(),
@@ -20,14 +26,39 @@ urlpatterns = [
         MonthlyRevenue.as_view(),
         name='monthly-revenue'
     ),
+    path(
+        'sales-timeseries/',
+        SalesTimeSeriesAPI.as_view(),
+        name='sales-timeseries'
+    ),
     path(
         'orders/',
         OrderListView.as_view(),
         name='orders'
     ),
+    path(
+        'orders/export-jobs/',
+        ExportJobListAPI.as_view(),
+        name='export-jobs'
+    ),
+    path(
+        'orders/export-jobs/<uuid:job_id>/',
+        ExportJobDetailAPI.as_view(),
+        name='export-job'
+    ),
+    path(
+        'orders/export-jobs/<uuid:job_id>/download/',
+        ExportJobDownloadAPI.as_view(),
+        name='export-job-download'
+    ),
     path(
         'summary-metrics/',
         SummaryMetricsAPI.as_view(),
         name='summary-metrics'
     ),
+    path(
+        'metrics/',
+        QueryMetricsAPI.as_view(),
+        name='query-metrics'
+    ),
 ]
@@ -0,0 +1,253 @@
+import gzip
+import hashlib
+import io
+import re
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+READ_BLOCK_SIZE = 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+STATE_NOISE = re.compile(r'[^A-Za-z&]+')
+COUNTRY_NAMES = {'INDIA'}
+
+
+def parse_date(date_str, date_format):
+    """
+    Parses a date string into a date object using the provided format.
+    """
+    if date_str:
+        return datetime.strptime(date_str, date_format).date()
+    return None
+
+def normalize_state(value):
+    """
+    Normalizes a state name for exact, indexable matching: letters only, upper-cased.
+    """
+    return ' '.join(STATE_NOISE.sub(' ', value or '').split()).upper()
+
+def parse_state(address):
+    """
+    Derives the normalized state from a delivery address, taken as its last
+    comma-separated part once postal codes and the country are stripped.
+    """
+    for part in reversed((address or '').split(',')):
+        state = normalize_state(part)
+        if state and state not in COUNTRY_NAMES:
+            return state
+    return ''
+
+def file_sha256(file_path):
+    """
+    Returns the SHA-256 hex digest of a file in default storage, as uploaded.
+    """
+    digest = hashlib.sha256()
+    with default_storage.open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(READ_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_compression(file_path):
+    """
+    Returns ``'gzip'`` or ``'zstd'`` for compressed files in default storage, from
+    their magic bytes, or ``None`` for plain files.
+    """
+    with default_storage.open(file_path, 'rb') as file:
+        magic = file.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+@contextmanager
+def open_import_file(file_path):
+    """
+    Opens a CSV file in default storage for binary reading, decompressing gzip
+    and zstd uploads on the fly so they are never written out or held in memory.
+    """
+    compression = file_compression(file_path)
+    with default_storage.open(file_path, 'rb') as file:
+        if compression == 'gzip':
+            with gzip.GzipFile(fileobj=file, mode='rb') as stream:
+                yield stream
+        elif compression == 'zstd':
+            if zstandard is None:
+                raise ImproperlyConfigured('Importing zstd-compressed files requires the zstandard package.')
+            with io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(file),
+                                   buffer_size=READ_BLOCK_SIZE) as stream:
+                yield stream
+        else:
+            yield file
+
+def split_file_chunks(file_path, chunk_size):
+    """
+    Splits an uncompressed CSV file in default storage into ``(start, end)`` byte
+    ranges of roughly ``chunk_size`` bytes that start after the header and end on
+    newline boundaries.
+    """
+    chunks = []
+    file_size = default_storage.size(file_path)
+    with default_storage.open(file_path, 'rb') as file:
+        file.readline()
+        start = file.tell()
+
+        while start < file_size:
+            file.seek(min(start + chunk_size, file_size))
+            file.readline()
+            end = file.tell()
+            chunks.append((start, end))
+            start = end
+
+    return chunks
+
+
+class ChunkLines:
+    """
+    Iterates over the header line of a binary CSV file opened at its beginning,
+    followed by the decoded lines from byte ``start`` (the first row when it
+    falls in the header) up to byte ``end`` or the end of the file. Streams that
+    cannot seek are read forward to ``start``. ``position`` is the byte offset
+    after the last line handed out, where a reader that has consumed every line
+    so far would resume.
+    """
+    def __init__(self, file, start=0, end=None):
+        self.file = file
+        self.start = start
+        self.end = end
+        self.position = start
+
+    def __iter__(self):
+        header = self.file.readline()
+        self.position = max(self.start, len(header))
+        if self.file.seekable():
+            self.file.seek(self.position)
+        else:
+            remaining = self.position - len(header)
+            while remaining > 0:
+                block = self.file.read(min(remaining, READ_BLOCK_SIZE))
+                if not block:
+                    break
+                remaining -= len(block)
+        yield header.decode()
+
+        while self.end is None or self.position < self.end:
+            line = self.file.readline()
+            if not line:
+                break
+            self.position += len(line)
+            yield line.decode()
+
+
+class KnownIdCache:
+    """
+    Bounded LRU set of primary keys known to exist in the database, shared by
+    the batches of one import so repeated IDs skip the existence lookup. IDs may
+    be given as a mapping to the values stored for them, and are then only known
+    with the same values, so upserts still look up the rows whose values changed.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.ids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.queries_saved = 0
+
+    def unknown(self, ids):
+        """
+        Returns the set of ``ids`` not known to exist, marking the known ones as recently used.
+        """
+        unknown = set()
+        for id_ in ids:
+            if id_ in self.ids and self.ids[id_] == (ids[id_] if isinstance(ids, dict) else None):
+                self.ids.move_to_end(id_)
+                self.hits += 1
+            else:
+                unknown.add(id_)
+                self.misses += 1
+        return unknown
+
+    def add(self, ids):
+        """
+        Records ``ids`` as existing, evicting the least recently used IDs beyond ``maxsize``.
+        """
+        for id_ in ids:
+            self.ids[id_] = ids[id_] if isinstance(ids, dict) else None
+            self.ids.move_to_end(id_)
+        while len(self.ids) > self.maxsize:
+            self.ids.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return f'{hit_rate:.1%} hit rate, {self.queries_saved} queries saved'
+
+
+class BatchSizer:
+    """
+    Chooses the number of rows per import batch. A numeric ``batch_size`` is used as
+    is. With ``"batch_size": "adaptive"`` the size starts at ``initial_batch_size``
+    and is rescaled after every batch toward ``target_batch_seconds`` per batch
+    transaction, at most doubling or halving per step, within ``min_batch_size``
+    and ``max_batch_size`` and under ``max_batch_memory_mb`` of collected rows.
+    """
+    def __init__(self, platform_config):
+        batch_size = platform_config.get('batch_size', 1000)
+        self.adaptive = batch_size == 'adaptive'
+        self.size = platform_config.get('initial_batch_size', 1000) if self.adaptive else batch_size
+        self.minimum = platform_config.get('min_batch_size', 100)
+        self.maximum = platform_config.get('max_batch_size', 20000)
+        self.target_seconds = platform_config.get('target_batch_seconds', 0.5)
+        self.max_memory = platform_config.get('max_batch_memory_mb', 256) * 1024 * 1024
+        self.sizes = []
+
+    def update(self, rows, seconds, memory):
+        """
+        Records a batch of ``rows`` whose transaction took ``seconds`` and whose
+        collected rows held about ``memory`` bytes, and adapts the next size.
+        """
+        self.sizes.append(rows)
+        if not self.adaptive:
+            return
+
+        size = rows * self.target_seconds / seconds if seconds > 0 else self.size * 2
+        size = min(max(size, self.size / 2), self.size * 2)
+        if memory > 0:
+            # Never more rows than fit in the memory budget at this batch's row size
+            size = min(size, rows * self.max_memory / memory)
+        self.size = int(min(max(size, self.minimum), self.maximum))
+
+    def summary(self):
+        """
+        Returns the batch sizes used so far, with repeated sizes collapsed, e.g. ``1000, 2000 x 3``.
+        """
+        runs = []
+        for size in self.sizes:
+            if runs and runs[-1][0] == size:
+                runs[-1][1] += 1
+            else:
+                runs.append([size, 1])
+        return ', '.join(f'{size} x {count}' if count > 1 else str(size) for size, count in runs)
+
+
+def deep_sizeof(value):
+    """
+    Approximates the memory held by a value and the containers and strings it references.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_sizeof(item) for item in value)
+    return size
@@ -1,19 +1,28 @@
-import csv
 import logging
+from datetime import timedelta
 
+from django.conf import settings
 from django.core.files.storage import default_storage
-from django.db.models import Prefetch, Sum
-from django.db.models.functions import TruncMonth
-from django.http import HttpResponse
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from sales.filters import OrderFilter
-from sales.models import Order, OrderItem
-from sales.serializers import OrderSerializer
-from sales.tasks import import_data_task
+from sales.analytics import (
+    TIMESERIES_GRANULARITIES, TIMESERIES_GROUP_BY, SampledAnalytics, get_analytics_engine,
+)
+from sales.cache import cached_response, data_fingerprint
+from sales.exports import export_fieldnames, export_platforms, iter_csv_lines
+from sales.filters import OrderFilter, OrderLineFilter
+from sales.models import ExportJob, Order, OrderLine
+from sales.pagination import OrderKeysetPagination
+from sales.profiling import profile_store
+from sales.serializers import ExportJobSerializer, OrderRowSerializer, OrderSerializer
+from sales.tasks import export_orders_task, import_data_task, import_task_status
 
 logger = logging.getLogger(__name__)
 
@@ -37,9 +46,10 @@ class DataImportAPI(APIView):
             file_path = default_storage.save('tmp/' + uploaded_file.name, uploaded_file)
 
             # Trigger the Celery task
-            import_data_task.delay(platform, file_path)
+            result = import_data_task.delay(platform, file_path)
             response = {
-                "message": "Data import task has been initiated with the uploaded file."
+                "message": "Data import task has been initiated with the uploaded file.",
+                "task_id": result.id,
             }
 
         except Exception as e:
@@ -51,15 +61,28 @@ class DataImportAPI(APIView):
         return Response(response)
 
 
+class ImportStatusAPI(APIView):
+    """
+    API endpoint returning the live progress of an import task: rows read and committed,
+    inserts and skipped conflicts per table, batches, rows/sec and parse vs database time.
+    """
+    def get(self, request, task_id):
+        try:
+            response = import_task_status(str(task_id))
+        except Exception as e:
+            error_message = f"Error fetching import status: {str(e)}"
+            logger.error(error_message)
+            response = {
+                "error": error_message
+            }
+        return Response(response)
+
+
 class MonthlySalesVolume(APIView):
+    @cached_response('monthly-sales-volume')
     def get(self, request):
         try:
-            response = OrderItem.objects.annotate(
-                month=TruncMonth('order__order_date')).values(
-                'month').annotate(
-                total_quantity=Sum('quantity_sold')).order_by(
-                'month'
-            )
+            response = get_analytics_engine().monthly_totals('total_quantity')
         except Exception as e:
             error_message = f"Error fetching monthly sales volume: {str(e)}"
             logger.error(error_message)
@@ -70,14 +93,10 @@ class MonthlySalesVolume(APIView):
 
 
 class MonthlyRevenue(APIView):
+    @cached_response('monthly-revenue')
     def get(self, request):
         try:
-            response = OrderItem.objects.annotate(
-                month=TruncMonth('order__order_date')).values(
-                'month').annotate(
-                total_revenue=Sum('total_sale_value')).order_by(
-                'month'
-            )
+            response = get_analytics_engine().monthly_totals('total_revenue')
         except Exception as e:
             error_message = f"Error fetching monthly revenue: {str(e)}"
             logger.error(error_message)
@@ -87,84 +106,101 @@ class MonthlyRevenue(APIView):
         return Response(response)
 
 
+class SalesTimeSeriesAPI(APIView):
+    """
+    Sales volume, revenue and order count per day, week, month or quarter of
+    ``order_date``, optionally per platform, category or delivery status, over the
+    orders matching the ``OrderFilter`` query parameters, aggregated in one query
+    by the analytics engine. A category filter also restricts the items counted to
+    that category.
+    """
+    @cached_response('sales-timeseries')
+    def get(self, request):
+        try:
+            granularity = request.query_params.get('granularity', 'month')
+            group_by = request.query_params.get('group_by')
+            errors = {}
+            if granularity not in TIMESERIES_GRANULARITIES:
+                errors['granularity'] = [f"Must be one of {', '.join(TIMESERIES_GRANULARITIES)}."]
+            if group_by is not None and group_by not in TIMESERIES_GROUP_BY:
+                errors['group_by'] = [f"Must be one of {', '.join(TIMESERIES_GROUP_BY)}."]
+
+            # The category filter applies to the items, which implies the order filter
+            params = request.query_params.copy()
+            category = params.pop('category', [''])[-1]
+            filterset = OrderFilter(params, queryset=Order.objects.all())
+            if errors or not filterset.is_valid():
+                return Response({**errors, **filterset.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+            response = get_analytics_engine().time_series(filterset, granularity, group_by, category)
+        except Exception as e:
+            error_message = f"Error fetching sales time series: {str(e)}"
+            logger.error(error_message)
+            response = {
+                "error": error_message
+            }
+        return Response(response)
+
+
+def cacheable_order_page(request):
+    """
+    Only the first ``RESPONSE_CACHE_MAX_PAGE`` pages of orders are cached, not CSV exports or cursor pages.
+    """
+    params = request.query_params
+    if params.get('export') == 'true' or 'cursor' in params:
+        return False
+    try:
+        return int(params.get('page', 1)) <= settings.RESPONSE_CACHE_MAX_PAGE
+    except ValueError:
+        return False
+
+
 class OrderListView(generics.ListAPIView):
-    queryset = Order.objects.all()
+    """
+    Lists or exports the orders matching the ``OrderLineFilter`` parameters, read
+    from the ``order_lines`` view, as ``OrderSerializer`` would represent them.
+    """
+    queryset = OrderLine.objects.all()
     serializer_class = OrderSerializer
     filter_backends = (DjangoFilterBackend,)
-    filterset_class = OrderFilter
-
-    def get_queryset(self):
-        # Using select_related for single-depth relationships
-        # Using prefetch_related for deeper relationships or many-to-many relationships
-        queryset =  Order.objects.select_related(
-            'customer', 'platform').prefetch_related(
-            Prefetch(
-                'order_items',
-                queryset=OrderItem.objects.select_related('product')
-            ),
-            'delivery').order_by(
-            'order_id'
-        )
-        return queryset
+    filterset_class = OrderLineFilter
+
+    @property
+    def paginator(self):
+        """
+        Uses keyset pagination for ``?pagination=cursor`` and the default
+        page-number pagination otherwise.
+        """
+        if (not hasattr(self, '_paginator')
+                and self.request.query_params.get('pagination') == 'cursor'):
+            self._paginator = OrderKeysetPagination()
+        return super().paginator
 
     def export_to_csv(self):
-        response = HttpResponse(
+        """
+        Streams the filtered orders as CSV, one row per order item.
+        """
+        platforms = export_platforms(self.request.query_params.get('platform'))
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(
+            iter_csv_lines(queryset, export_fieldnames(platforms)),
             content_type='text/csv',
             headers={'Content-Disposition': 'attachment; filename="orders.csv"'},
         )
-        fieldnames = [
-            'order_id', 'order_date', 'customer_id', 'platform_id',
-            'product_id', 'product_name', 'category', 'quantity_sold',
-            'selling_price', 'total_sale_value', 'delivery_id',
-            'delivery_address', 'delivery_date', 'delivery_status',
-            'delivery_partner'  # base fields
-        ]
-
-        # Dynamically determine additional field names from data
-        dynamic_fields = set()
-        queryset = self.filter_queryset(self.get_queryset())
-        for order in queryset:
-            platform_order_fields = order.platform.platform_config.get(
-                'platform_data_field_mapping', {}).values()
-            platform_delivery_fields = order.platform.platform_config.get(
-                'delivery_data_field_mapping', {}).values()
-            dynamic_fields.update(platform_order_fields)
-            dynamic_fields.update(platform_delivery_fields)
-
-        # Update fieldnames list
-        fieldnames.extend(dynamic_fields)
 
-        writer = csv.DictWriter(response, fieldnames=fieldnames, delimiter=';')
-        writer.writeheader()
-
-        # Reset the query to iterate for writing rows
-        queryset = self.filter_queryset(self.get_queryset())
-        for order in queryset:
-            for item in order.order_items.all():
-                row_data = {
-                    'order_id': order.order_id,
-                    'order_date': order.order_date,
-                    'customer_id': order.customer.customer_id,
-                    'platform_id': order.platform.platform_id,
-                    'product_id': item.product.product_id,
-                    'product_name': item.product.product_name,
-                    'category': item.product.category,
-                    'quantity_sold': item.quantity_sold,
-                    'selling_price': item.selling_price,
-                    'total_sale_value': item.total_sale_value,
-                    'delivery_id': order.delivery.delivery_id,
-                    'delivery_address': order.delivery.delivery_address,
-                    'delivery_date': order.delivery.delivery_date,
-                    'delivery_status': order.delivery.delivery_status,
-                    'delivery_partner': order.delivery.delivery_partner,
-                }
-                # Append dynamic data
-                row_data.update(order.platform_data)
-                row_data.update(order.delivery.delivery_data)
-                writer.writerow(row_data)
-
-        return response
+    def list_rows(self):
+        """
+        Lists the filtered orders through ``OrderRowSerializer``, paginating the
+        first lines of the orders, producing the same response as ``OrderSerializer``.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).filter(line_number=1).order_by(
+            'order_id').values('order_id', 'order_date')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(OrderRowSerializer(page).data)
+        return Response(OrderRowSerializer(list(queryset)).data)
 
+    @cached_response('orders', cacheable=cacheable_order_page)
     def list(self, request, *args, **kwargs):
         try:
             export = request.query_params.get('export', False)
@@ -172,7 +208,10 @@ class OrderListView(generics.ListAPIView):
             if export:
                 response = self.export_to_csv()
             else:
-                response = super().list(request, *args, **kwargs)
+                response = self.list_rows()
+        except APIException:
+            # Invalid pages, cursors and orderings are client errors (400/404)
+            raise
         except Exception as e:
             error_message = f"Error fetching orders: {str(e)}"
             logger.error(error_message)
@@ -182,24 +221,109 @@ class OrderListView(generics.ListAPIView):
         return response
 
 
+class ExportJobListAPI(APIView):
+    """
+    API endpoint to enqueue a background export of the orders matching the
+    ``OrderLineFilter`` parameters. Identical requests within ``EXPORT_JOB_TTL``
+    seconds, with no import committed since, reuse the existing job.
+    """
+    def post(self, request):
+        try:
+            params = request.query_params.dict()
+            params.update(request.data.items())
+            filters = {
+                name: value for name, value in params.items()
+                if name in OrderLineFilter.base_filters
+            }
+            filterset = OrderLineFilter(filters, queryset=OrderLine.objects.none())
+            if not filterset.is_valid():
+                return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            filters_hash = data_fingerprint(filters)
+            job = ExportJob.objects.filter(
+                filters_hash=filters_hash,
+                created_at__gte=timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TTL)
+            ).exclude(status=ExportJob.STATUS_FAILED).order_by('-created_at').first()
+
+            if job is None:
+                job = ExportJob.objects.create(filters=filters, filters_hash=filters_hash)
+                try:
+                    export_orders_task.delay(str(job.job_id))
+                except Exception as e:
+                    # A job that was never enqueued must not be reused as pending
+                    job.status = ExportJob.STATUS_FAILED
+                    job.error = f"Error enqueueing export job: {str(e)}"
+                    job.completed_at = timezone.now()
+                    job.save()
+                    raise
+                response_status = status.HTTP_202_ACCEPTED
+            else:
+                response_status = status.HTTP_200_OK
+
+            return Response(
+                ExportJobSerializer(job, context={'request': request}).data,
+                status=response_status
+            )
+        except Exception as e:
+            error_message = f"Error creating export job: {str(e)}"
+            logger.error(error_message)
+            return Response({"error": error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ExportJobDetailAPI(APIView):
+    """
+    API endpoint returning the status, row count and download link of an export job.
+    """
+    def get(self, request, job_id):
+        job = get_object_or_404(ExportJob, job_id=job_id)
+        return Response(ExportJobSerializer(job, context={'request': request}).data)
+
+
+class ExportJobDownloadAPI(APIView):
+    """
+    API endpoint serving the compressed CSV of a completed export job.
+    """
+    def get(self, request, job_id):
+        job = get_object_or_404(ExportJob, job_id=job_id, status=ExportJob.STATUS_COMPLETED)
+        return FileResponse(
+            default_storage.open(job.file_path, 'rb'),
+            as_attachment=True,
+            filename='orders.csv.gz',
+            content_type='application/gzip',
+        )
+
+
 class SummaryMetricsAPI(APIView):
+    """
+    Summary metrics over the orders matching the ``OrderFilter`` query parameters,
+    computed in a single query by the analytics engine and cached until the next
+    import commits. With ``approx=true`` they are estimated from a sample of the
+    order lines instead, with error bounds, in a time independent of the date range.
+    """
+    @cached_response('summary-metrics', timeout_setting='SUMMARY_METRICS_CACHE_TIMEOUT')
     def get(self, request):
         try:
-            total_revenue = OrderItem.objects.aggregate(Sum('total_sale_value'))
-            total_orders = Order.objects.count()
-            total_products_sold = OrderItem.objects.aggregate(
-                total_sold=Sum('quantity_sold'))
+            filterset = OrderFilter(request.query_params, queryset=Order.objects.all())
+            if not filterset.is_valid():
+                return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            approx = request.query_params.get('approx', 'false').lower() == 'true'
+            analytics = SampledAnalytics() if approx else get_analytics_engine()
+            metrics = analytics.summary_metrics(filterset)
             canceled_orders_percentage = (
-                Order.objects.filter(delivery__delivery_status='Cancelled').count() /
-                float(Order.objects.count()) * 100
+                metrics['canceled_orders'] / float(metrics['total_orders']) * 100
+                if metrics['total_orders'] else 0.0
             )
 
             response = {
-                'total_revenue': total_revenue,
-                'total_orders': total_orders,
-                'total_products_sold': total_products_sold['total_sold'],
+                'total_revenue': {'total_sale_value__sum': metrics['total_revenue']},
+                'total_orders': metrics['total_orders'],
+                'total_products_sold': metrics['total_products_sold'],
                 'canceled_order_percentage': canceled_orders_percentage
             }
+            if approx:
+                response['sample_fraction'] = metrics['sample_fraction']
+                response['error_bounds'] = metrics['error_bounds']
         except Exception as e:
             error_message = f"Error fetching summary metrics: {str(e)}"
             logger.error(error_message)
@@ -207,3 +331,27 @@ class SummaryMetricsAPI(APIView):
                 "error": error_message
             }
         return Response(response)
+
+
+class QueryMetricsAPI(APIView):
+    """
+    API endpoint returning p50/p95/p99 of the request duration, query count, database
+    time, slowest query, serializer time and response size per view, as recorded by
+    the query profiling middleware in this process. DELETE resets them.
+    """
+    def disabled_response(self):
+        return Response(
+            {"error": "Query profiling is disabled, set QUERY_PROFILING to enable it."},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    def get(self, request):
+        if not settings.QUERY_PROFILING:
+            return self.disabled_response()
+        return Response(profile_store.summary())
+
+    def delete(self, request):
+        if not settings.QUERY_PROFILING:
+            return self.disabled_response()
+        profile_store.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)